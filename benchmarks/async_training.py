@@ -0,0 +1,134 @@
+__author__ = 'zhenyang'
+
+'''
+Synchronous data parallel vs asynchronous parameter server training ("parallel_mode" optimizer hyper parameter).
+
+The synthetic LSTM classifier (see synthetic.py) is trained for the same number of updates with one process,
+with synchronous all-reduce over N workers and with the asynchronous parameter server over N workers, each
+configuration in its own process. In both parallel modes an update consumes one minibatch: split across the
+workers when synchronous, computed by a single worker when asynchronous. Every `--eval_freq` updates the
+validation cost and accuracy of the current (server) parameters are recorded, so the script reports updates/s,
+examples/s, the final validation metrics and the staleness statistics, and writes the convergence curves
+(update, training seconds, validation cost, validation accuracy) to `--curves` as json.
+
+    python async_training.py [--workers 4] [--max_staleness 8] [--updates 300] [--curves curves.json]
+'''
+
+import os
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+
+def validation_metrics(probability, data):
+    from synthetic import sequence_accuracy
+    labels = numpy.tile(data[3][None, :], (data[1].shape[0], 1))
+    picked = probability[numpy.arange(labels.shape[0])[:, None], numpy.arange(labels.shape[1])[None, :], labels]
+    cost = float(-(numpy.log(numpy.maximum(picked, 1e-8)) * data[1]).sum() / data[1].sum())
+    return cost, sequence_accuracy(probability, data)
+
+
+def run(args):
+    from sparnn.optimizers import RMSProp
+    from synthetic import synthetic_splits, build_lstm_model, probability_function
+
+    train, valid = synthetic_splits(args.feature_dim, args.classes, args.steps,
+                                    args.minibatch_size * 16, args.minibatch_size * 4)
+    model = build_lstm_model(args.feature_dim, args.hidden, args.classes, args.steps,
+                             "Synthetic-LSTM-" + args.mode)
+
+    num_workers = 1 if args.mode == 'single' else args.workers
+    param = {'id': args.mode, 'learning_rate': 0.001, 'decay_rate': 0.9, 'clip_threshold': None,
+             'verbose': False, 'max_epoch': 1, 'save_path': '/tmp',
+             'num_workers': num_workers, 'parallel_mode': 'async' if args.mode == 'async' else 'sync',
+             'max_staleness': args.max_staleness}
+    optimizer = RMSProp(model, None, None, None, param)
+    probability_func = probability_function(model)
+    if num_workers > 1:
+        # fork the workers before the timed updates
+        optimizer.update_func.start()
+
+    num_train = train[0].shape[1]
+    curve = []
+    training_time = 0.
+    for uidx in xrange(args.updates):
+        start = time.time()
+        begin = (uidx * args.minibatch_size) % num_train
+        batch = slice(begin, begin + args.minibatch_size)
+        optimizer.update_func(train[0][:, batch], train[1][:, batch], train[2][:, batch],
+                              *optimizer.learning_param())
+        training_time += time.time() - start
+        if (uidx + 1) % args.eval_freq == 0:
+            cost, accuracy = validation_metrics(probability_func(*valid[:3]), valid)
+            curve.append([uidx + 1, training_time, cost, accuracy])
+
+    result = {"mode": args.mode, "num_workers": num_workers,
+              "updates_per_second": args.updates / training_time,
+              "examples_per_second": args.updates * args.minibatch_size / training_time,
+              "valid_cost": curve[-1][2], "valid_accuracy": curve[-1][3],
+              "mean_staleness": 0., "dropped": 0, "curve": curve}
+    if args.mode == 'async':
+        optimizer.update_func.drain()
+        result["mean_staleness"] = optimizer.update_func.mean_staleness()
+        result["dropped"] = optimizer.update_func.num_dropped
+    if num_workers > 1:
+        optimizer.update_func.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="synchronous vs asynchronous parameter server training")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max_staleness', type=int, default=None)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--feature_dim', type=int, default=128)
+    parser.add_argument('--hidden', type=int, default=256)
+    parser.add_argument('--classes', type=int, default=10)
+    parser.add_argument('--minibatch_size', type=int, default=32)
+    parser.add_argument('--updates', type=int, default=300)
+    parser.add_argument('--eval_freq', type=int, default=20)
+    parser.add_argument('--curves', default=None, help="json file for the convergence curves")
+    parser.add_argument('--mode', default=None, choices=['single', 'sync', 'async'],
+                        help="run a single configuration and print its result as json")
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        print json.dumps(run(args))
+        return
+
+    results = []
+    for mode in ('single', 'sync', 'async'):
+        command = [sys.executable, os.path.abspath(__file__), '--mode', mode, '--workers', str(args.workers),
+                   '--steps', str(args.steps), '--feature_dim', str(args.feature_dim),
+                   '--hidden', str(args.hidden), '--classes', str(args.classes),
+                   '--minibatch_size', str(args.minibatch_size), '--updates', str(args.updates),
+                   '--eval_freq', str(args.eval_freq)]
+        if args.max_staleness is not None:
+            command += ['--max_staleness', str(args.max_staleness)]
+        results.append(json.loads(subprocess.check_output(command).strip().splitlines()[-1]))
+
+    print "%-8s %8s %12s %14s %12s %12s %10s %8s" % ("mode", "workers", "updates/s", "examples/s", "valid cost",
+                                                   "accuracy", "staleness", "dropped")
+    for r in results:
+        print "%-8s %8d %12.2f %14.1f %12.4f %12.4f %10.2f %8d" % (r["mode"], r["num_workers"],
+                                                                 r["updates_per_second"], r["examples_per_second"],
+                                                                 r["valid_cost"], r["valid_accuracy"],
+                                                                 r["mean_staleness"], r["dropped"])
+    if args.curves is not None:
+        with open(args.curves, 'w') as f:
+            json.dump(dict((r["mode"], r["curve"]) for r in results), f, indent=1)
+        print "Convergence curves (update, seconds, valid cost, valid accuracy) saved to " + args.curves
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+__author__ = 'zhenyang'
+
+'''
+Scaling benchmark of the synchronous data parallel training ("num_workers" optimizer hyper parameter).
+
+The synthetic LSTM classifier (see synthetic.py) is trained with a fixed global minibatch for every number of
+workers, each configuration in its own process. The script reports updates/s, examples/s, the speedup over
+one worker and the scaling efficiency (speedup / workers), and checks that the final cost matches the single
+process run since the update is the same. Every worker is limited to one BLAS/OpenMP thread so that the
+comparison measures the process level parallelism.
+
+    python data_parallel_scaling.py [--workers 1,2,4,8] [--minibatch_size 64] [--updates 50]
+'''
+
+import os
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+
+def run(args):
+    from sparnn.optimizers import RMSProp
+    from synthetic import synthetic_splits, build_lstm_model
+
+    train, valid = synthetic_splits(args.feature_dim, args.classes, args.steps, args.minibatch_size * 8, 0)
+    model = build_lstm_model(args.feature_dim, args.hidden, args.classes, args.steps,
+                             "Synthetic-LSTM-" + str(args.num_workers) + "-Workers")
+
+    param = {'id': str(args.num_workers) + "-workers", 'learning_rate': 0.001, 'decay_rate': 0.9,
+             'clip_threshold': None, 'verbose': False, 'max_epoch': 1, 'save_path': '/tmp',
+             'num_workers': args.num_workers}
+    optimizer = RMSProp(model, None, None, None, param)
+
+    num_train = train[0].shape[1]
+    costs = []
+    for uidx in xrange(args.warmup + args.updates):
+        if uidx == args.warmup:
+            start = time.time()
+        begin = (uidx * args.minibatch_size) % num_train
+        batch = slice(begin, begin + args.minibatch_size)
+        costs.append(float(optimizer.update_func(train[0][:, batch], train[1][:, batch], train[2][:, batch],
+                                                 *optimizer.learning_param())))
+    duration = time.time() - start
+    if args.num_workers > 1:
+        optimizer.update_func.close()
+
+    return {"num_workers": args.num_workers,
+            "updates_per_second": args.updates / duration,
+            "examples_per_second": args.updates * args.minibatch_size / duration,
+            "final_cost": float(numpy.mean(costs[-10:]))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="data parallel training throughput for 1..N worker processes")
+    parser.add_argument('--workers', default="1,2,4,8")
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--feature_dim', type=int, default=256)
+    parser.add_argument('--hidden', type=int, default=256)
+    parser.add_argument('--classes', type=int, default=10)
+    parser.add_argument('--minibatch_size', type=int, default=64)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--updates', type=int, default=50)
+    parser.add_argument('--num_workers', type=int, default=None,
+                        help="run a single configuration and print its result as json")
+    args = parser.parse_args()
+
+    if args.num_workers is not None:
+        print json.dumps(run(args))
+        return
+
+    results = []
+    for num_workers in [int(n) for n in args.workers.split(',')]:
+        command = [sys.executable, os.path.abspath(__file__), '--num_workers', str(num_workers),
+                   '--steps', str(args.steps), '--feature_dim', str(args.feature_dim),
+                   '--hidden', str(args.hidden), '--classes', str(args.classes),
+                   '--minibatch_size', str(args.minibatch_size), '--warmup', str(args.warmup),
+                   '--updates', str(args.updates)]
+        results.append(json.loads(subprocess.check_output(command).strip().splitlines()[-1]))
+
+    base = results[0]
+    print "%-8s %12s %14s %10s %12s %12s" % ("workers", "updates/s", "examples/s", "speedup", "efficiency",
+                                             "final cost")
+    for r in results:
+        speedup = r["updates_per_second"] / base["updates_per_second"] * base["num_workers"]
+        print "%-8d %12.2f %14.1f %10.2f %12.2f %12.4f" % (r["num_workers"], r["updates_per_second"],
+                                                          r["examples_per_second"], speedup,
+                                                          speedup / r["num_workers"], r["final_cost"])
+    print "Max final cost deviation from %d worker(s): %.2e" % (
+        base["num_workers"], max(abs(r["final_cost"] - base["final_cost"]) for r in results))
+
+
+if __name__ == '__main__':
+    main()
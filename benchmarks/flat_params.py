@@ -0,0 +1,77 @@
+__author__ = 'zhenyang'
+
+'''
+Flat parameter buffer ("flat_params" hyper parameter) against the per tensor update of the optimizers
+
+For every optimizer the synthetic LSTM classifier (see synthetic.py) is trained for `--updates` steps from the
+same initialization on the same minibatches, once with the update rule applied to every parameter tensor and once
+to the flat parameter vector. The script reports the median step time of both and the largest difference between
+the parameters they end with, which should stay at float rounding level. The gain grows with the number of
+parameter tensors and shrinks with their size, small hidden sizes show it best.
+
+    python flat_params.py [--hidden 64] [--updates 100] [--optimizers RMSProp,Adam,AdaDelta,SGD]
+'''
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+OPTIMIZER_PARAM = {'SGD': {'learning_rate': 0.01, 'momentum': 0.9},
+                   'RMSProp': {'learning_rate': 0.001, 'decay_rate': 0.9},
+                   'Adam': {'learning_rate': 0.001, 'beta1': 0.9, 'beta2': 0.999},
+                   'AdaDelta': {'decay_rate': 0.95},
+                   'AdaGrad': {'learning_rate': 0.01}}
+
+
+def run(name, flat, train, args):
+    import sparnn.optimizers
+    from synthetic import build_lstm_model
+
+    model = build_lstm_model(args.feature_dim, args.hidden, args.classes, args.steps,
+                             "Synthetic-LSTM-" + name + ("-flat" if flat else ""))
+    param = {'id': name + ("-flat" if flat else ""), 'clip_threshold': 100., 'verbose': False, 'max_epoch': 1,
+             'save_path': '/tmp', 'flat_params': flat}
+    param.update(OPTIMIZER_PARAM[name])
+    optimizer = getattr(sparnn.optimizers, name)(model, None, None, None, param)
+
+    num_train = train[0].shape[1]
+    times = []
+    for uidx in xrange(args.updates):
+        begin = (uidx * args.minibatch_size) % num_train
+        batch = [d[:, begin:begin + args.minibatch_size] for d in train[:3]]
+        start = time.time()
+        optimizer.update(batch)
+        times.append(time.time() - start)
+    return float(numpy.median(times[1:])), [p.get_value() for p in model.param], len(model.param)
+
+
+def main():
+    from synthetic import synthetic_splits
+    parser = argparse.ArgumentParser(description="flat parameter buffer against per tensor optimizer updates")
+    parser.add_argument('--optimizers', default='RMSProp,Adam,AdaDelta,SGD')
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--feature_dim', type=int, default=32)
+    parser.add_argument('--hidden', type=int, default=64)
+    parser.add_argument('--classes', type=int, default=10)
+    parser.add_argument('--minibatch_size', type=int, default=16)
+    parser.add_argument('--updates', type=int, default=100)
+    args = parser.parse_args()
+
+    train, valid = synthetic_splits(args.feature_dim, args.classes, args.steps, args.minibatch_size * 8, 1)
+    print "%-10s %8s %16s %16s %10s %16s" % ("optimizer", "tensors", "per tensor (ms)", "flat (ms)", "speedup",
+                                             "max param diff")
+    for name in args.optimizers.split(','):
+        tensor_time, tensor_params, num_tensors = run(name, False, train, args)
+        flat_time, flat_params, _ = run(name, True, train, args)
+        diff = max(float(numpy.abs(a - b).max()) for a, b in zip(tensor_params, flat_params))
+        print "%-10s %8d %16.3f %16.3f %9.2fx %16.3g" % (name, num_tensors, 1000. * tensor_time, 1000. * flat_time,
+                                                        tensor_time / flat_time, diff)
+
+
+if __name__ == '__main__':
+    main()
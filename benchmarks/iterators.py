@@ -0,0 +1,201 @@
+__author__ = 'zhenyang'
+
+'''
+Throughput of the data iterators on generated data
+
+Every iterator class of sparnn.iterators is benchmarked on the synthetic datasets of synthetic_video.py, over the
+sweep of minibatch size, seq_length, seq_fps and num_segments (each iterator only sweeps the parameters it takes).
+A configuration runs in its own process: the iterator is built (load_s), begin() is called and `--batches`
+get_batch()/next() calls are timed (input_batch() + output_batch() for the DataIterator family), wrapping around
+with begin() at the end of an epoch. The report holds batches/sec, MB/sec of the returned arrays and the peak RSS.
+
+VideoIterator and VideoTsIterator reshape their frames to (49, 1024), which is why the video features default to
+1024x7x7; with other feature shapes the two are skipped.
+
+    python iterators.py [--iterators VideoDataIterator,NumpyIterator] [--minibatch_sizes 16,64]
+                        [--seq_lengths 10,30] [--seq_fps 30,10] [--num_segments 1,5] [--json results.json]
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import itertools
+import argparse
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+# iterator class: (data layout, swept parameters)
+ITERATORS = [('VideoIterator', 'concatenated', ['minibatch_size', 'seq_length', 'seq_fps']),
+             ('VideoTsIterator', 'concatenated', ['minibatch_size', 'seq_length', 'seq_fps']),
+             ('VideoDataIterator', 'videos', ['minibatch_size', 'seq_length', 'seq_fps', 'num_segments']),
+             ('VideoDataTsIterator', 'videos', ['minibatch_size', 'seq_length', 'seq_fps', 'num_segments']),
+             ('AdvancedVideoIterator', 'videos', ['minibatch_size', 'seq_length', 'seq_fps']),
+             ('AdvancedVideoTsIterator', 'videos', ['minibatch_size', 'seq_length', 'seq_fps']),
+             ('DataIterator', 'clips', ['minibatch_size', 'seq_length']),
+             ('NumpyIterator', 'clips', ['minibatch_size', 'seq_length']),
+             ('PklIterator', 'clips', ['minibatch_size', 'seq_length'])]
+
+
+def parse_list(s):
+    return [int(v) for v in s.split(',')]
+
+
+def clips_path(root, seq_length, extension):
+    return os.path.join(root, "clips-%d%s" % (seq_length, extension))
+
+
+def build_iterator(name, config, root, args):
+    import sparnn.utils
+    import sparnn.iterators
+    from synthetic_video import parse_shape, write_synthetic_clips
+    common = {'name': 'benchmark-' + name, 'minibatch_size': config['minibatch_size'],
+              'input_data_type': 'float32'}
+    if name in ('DataIterator', 'NumpyIterator', 'PklIterator'):
+        extension = '.pkl' if name == 'PklIterator' else '.npz'
+        path = clips_path(root, config['seq_length'], extension)
+        if not os.path.exists(path):
+            write_synthetic_clips(path, args.clips, config['seq_length'], parse_shape(args.frame_shape))
+        common.update({'path': path, 'use_input_mask': True, 'use_output_mask': True,
+                       'output_data_type': 'float32', 'is_output_sequence': True})
+        iterator = getattr(sparnn.iterators, name)(common)
+        if name == 'DataIterator':
+            # the base class loads nothing, it iterates the arrays it is given
+            data = numpy.load(path)
+            for key in data.keys():
+                iterator.data[key] = data[key]
+            iterator.check_data()
+        return iterator
+
+    split = 'train'
+    common.update({'dataset': 'synthetic', 'dataset_name': 'features',
+                   'num_frames_file': os.path.join(root, split + '_framenum.txt'),
+                   'labels_file': os.path.join(root, split + '_labels.txt'),
+                   'vid_name_file': os.path.join(root, split + '_filenames.txt'),
+                   'use_mask': True, 'output_data_type': 'int64', 'one_hot_label': True,
+                   'is_output_multilabel': False, 'rng': sparnn.utils.quick_npy_rng(1337),
+                   'seq_length': config['seq_length'], 'seq_fps': config['seq_fps']})
+    if name in ('VideoIterator', 'VideoTsIterator'):
+        common.update({'data_file': os.path.join(root, split + '_features.h5'),
+                       'context_file': os.path.join(root, split + '_context.h5'), 'seq_stride': 1})
+    else:
+        common.update({'data_file': os.path.join(root, 'features'), 'context_file': os.path.join(root, 'context'),
+                       'reshape': len(parse_shape(args.feature_shape)) == 3})
+        if name in ('VideoDataIterator', 'VideoDataTsIterator'):
+            common.update({'num_segments': config['num_segments'], 'train_sampling': True,
+                           'frame_rng': sparnn.utils.quick_npy_rng(1234)})
+        else:
+            common['seq_stride'] = config['seq_length']
+    return getattr(sparnn.iterators, name)(common)
+
+
+def run_config(name, config, root, args):
+    start = time.time()
+    iterator = build_iterator(name, config, root, args)
+    load_time = time.time() - start
+    data_family = not hasattr(iterator, 'get_batch')
+
+    num_bytes = 0
+    start = time.time()
+    iterator.begin(do_shuffle=True)
+    for i in xrange(args.batches):
+        batch = iterator.input_batch() + iterator.output_batch() if data_family else iterator.get_batch()
+        num_bytes += sum(b.nbytes for b in batch if b is not None)
+        iterator.next()
+        if iterator.no_batch_left():
+            iterator.begin(do_shuffle=True)
+    duration = time.time() - start
+
+    result = dict(config)
+    result.update({"iterator": name, "batches": args.batches, "load_s": load_time,
+                   "batches_per_sec": args.batches / duration, "mb_per_sec": num_bytes / 1024. / 1024. / duration,
+                   "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.})
+    return result
+
+
+def configurations(swept, args):
+    values = {'minibatch_size': args.minibatch_sizes, 'seq_length': args.seq_lengths, 'seq_fps': args.seq_fps,
+              'num_segments': args.num_segments}
+    for combination in itertools.product(*[values[key] for key in swept]):
+        yield dict(zip(swept, combination))
+
+
+def main():
+    from synthetic_video import parse_shape, write_synthetic_videos
+    parser = argparse.ArgumentParser(description="throughput of the sparnn data iterators on generated data")
+    parser.add_argument('--data', default=None, help="dataset directory, generated if it holds no train split")
+    parser.add_argument('--iterators', default=None, help="comma separated iterator classes, all by default")
+    parser.add_argument('--minibatch_sizes', type=parse_list, default=[16, 64])
+    parser.add_argument('--seq_lengths', type=parse_list, default=[10, 30])
+    parser.add_argument('--seq_fps', type=parse_list, default=[30, 10])
+    parser.add_argument('--num_segments', type=parse_list, default=[1, 5])
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--videos', type=int, default=32)
+    parser.add_argument('--min_frames', type=int, default=20)
+    parser.add_argument('--max_frames', type=int, default=90)
+    parser.add_argument('--feature_shape', default='1024x7x7')
+    parser.add_argument('--context_shape', default='1024')
+    parser.add_argument('--clips', type=int, default=256, help="number of clips of the DataIterator family")
+    parser.add_argument('--frame_shape', default='1x64x64', help="frame shape of the DataIterator family")
+    parser.add_argument('--json', default=None, help="json file the results are written to")
+    parser.add_argument('--config', default=None, help="run a single configuration (json) and print its result")
+    args = parser.parse_args()
+
+    if args.config is not None:
+        config = json.loads(args.config)
+        name = config.pop('iterator')
+        print json.dumps(run_config(name, config, args.data, args))
+        return
+
+    root = args.data if args.data is not None else tempfile.mkdtemp(prefix="synthetic-videos-")
+    selected = args.iterators.split(',') if args.iterators is not None else [i[0] for i in ITERATORS]
+    results = []
+    try:
+        if not os.path.exists(os.path.join(root, 'train_framenum.txt')):
+            start = time.time()
+            write_synthetic_videos(root, 'train', args.videos, parse_shape(args.feature_shape), 101,
+                                   args.min_frames, args.max_frames, context_shape=parse_shape(args.context_shape),
+                                   concatenated=True)
+            print "Generated %d videos in %s (%.1fs)" % (args.videos, root, time.time() - start)
+
+        print "%-24s %-40s %8s %12s %10s %10s" % ("iterator", "configuration", "load(s)", "batches/s", "MB/s",
+                                                  "peak(MB)")
+        for name, layout, swept in ITERATORS:
+            if name not in selected:
+                continue
+            if layout == 'concatenated' and numpy.prod(parse_shape(args.feature_shape)) != 49 * 1024:
+                print "%-24s skipped, it reshapes the frames to (49, 1024)" % name
+                continue
+            for config in configurations(swept, args):
+                config['iterator'] = name
+                command = [sys.executable, os.path.abspath(__file__), '--data', root, '--config', json.dumps(config),
+                           '--batches', str(args.batches), '--feature_shape', args.feature_shape,
+                           '--clips', str(args.clips), '--frame_shape', args.frame_shape]
+                try:
+                    output = subprocess.check_output(command)
+                except subprocess.CalledProcessError as e:
+                    print "%-24s %-40s FAILED (exit status %d)" % (name, "", e.returncode)
+                    continue
+                r = json.loads(output.strip().splitlines()[-1])
+                results.append(r)
+                description = " ".join("%s=%d" % (key, r[key]) for key in swept)
+                print "%-24s %-40s %8.2f %12.2f %10.1f %10.1f" % (name, description, r["load_s"],
+                                                                   r["batches_per_sec"], r["mb_per_sec"],
+                                                                   r["peak_rss_mb"])
+    finally:
+        if args.data is None:
+            shutil.rmtree(root)
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
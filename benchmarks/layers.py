@@ -0,0 +1,316 @@
+__author__ = 'zhenyang'
+
+'''
+Benchmark suite of the layers in sparnn.layers.basic
+
+Every case builds one layer on random inputs of a parameterized shape and measures the compile time of its
+forward function and of its forward+backward function (gradients of output.sum() with respect to the parameters
+and the inputs), the median forward and forward+backward times, and the peak resident memory. Each case runs in
+its own process, so that the peak memory belongs to the case (note that theano's compiledir still caches the
+generated C code between runs, the compile times are the ones of a warm cache after the first run).
+
+Besides the default configuration of every layer, the recurrent layers have variant cases named
+<layer>+active_rows (the "active_rows" mask_mode, on minibatches sorted by decreasing length as the video
+iterators provide them) and <layer>+checkpoint (gradient checkpointing, "checkpoint_every" of about
+sqrt(steps)).
+
+The results are written to a json baseline, and a later run can be compared against it:
+
+    python layers.py --preset small --output baseline.json
+    python layers.py --preset small --compare baseline.json [--tolerance 0.2] [--output new.json]
+    python layers.py --cases LSTMLayer,LSTMLayer+active_rows --shape steps=16 --shape batch=4
+
+The comparison prints the ratio of every metric to the baseline and exits with status 1 when a time or memory
+metric regressed by more than the tolerance.
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import importlib
+import resource
+import argparse
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+PRESETS = {
+    # CPU friendly shapes
+    'small': {'steps': 8, 'batch': 8, 'feature': 64, 'hidden': 64, 'channels': 16, 'rows': 7, 'cols': 7,
+              'regions': 49, 'context': 64, 'dense_out': 128},
+    # the shapes of the UCF101 models (evaluate_ucf101_*), with a smaller minibatch
+    'ucf101': {'steps': 30, 'batch': 8, 'feature': 512, 'hidden': 512, 'channels': 512, 'rows': 7, 'cols': 7,
+               'regions': 49, 'context': 512, 'dense_out': 1024},
+}
+
+METRICS = ['compile_forward_s', 'compile_backward_s', 'forward_s', 'forward_backward_s', 'peak_rss_mb']
+
+
+def tensor(name, ndim):
+    import theano
+    import theano.tensor as TT
+    return TT.TensorType(theano.config.floatX, (False,) * ndim)(name)
+
+
+def sequence_mask(rng, steps, batch):
+    # sorted by decreasing length like the minibatches of the video iterators, as the active_rows mask mode needs
+    lengths = numpy.sort(rng.randint(steps // 2, steps + 1, size=batch))[::-1]
+    return (numpy.arange(steps)[:, None] < lengths[None, :]).astype('float32')
+
+
+def build_case(name, s, rng):
+    """
+    Returns the layer class name, its layer_param and the [(symbol, value)] inputs of the case
+    """
+    class_name, _, variant = name.partition('+')
+    class_name, param, inputs = build_layer_case(class_name, s, rng)
+    if variant == 'active_rows':
+        param["mask_mode"] = "active_rows"
+    elif variant == 'checkpoint':
+        param["checkpoint_every"] = max(int(round(numpy.sqrt(s['steps']))), 1)
+    elif variant != '':
+        raise KeyError("Unknown variant " + variant + " of case " + class_name)
+    return class_name, param, inputs
+
+
+def build_layer_case(name, s, rng):
+    from sparnn.utils import quick_theano_zero
+    T, B = s['steps'], s['batch']
+    D, H, C, R, W = s['feature'], s['hidden'], s['channels'], s['rows'], s['cols']
+    N, X = s['regions'], s['context']
+    value = lambda *shape: rng.normal(size=shape).astype('float32')
+    mask = tensor('mask', 2)
+    mask_value = sequence_mask(rng, T, B)
+
+    if name in ('DenseLayer', 'FeedForwardLayer'):
+        x = tensor('x', 3)
+        param = {"dim_in": (D,), "dim_out": (s['dense_out'],), "activation": "tanh", "input": x}
+        return name, param, [(x, value(T, B, D))]
+    if name == 'ConvLayer':
+        x = tensor('x', 4)
+        param = {"dim_in": (C, R, W), "dim_out": (C, R, W), "receptive_field": (3, 3), "activation": "tanh",
+                 "input": x}
+        return name, param, [(x, value(B, C, R, W))]
+    if name == 'ConvForwardLayer':
+        x = tensor('x', 5)
+        param = {"dim_in": (C, R, W), "dim_out": (C, R, W), "input_receptive_field": (3, 3),
+                 "input_stride": (1, 1), "conv_type": "same", "activation": "tanh", "input": x}
+        return name, param, [(x, value(T, B, C, R, W))]
+    if name == 'DropoutLayer':
+        x = tensor('x', 3)
+        param = {"dim_in": (D,), "dim_out": (D,), "dropout_rate": 0.5, "input": x}
+        return name, param, [(x, value(T, B, D))]
+    if name in ('PoolingLayer', 'AggregatePoolingLayer'):
+        x = tensor('x', 5)
+        param = {"dim_in": (C, R, W), "dim_out": (C,) if name == 'PoolingLayer' else (C, R, W),
+                 "pooling_func": "mean", "input": x}
+        if name == 'AggregatePoolingLayer':
+            param["mask"] = mask
+            return name, param, [(x, value(T, B, C, R, W)), (mask, mask_value)]
+        return name, param, [(x, value(T, B, C, R, W))]
+    if name == 'LSTMLayer':
+        x = tensor('x', 3)
+        param = {"dim_in": (D,), "dim_out": (H,), "input": x, "mask": mask, "n_steps": T}
+        return name, param, [(x, value(T, B, D)), (mask, mask_value)]
+    if name in ('ConvLSTMLayer', 'ConvRNNLayer'):
+        x = tensor('x', 5)
+        param = {"dim_in": (C, R, W), "dim_out": (C, R, W), "input_receptive_field": (3, 3),
+                 "transition_receptive_field": (3, 3), "input": x, "mask": mask, "n_steps": T}
+        if name == 'ConvRNNLayer':
+            param["activation"] = "tanh"
+        return name, param, [(x, value(T, B, C, R, W)), (mask, mask_value)]
+
+    # attention layers: initial states as in the UCF101 models (zeros here)
+    if name in ('CondLSTMLayer', 'DeepCondLSTMLayer', 'DeepCondLSTMDecpLayer'):
+        x = tensor('x', 4)
+        minibatch_size = x.shape[1]
+        param = {"dim_in": (D, N), "dim_out": (H,), "input": x, "mask": mask, "n_steps": T,
+                 "init_hidden_state": quick_theano_zero((minibatch_size, H)),
+                 "init_cell_state": quick_theano_zero((minibatch_size, H))}
+        inputs = [(x, value(T, B, D, N)), (mask, mask_value)]
+        if name != 'CondLSTMLayer':
+            ctx = tensor('ctx', 3)
+            param.update({"ctx_dim_in": (X,), "ctx_dim_out": (H,), "context": ctx})
+            if name == 'DeepCondLSTMLayer':
+                param.update({"init_context_hidden_state": quick_theano_zero((minibatch_size, H)),
+                              "init_context_cell_state": quick_theano_zero((minibatch_size, H))})
+            inputs.append((ctx, value(T, B, X)))
+        return name, param, inputs
+    if name in ('CondConvLSTMLayer', 'CondConvLSTMSigLayer', 'DeepCondConvLSTMLayer', 'DeepCondConvLSTMDecpLayer'):
+        x = tensor('x', 5)
+        minibatch_size = x.shape[1]
+        state = (minibatch_size, C, R, W)
+        param = {"dim_in": (C, R, W), "dim_out": (C, R, W), "input_receptive_field": (3, 3),
+                 "transition_receptive_field": (3, 3), "input": x, "mask": mask, "n_steps": T,
+                 "init_hidden_state": quick_theano_zero(state), "init_cell_state": quick_theano_zero(state)}
+        inputs = [(x, value(T, B, C, R, W)), (mask, mask_value)]
+        if not name.startswith('CondConvLSTM'):
+            ctx = tensor('ctx', 5)
+            param.update({"ctx_dim_in": (X, R, W), "ctx_dim_out": (C, R, W), "context": ctx,
+                          "context_input_receptive_field": (1, 1), "context_transition_receptive_field": (1, 1),
+                          "init_context_hidden_state": quick_theano_zero(state),
+                          "init_context_cell_state": quick_theano_zero(state)})
+            inputs.append((ctx, value(T, B, X, R, W)))
+        return name, param, inputs
+    raise KeyError("Unknown case " + name)
+
+
+LAYER_CASES = ['DenseLayer', 'FeedForwardLayer', 'ConvLayer', 'ConvForwardLayer', 'DropoutLayer', 'PoolingLayer',
+               'AggregatePoolingLayer', 'LSTMLayer', 'ConvLSTMLayer', 'ConvRNNLayer', 'CondLSTMLayer',
+               'CondConvLSTMLayer', 'CondConvLSTMSigLayer', 'DeepCondLSTMLayer', 'DeepCondLSTMDecpLayer',
+               'DeepCondConvLSTMLayer', 'DeepCondConvLSTMDecpLayer']
+# the layers with a mask_mode parameter, and the ones with checkpoint_every
+ACTIVE_ROWS_CASES = ['LSTMLayer', 'ConvLSTMLayer', 'CondConvLSTMLayer', 'DeepCondConvLSTMLayer']
+CHECKPOINT_CASES = ['LSTMLayer', 'ConvLSTMLayer', 'CondLSTMLayer', 'CondConvLSTMLayer', 'CondConvLSTMSigLayer',
+                    'DeepCondLSTMLayer', 'DeepCondLSTMDecpLayer', 'DeepCondConvLSTMLayer', 'DeepCondConvLSTMDecpLayer']
+CASES = LAYER_CASES + [name + '+active_rows' for name in ACTIVE_ROWS_CASES] + \
+    [name + '+checkpoint' for name in CHECKPOINT_CASES]
+# layers that sparnn.layers does not export
+LAYER_MODULES = {'CondConvLSTMSigLayer': 'sparnn.layers.basic.cond_conv_lstm_sig_layer'}
+
+
+def current_rss_mb():
+    f = open('/proc/self/statm')
+    rss_pages = int(f.read().split()[1])
+    f.close()
+    return rss_pages * resource.getpagesize() / 1024. / 1024.
+
+
+def median_time(func, values, repeats):
+    func(*values)
+    times = []
+    for i in xrange(repeats):
+        start = time.time()
+        func(*values)
+        times.append(time.time() - start)
+    return float(numpy.median(times))
+
+
+def run_case(name, shapes, repeats):
+    import theano
+    import theano.tensor as TT
+    import sparnn.layers
+    import sparnn.utils
+
+    rng = numpy.random.RandomState(1000)
+    npy_rng = sparnn.utils.quick_npy_rng(1337)
+    class_name, param, inputs = build_case(name, shapes, rng)
+    symbols = [symbol for symbol, _ in inputs]
+    values = [v for _, v in inputs]
+    # the minibatch is the second axis of the inputs but for ConvLayer, which takes a single frame
+    param.update({"id": 0, "rng": npy_rng, "theano_rng": sparnn.utils.quick_theano_rng(npy_rng),
+                  "minibatch_size": symbols[0].shape[0 if class_name == 'ConvLayer' else 1]})
+    if class_name in LAYER_MODULES:
+        layer_class = getattr(importlib.import_module(LAYER_MODULES[class_name]), class_name)
+    else:
+        layer_class = getattr(sparnn.layers, class_name)
+    layer = layer_class(param)
+    rss_before = current_rss_mb()
+
+    start = time.time()
+    forward_func = theano.function(symbols, layer.output, on_unused_input='ignore')
+    compile_forward = time.time() - start
+
+    cost = TT.cast(layer.output, theano.config.floatX).sum()
+    grads = TT.grad(cost, layer.param + [symbol for symbol in symbols if symbol.name != 'mask'],
+                    disconnected_inputs='ignore')
+    start = time.time()
+    backward_func = theano.function(symbols, [cost] + grads, on_unused_input='ignore')
+    compile_backward = time.time() - start
+
+    return {"case": name, "layer": class_name,
+            "compile_forward_s": compile_forward, "compile_backward_s": compile_backward,
+            "forward_s": median_time(forward_func, values, repeats),
+            "forward_backward_s": median_time(backward_func, values, repeats),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.,
+            "graph_rss_mb": rss_before,
+            "num_params": int(sum(p.get_value(borrow=True).size for p in layer.param))}
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print "%-36s %s" % ("case", " ".join("%20s" % metric for metric in METRICS))
+    for name, r in sorted(results.items()):
+        if name not in baseline:
+            print "%-36s (not in baseline)" % name
+            continue
+        ratios = []
+        for metric in METRICS:
+            ratio = r[metric] / max(baseline[name][metric], 1e-9)
+            flag = "!" if ratio > 1. + tolerance else " "
+            if flag == "!":
+                regressions.append((name, metric, ratio))
+            ratios.append("%19.2fx%s" % (ratio, flag))
+        print "%-36s %s" % (name, "".join(ratios))
+    for name, metric, ratio in regressions:
+        print "REGRESSION %s %s: %.2fx baseline" % (name, metric, ratio)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compile/forward/backward time and memory of sparnn layers")
+    parser.add_argument('--preset', default='small', choices=sorted(PRESETS.keys()))
+    parser.add_argument('--shape', action='append', default=[], help="override a preset shape, e.g. steps=16")
+    parser.add_argument('--cases', default=None, help="comma separated cases, all by default")
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--output', default=None, help="json file the results are written to")
+    parser.add_argument('--compare', default=None, help="baseline json file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--list', action='store_true')
+    parser.add_argument('--case', default=None, help="run a single case and print its result as json")
+    args = parser.parse_args()
+
+    if args.list:
+        print "\n".join(CASES)
+        return
+    shapes = dict(PRESETS[args.preset])
+    for override in args.shape:
+        key, v = override.split('=')
+        assert key in shapes, "Unknown shape " + key
+        shapes[key] = int(v)
+
+    if args.case is not None:
+        print json.dumps(run_case(args.case, shapes, args.repeats))
+        return
+
+    import theano
+    results = {}
+    for name in (args.cases.split(',') if args.cases is not None else CASES):
+        command = [sys.executable, os.path.abspath(__file__), '--case', name, '--preset', args.preset,
+                   '--repeats', str(args.repeats)] + sum([['--shape', override] for override in args.shape], [])
+        try:
+            output = subprocess.check_output(command)
+        except subprocess.CalledProcessError as e:
+            print "%-36s FAILED (exit status %d)" % (name, e.returncode)
+            continue
+        results[name] = json.loads(output.strip().splitlines()[-1])
+        r = results[name]
+        print "%-36s compile %7.2fs / %7.2fs  forward %9.4fs  forward+backward %9.4fs  peak %8.1fMB" % (
+            name, r["compile_forward_s"], r["compile_backward_s"], r["forward_s"], r["forward_backward_s"],
+            r["peak_rss_mb"])
+
+    report = {"meta": {"preset": args.preset, "shapes": shapes, "repeats": args.repeats,
+                       "theano": theano.__version__, "floatX": theano.config.floatX,
+                       "device": theano.config.device, "host": platform.node(),
+                       "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+              "results": results}
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+        print "Results saved to " + args.output
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["shapes"] != shapes:
+            print "Warning: the baseline was measured with other shapes " + str(baseline["meta"]["shapes"])
+        if len(compare(results, baseline["results"], args.tolerance)) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
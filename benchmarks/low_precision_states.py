@@ -0,0 +1,111 @@
+__author__ = 'zhenyang'
+
+'''
+Benchmark for the low precision recurrent state storage ("state_dtype" layer parameter) together with the
+static loss scaling of the optimizers ("loss_scale" hyper parameter).
+
+A small LSTM classifier is trained on a synthetic sequence task (the label is decided by a fixed random
+projection of the time averaged input) once with float32 state storage and once with float16 state
+storage. Each configuration runs in its own process so that the peak resident memory can be compared,
+and the script reports the stored state size, the peak memory, the final cost and the accuracy drift.
+
+    python low_precision_states.py [--steps 30] [--hidden 512] [--updates 200]
+'''
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+
+
+def run(args):
+    from sparnn.optimizers import RMSProp
+    from synthetic import synthetic_splits, build_lstm_model, probability_function, sequence_accuracy
+
+    train, valid = synthetic_splits(args.feature_dim, args.classes, args.steps,
+                                    args.minibatch_size * 8, args.minibatch_size * 4)
+    model = build_lstm_model(args.feature_dim, args.hidden, args.classes, args.steps,
+                             "Synthetic-LSTM-" + args.state_dtype, state_dtype=args.state_dtype)
+
+    param = {'id': args.state_dtype, 'learning_rate': 0.001, 'decay_rate': 0.9, 'clip_threshold': None,
+             'verbose': False, 'max_epoch': 1, 'save_path': '/tmp'}
+    if args.loss_scale is not None:
+        param['loss_scale'] = args.loss_scale
+    optimizer = RMSProp(model, None, None, None, param)
+    probability_func = probability_function(model)
+
+    num_train = train[0].shape[1]
+    costs = []
+    start = time.time()
+    for uidx in xrange(args.updates):
+        begin = (uidx * args.minibatch_size) % num_train
+        batch = slice(begin, begin + args.minibatch_size)
+        costs.append(float(optimizer.update_func(train[0][:, batch], train[1][:, batch], train[2][:, batch],
+                                                 *optimizer.learning_param())))
+    duration = time.time() - start
+
+    accuracy = sequence_accuracy(probability_func(*valid[:3]), valid)
+
+    # one hidden and one cell state per step is what scan keeps for the backward pass
+    state_bytes = 2 * args.steps * args.minibatch_size * args.hidden * numpy.dtype(args.state_dtype).itemsize
+    return {"state_dtype": args.state_dtype,
+            "stored_state_mb": state_bytes / 1024. / 1024.,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.,
+            "final_cost": float(numpy.mean(costs[-10:])),
+            "has_numeric_error": bool(not numpy.all(numpy.isfinite(costs))),
+            "valid_accuracy": accuracy,
+            "seconds_per_update": duration / args.updates}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="float16 vs float32 recurrent state storage")
+    parser.add_argument('--steps', type=int, default=30)
+    parser.add_argument('--feature_dim', type=int, default=256)
+    parser.add_argument('--hidden', type=int, default=512)
+    parser.add_argument('--classes', type=int, default=10)
+    parser.add_argument('--minibatch_size', type=int, default=32)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--loss_scale', type=float, default=None,
+                        help="static loss scale of the float16 run (128 when comparing both configurations)")
+    parser.add_argument('--state_dtype', default=None,
+                        help="run a single configuration and print its result as json")
+    args = parser.parse_args()
+
+    if args.state_dtype is not None:
+        print json.dumps(run(args))
+        return
+
+    results = {}
+    fp16_loss_scale = args.loss_scale if args.loss_scale is not None else 128.
+    for state_dtype, loss_scale in (('float32', None), ('float16', fp16_loss_scale)):
+        command = [sys.executable, os.path.abspath(__file__), '--state_dtype', state_dtype,
+                   '--steps', str(args.steps), '--feature_dim', str(args.feature_dim),
+                   '--hidden', str(args.hidden), '--classes', str(args.classes),
+                   '--minibatch_size', str(args.minibatch_size), '--updates', str(args.updates)]
+        if loss_scale is not None:
+            command += ['--loss_scale', str(loss_scale)]
+        results[state_dtype] = json.loads(subprocess.check_output(command).strip().splitlines()[-1])
+
+    print "%-10s %16s %14s %12s %12s %14s" % ("states", "stored state MB", "peak RSS MB", "final cost",
+                                             "accuracy", "s / update")
+    for state_dtype in ('float32', 'float16'):
+        r = results[state_dtype]
+        print "%-10s %16.2f %14.1f %12.4f %12.4f %14.4f" % (state_dtype, r["stored_state_mb"], r["peak_rss_mb"],
+                                                          r["final_cost"], r["valid_accuracy"],
+                                                          r["seconds_per_update"])
+    print "Stored state reduction: %.2fx" % (results['float32']["stored_state_mb"] /
+                                             results['float16']["stored_state_mb"])
+    print "Peak memory reduction: %.2fx" % (results['float32']["peak_rss_mb"] / results['float16']["peak_rss_mb"])
+    print "Accuracy drift: %+.4f" % (results['float16']["valid_accuracy"] - results['float32']["valid_accuracy"])
+    print "Note: on CPU Theano may run float16 elementwise ops through slower generic implementations."
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+__author__ = 'zhenyang'
+
+'''
+Synthetic sequence classification task shared by the benchmarks
+
+The label of a sequence is decided by a fixed random projection of its time averaged input, the label is
+repeated at every step (output_ndim 2, int64) and the sequences have random lengths (masked).
+build_lstm_model returns a VideoModel made of an LSTMLayer, a softmax FeedForwardLayer and an
+ElementwiseCostLayer, the same interface as the UCF101 models, build_alstm_model the attention LSTM of the
+UCF101 experiments for the synthetic HDF5 videos of synthetic_video.py.
+'''
+
+import numpy
+
+
+def synthetic_sequences(rng, num, steps, feature_dim, num_classes, projection):
+    x = rng.normal(size=(steps, num, feature_dim)).astype('float32')
+    lengths = rng.randint(steps // 2, steps + 1, size=num)
+    mask = (numpy.arange(steps)[:, None] < lengths[None, :]).astype('float32')
+    x *= mask[:, :, None]
+    mean = x.sum(axis=0) / lengths[:, None]
+    labels = numpy.argmax(numpy.dot(mean, projection), axis=1)
+    y = numpy.tile(labels[None, :], (steps, 1)).astype('int64')
+    return x, mask, y, labels
+
+
+def synthetic_splits(feature_dim, classes, steps, num_train, num_valid, seed=1000):
+    data_rng = numpy.random.RandomState(seed)
+    projection = data_rng.normal(size=(feature_dim, classes)).astype('float32')
+    train = synthetic_sequences(data_rng, num_train, steps, feature_dim, classes, projection)
+    valid = synthetic_sequences(data_rng, num_valid, steps, feature_dim, classes, projection)
+    return train, valid
+
+
+def build_lstm_model(feature_dim, hidden, classes, steps, name, state_dtype='float32', seed=1337):
+    import sparnn.utils
+    from sparnn.layers import InterfaceLayer
+    from sparnn.layers import LSTMLayer
+    from sparnn.layers import FeedForwardLayer
+    from sparnn.layers import ElementwiseCostLayer
+    from sparnn.models import VideoModel
+
+    rng = sparnn.utils.quick_npy_rng(seed)
+    theano_rng = sparnn.utils.quick_theano_rng(rng)
+
+    param = {"id": "synthetic", "use_mask": True,
+             "input_ndim": 3, "output_ndim": 2,
+             "output_data_type": "int64"}
+    interface_layer = InterfaceLayer(param)
+    x = interface_layer.input
+    mask = interface_layer.mask
+    y = interface_layer.output
+    minibatch_size = x.shape[1]
+
+    middle_layers = []
+    param = {"id": 0, "rng": rng, "theano_rng": theano_rng,
+             "dim_in": (feature_dim,), "dim_out": (hidden,),
+             "minibatch_size": minibatch_size,
+             "input": x, "mask": mask,
+             "state_dtype": state_dtype,
+             "n_steps": steps}
+    middle_layers.append(LSTMLayer(param))
+    param = {"id": 1, "rng": rng, "theano_rng": theano_rng,
+             "dim_in": (hidden,), "dim_out": (classes,),
+             "minibatch_size": minibatch_size,
+             "activation": "softmax",
+             "input": middle_layers[0].output}
+    middle_layers.append(FeedForwardLayer(param))
+
+    param = {"id": "cost", "rng": rng, "theano_rng": theano_rng,
+             "dim_in": (classes,), "dim_out": (1,),
+             "minibatch_size": minibatch_size,
+             "cost_func": "CategoricalCrossEntropy",
+             "param_layers": middle_layers,
+             "input": middle_layers[1].output,
+             "mask": mask,
+             "target": y}
+    cost_layer = ElementwiseCostLayer(param)
+
+    outputs = [{"name": "probability", "value": middle_layers[1].output}]
+    param = {'interface_layer': interface_layer, 'middle_layers': middle_layers, 'cost_layer': cost_layer,
+             'outputs': outputs, 'errors': None, 'last_n': steps,
+             'name': name,
+             'problem_type': "classification"}
+    return VideoModel(param)
+
+
+def build_alstm_model(feature_dim, regions, hidden, classes, steps, name, seed=1337):
+    """
+    The attention LSTM of evaluate_ucf101_rgb_ALSTM.py on (Timestep, Minibatch, FeatureDim, Region) inputs
+    """
+    import sparnn.utils
+    from sparnn.layers import InterfaceLayer
+    from sparnn.layers import FeedForwardLayer
+    from sparnn.layers import CondLSTMLayer
+    from sparnn.layers import DropoutLayer
+    from sparnn.layers import ElementwiseCostLayer
+    from sparnn.models import VideoModel
+
+    rng = sparnn.utils.quick_npy_rng(seed)
+    theano_rng = sparnn.utils.quick_theano_rng(rng)
+
+    param = {"id": "synthetic", "use_mask": True,
+             "input_ndim": 4, "output_ndim": 2,
+             "output_data_type": "int64"}
+    interface_layer = InterfaceLayer(param)
+    x = interface_layer.input
+    mask = interface_layer.mask
+    y = interface_layer.output
+    minibatch_size = x.shape[1]
+    input_mean = x.mean(0).mean(2)
+
+    middle_layers = []
+    for i in xrange(2):
+        param = {"id": i, "rng": rng, "theano_rng": theano_rng,
+                 "dim_in": (feature_dim,), "dim_out": (hidden,),
+                 "minibatch_size": minibatch_size,
+                 "activation": "tanh",
+                 "input": input_mean}
+        middle_layers.append(FeedForwardLayer(param))
+    param = {"id": 2, "rng": rng, "theano_rng": theano_rng,
+             "dim_in": (feature_dim, regions), "dim_out": (hidden,),
+             "minibatch_size": minibatch_size,
+             "input": x, "mask": mask,
+             "init_hidden_state": middle_layers[0].output,
+             "init_cell_state": middle_layers[1].output,
+             "n_steps": steps}
+    middle_layers.append(CondLSTMLayer(param))
+    param = {"id": 3, "rng": rng, "theano_rng": theano_rng,
+             "dim_in": (hidden,), "dim_out": (hidden,),
+             "minibatch_size": minibatch_size,
+             "dropout_rate": 0.5,
+             "input": middle_layers[2].output}
+    middle_layers.append(DropoutLayer(param))
+    param = {"id": 4, "rng": rng, "theano_rng": theano_rng,
+             "dim_in": (hidden,), "dim_out": (classes,),
+             "minibatch_size": minibatch_size,
+             "activation": "softmax",
+             "input": middle_layers[3].output}
+    middle_layers.append(FeedForwardLayer(param))
+
+    param = {"id": "cost", "rng": rng, "theano_rng": theano_rng,
+             "dim_in": (classes,), "dim_out": (1,),
+             "minibatch_size": minibatch_size,
+             "cost_func": "CategoricalCrossEntropy",
+             "param_layers": middle_layers,
+             "input": middle_layers[4].output,
+             "mask": mask,
+             "target": y}
+    cost_layer = ElementwiseCostLayer(param)
+
+    outputs = [{"name": "probability", "value": middle_layers[4].output}]
+    param = {'interface_layer': interface_layer, 'middle_layers': middle_layers, 'cost_layer': cost_layer,
+             'outputs': outputs, 'errors': None, 'last_n': steps,
+             'name': name,
+             'problem_type': "classification"}
+    return VideoModel(param)
+
+
+def probability_function(model):
+    import theano
+    import theano.tensor as TT
+    import sparnn.utils
+    return theano.function(model.interface_layer.symbols(), model.middle_layers[-1].output,
+                           givens=[(layer.is_train, TT.constant(sparnn.utils.numpy_floatX(0.)))
+                                   for layer in model.middle_layers if hasattr(layer, 'is_train')],
+                           on_unused_input='ignore')
+
+
+def sequence_accuracy(probability, data):
+    averaged = (probability * data[1][:, :, None]).sum(axis=0)
+    return float(numpy.mean(numpy.argmax(averaged, axis=1) == data[3]))
@@ -0,0 +1,164 @@
+__author__ = 'zhenyang'
+
+'''
+Synthetic HDF5 video feature dataset in the layout of the UCF101 features read by the video iterators
+
+    <root>/features/<video>.h5        one file per video, dataset `features` of (frames,) + feature_shape
+                                      (VideoDataIterator, VideoDataTsIterator, AdvancedVideoIterator, ...)
+    <root>/context/<video>.h5         the same for the context stream of the *Ts iterators (with `context_shape`)
+    <root>/<split>_features.h5        all the videos of the split concatenated along the frames
+                                      (VideoIterator, VideoTsIterator, with `concatenated`)
+    <root>/<split>_context.h5         the concatenated context, one frame less per video as VideoTsIterator
+                                      expects of optical flow
+    <root>/<split>_framenum.txt       number of frames of every video, one per line
+    <root>/<split>_labels.txt         label of every video, one per line, every class appears
+    <root>/<split>_filenames.txt      name of every video, one per line
+
+The features are uniform in [0, 1) like rectified pool5 / fc features, the lengths follow the `length_distribution`
+('uniform' between min_frames and max_frames, 'normal' centered between them and clipped to them, or 'fixed' at
+max_frames). write_synthetic_videos returns the paths as the keys of the iterator parameters. write_synthetic_clips
+writes the input/output clip data of DataIterator, NumpyIterator and PklIterator.
+
+    python synthetic_video.py /tmp/synthetic-ucf101 --split train --videos 200 --feature_shape 512x7x7
+'''
+
+import os
+import cPickle
+import argparse
+
+import numpy
+import h5py
+
+
+def parse_shape(s):
+    return tuple(int(d) for d in s.split('x'))
+
+
+def video_lengths(rng, num_videos, min_frames, max_frames, length_distribution='uniform'):
+    if length_distribution == 'uniform':
+        return rng.randint(min_frames, max_frames + 1, size=num_videos)
+    if length_distribution == 'normal':
+        lengths = rng.normal((min_frames + max_frames) / 2., (max_frames - min_frames) / 6., size=num_videos)
+        return numpy.clip(numpy.round(lengths), min_frames, max_frames).astype('int64')
+    if length_distribution == 'fixed':
+        return numpy.ones(num_videos, dtype='int64') * max_frames
+    raise ValueError("Unknown length distribution " + length_distribution)
+
+
+def write_lines(path, values):
+    f = open(path, 'w')
+    for v in values:
+        f.write(str(v) + "\n")
+    f.close()
+
+
+def write_features(path, dataset_name, value):
+    f = h5py.File(path, 'w')
+    f.create_dataset(dataset_name, data=value)
+    f.close()
+
+
+def write_synthetic_videos(root, split='train', num_videos=100, feature_shape=(512, 7, 7), classes=101,
+                           min_frames=30, max_frames=300, length_distribution='uniform', context_shape=None,
+                           concatenated=False, dataset_name='features', dtype='float32', seed=1000):
+    rng = numpy.random.RandomState(seed)
+    lengths = video_lengths(rng, num_videos, min_frames, max_frames, length_distribution)
+    labels = numpy.arange(num_videos) % classes
+    rng.shuffle(labels)
+    names = ["%s_%05d" % (split, v) for v in xrange(num_videos)]
+
+    paths = {'data_file': os.path.join(root, 'features'),
+             'num_frames_file': os.path.join(root, split + '_framenum.txt'),
+             'labels_file': os.path.join(root, split + '_labels.txt'),
+             'vid_name_file': os.path.join(root, split + '_filenames.txt'),
+             'dataset_name': dataset_name}
+    if context_shape is not None:
+        paths['context_file'] = os.path.join(root, 'context')
+    for key in ('data_file', 'context_file'):
+        if key in paths and not os.path.exists(paths[key]):
+            os.makedirs(paths[key])
+
+    total = int(lengths.sum())
+    if concatenated:
+        paths['concatenated_data_file'] = os.path.join(root, split + '_features.h5')
+        data_h5 = h5py.File(paths['concatenated_data_file'], 'w')
+        data = data_h5.create_dataset(dataset_name, (total,) + tuple(feature_shape), dtype=dtype)
+        if context_shape is not None:
+            paths['concatenated_context_file'] = os.path.join(root, split + '_context.h5')
+            context_h5 = h5py.File(paths['concatenated_context_file'], 'w')
+            context = context_h5.create_dataset(dataset_name, (total - num_videos,) + tuple(context_shape),
+                                                dtype=dtype)
+
+    start = 0
+    for v in xrange(num_videos):
+        value = rng.random_sample((lengths[v],) + tuple(feature_shape)).astype(dtype)
+        write_features(os.path.join(paths['data_file'], names[v] + '.h5'), dataset_name, value)
+        if concatenated:
+            data[start:start + lengths[v]] = value
+        if context_shape is not None:
+            value = rng.random_sample((lengths[v],) + tuple(context_shape)).astype(dtype)
+            write_features(os.path.join(paths['context_file'], names[v] + '.h5'), dataset_name, value)
+            if concatenated:
+                context[start - v:start - v + lengths[v] - 1] = value[:-1]
+        start += lengths[v]
+    if concatenated:
+        data_h5.close()
+        if context_shape is not None:
+            context_h5.close()
+
+    write_lines(paths['num_frames_file'], lengths)
+    write_lines(paths['labels_file'], labels)
+    write_lines(paths['vid_name_file'], names)
+    return paths
+
+
+def write_synthetic_clips(path, num_clips=64, seq_length=10, frame_shape=(1, 64, 64), seed=1000):
+    """
+    Clip data of the DataIterator family: input clips of seq_length frames each followed by an output clip of
+    seq_length frames, as an .npz (NumpyIterator) or a .pkl (PklIterator) file by extension
+    """
+    rng = numpy.random.RandomState(seed)
+    if os.path.splitext(path)[1] == '.pkl':
+        clips = [rng.random_sample((2 * seq_length,) + tuple(frame_shape)).astype('float32')
+                 for i in xrange(num_clips)]
+        f = open(path, 'wb')
+        cPickle.dump({'input': [c[:seq_length] for c in clips], 'output': [c[seq_length:] for c in clips],
+                      'input_dim': tuple(frame_shape), 'output_dim': tuple(frame_shape)}, f,
+                     protocol=cPickle.HIGHEST_PROTOCOL)
+        f.close()
+        return path
+    starts = numpy.arange(num_clips, dtype='int32') * 2 * seq_length
+    clips = numpy.zeros((2, num_clips, 2), dtype='int32')
+    clips[0, :, 0] = starts
+    clips[1, :, 0] = starts + seq_length
+    clips[:, :, 1] = seq_length
+    numpy.savez(path, dims=numpy.asarray(frame_shape, dtype='int32').reshape((1, 3)), clips=clips,
+                input_raw_data=rng.random_sample((2 * seq_length * num_clips,) + tuple(frame_shape)).astype('float32'))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="synthetic HDF5 video features in the UCF101 layout")
+    parser.add_argument('root')
+    parser.add_argument('--split', default='train')
+    parser.add_argument('--videos', type=int, default=100)
+    parser.add_argument('--feature_shape', default='512x7x7', help="512x7x7 (pool5) or 1024 (fc) for example")
+    parser.add_argument('--context_shape', default=None, help="also write a context stream of this shape")
+    parser.add_argument('--classes', type=int, default=101)
+    parser.add_argument('--min_frames', type=int, default=30)
+    parser.add_argument('--max_frames', type=int, default=300)
+    parser.add_argument('--length_distribution', default='uniform', choices=['uniform', 'normal', 'fixed'])
+    parser.add_argument('--concatenated', action='store_true', help="also write the concatenated split file")
+    parser.add_argument('--seed', type=int, default=1000)
+    args = parser.parse_args()
+
+    paths = write_synthetic_videos(args.root, args.split, args.videos, parse_shape(args.feature_shape),
+                                   args.classes, args.min_frames, args.max_frames, args.length_distribution,
+                                   parse_shape(args.context_shape) if args.context_shape is not None else None,
+                                   args.concatenated, seed=args.seed)
+    for key, path in sorted(paths.items()):
+        print "%-28s %s" % (key, path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+__author__ = 'zhenyang'
+
+'''
+End-to-end training throughput: VideoDataIterator + VideoModel + RMSProp on synthetic HDF5 videos
+
+The dataset is generated by synthetic_video.py (in `--data`, or in a temporary directory removed afterwards),
+pool5 like features (e.g. 512x7x7) train the attention LSTM of the UCF101 experiments on the reshaped
+(Timestep, Minibatch, FeatureDim, Region) batches, fc like features (e.g. 1024) train the LSTM classifier. After
+`--warmup` steps (compilation, file cache) the driver times `--steps` training steps with the per-stage timing of
+the telemetry (see sparnn/optimizers/telemetry.py) and reports clips/sec and frames/sec, with the share of the
+step spent reading the minibatch:
+
+    python training_throughput.py [--feature_shape 512x7x7] [--minibatch_size 32] [--steps 50] [--json out.json]
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def build_iterator(paths, args):
+    import sparnn.utils
+    from sparnn.iterators import VideoDataIterator
+    iterator_param = {'dataset': 'synthetic',
+                      'data_file': paths['data_file'],
+                      'num_frames_file': paths['num_frames_file'],
+                      'labels_file': paths['labels_file'],
+                      'vid_name_file': paths['vid_name_file'],
+                      'dataset_name': paths['dataset_name'],
+                      'rng': sparnn.utils.quick_npy_rng(1337), 'frame_rng': sparnn.utils.quick_npy_rng(1234),
+                      'seq_length': args.seq_length, 'num_segments': 1, 'seq_fps': 30,
+                      'minibatch_size': args.minibatch_size, 'train_sampling': True,
+                      'reshape': len(args.feature_shape) == 3,
+                      'use_mask': True, 'input_data_type': 'float32', 'output_data_type': 'int64',
+                      'one_hot_label': True, 'is_output_multilabel': False,
+                      'name': 'synthetic-train-video-iterator'}
+    return VideoDataIterator(iterator_param)
+
+
+def build_model(args):
+    from synthetic import build_lstm_model, build_alstm_model
+    if len(args.feature_shape) == 3:
+        return build_alstm_model(args.feature_shape[0], args.feature_shape[1] * args.feature_shape[2], args.hidden,
+                                 args.classes, args.seq_length, "Synthetic-ALSTM")
+    return build_lstm_model(args.feature_shape[0], args.hidden, args.classes, args.seq_length, "Synthetic-LSTM")
+
+
+def run(paths, args):
+    from sparnn.optimizers import RMSProp
+    iterator = build_iterator(paths, args)
+    model = build_model(args)
+    param = {'id': 'throughput', 'learning_rate': 0.001, 'decay_rate': 0.9, 'clip_threshold': 100.,
+             'verbose': False, 'max_epoch': 1, 'save_path': tempfile.gettempdir()}
+    optimizer = RMSProp(model, iterator, None, None, param)
+
+    model.set_mode("train")
+    iterator.begin(do_shuffle=True)
+    records = []
+    for step in xrange(args.warmup + args.steps):
+        optimizer.current_uidx += 1
+        optimizer.timed_update()
+        record = optimizer.step_record
+        record['step_time'] = time.time() - record.pop('step_start')
+        if step >= args.warmup:
+            records.append(record)
+        iterator.next()
+        if iterator.no_batch_left():
+            iterator.begin(do_shuffle=True)
+
+    total = lambda key: sum(r[key] for r in records)
+    return {"feature_shape": list(args.feature_shape), "minibatch_size": args.minibatch_size,
+            "seq_length": args.seq_length, "steps": args.steps,
+            "clips_per_sec": total('clips') / total('step_time'),
+            "frames_per_sec": total('frames') / total('step_time'),
+            "step_time": total('step_time') / len(records),
+            "data_time": total('data_time') / len(records),
+            "transfer_time": total('transfer_time') / len(records),
+            "update_time": total('update_time') / len(records),
+            "data_share": total('data_time') / total('step_time'),
+            "final_cost": records[-1]['cost']}
+
+
+def main():
+    from synthetic_video import parse_shape, write_synthetic_videos
+    parser = argparse.ArgumentParser(description="end-to-end training throughput on synthetic HDF5 videos")
+    parser.add_argument('--data', default=None, help="dataset directory, generated if it holds no train split")
+    parser.add_argument('--feature_shape', default='512x7x7')
+    parser.add_argument('--videos', type=int, default=256)
+    parser.add_argument('--min_frames', type=int, default=30)
+    parser.add_argument('--max_frames', type=int, default=300)
+    parser.add_argument('--length_distribution', default='uniform', choices=['uniform', 'normal', 'fixed'])
+    parser.add_argument('--classes', type=int, default=101)
+    parser.add_argument('--hidden', type=int, default=512)
+    parser.add_argument('--seq_length', type=int, default=30)
+    parser.add_argument('--minibatch_size', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--json', default=None, help="json file the result is written to")
+    args = parser.parse_args()
+    args.feature_shape = parse_shape(args.feature_shape)
+
+    root = args.data if args.data is not None else tempfile.mkdtemp(prefix="synthetic-videos-")
+    try:
+        if not os.path.exists(os.path.join(root, 'train_framenum.txt')):
+            start = time.time()
+            write_synthetic_videos(root, 'train', args.videos, args.feature_shape, args.classes, args.min_frames,
+                                   args.max_frames, args.length_distribution)
+            print "Generated %d videos in %s (%.1fs)" % (args.videos, root, time.time() - start)
+        paths = {'data_file': os.path.join(root, 'features'),
+                 'num_frames_file': os.path.join(root, 'train_framenum.txt'),
+                 'labels_file': os.path.join(root, 'train_labels.txt'),
+                 'vid_name_file': os.path.join(root, 'train_filenames.txt'),
+                 'dataset_name': 'features'}
+        result = run(paths, args)
+    finally:
+        if args.data is None:
+            shutil.rmtree(root)
+
+    print "clips/sec %10.2f   frames/sec %10.1f" % (result["clips_per_sec"], result["frames_per_sec"])
+    print "step %8.4fs = data %8.4fs + transfer %8.4fs + update %8.4fs   (%.1f%% reading data)" % (
+        result["step_time"], result["data_time"], result["transfer_time"], result["update_time"],
+        100. * result["data_share"])
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
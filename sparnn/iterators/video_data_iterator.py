@@ -35,6 +35,11 @@ output_batch: 2-dimensional numpy array, (Timestep, Minibatch,)
 The VideoDataIterator class will automatically generate input/output mask if set the `use_mask` flag.
 The mask has 2 dims, (Timestep, Minibatch), all elements are either 0 or 1
 
+By default videos shorter than the sequence are padded by tiling the last frame and the padded frames are
+not masked. With `mask_padded_frames` the tiled frames get mask 0, and with `sort_by_length` the videos of
+a minibatch are ordered by decreasing length, so the mask of every timestep is a prefix of ones. That is
+what the `active_rows` mask mode of the recurrent layers expects to skip the padded rows.
+
 '''
 
 
@@ -56,6 +61,8 @@ class VideoDataIterator(object):
         self.dataset_name = iterator_param['dataset_name']
 
         self.reshape = iterator_param.get('reshape', False)
+        self.sort_by_length = iterator_param.get('sort_by_length', False)
+        self.mask_padded_frames = iterator_param.get('mask_padded_frames', False)
 
         self.num_segments = iterator_param['num_segments']
         self.train_sampling = iterator_param['train_sampling']
@@ -147,7 +154,7 @@ class VideoDataIterator(object):
         self.current_position = 0
         self.current_batch_size = self.minibatch_size if self.current_position \
                                                          + self.minibatch_size <= self.total() else self.total() - self.current_position
-        self.current_batch_indices = self.indices[self.current_position:self.current_position + self.current_batch_size]
+        self.current_batch_indices = self.sort_batch(self.indices[self.current_position:self.current_position + self.current_batch_size])
 
     def next(self):
         self.current_position += self.current_batch_size
@@ -155,7 +162,13 @@ class VideoDataIterator(object):
             return None
         self.current_batch_size = self.minibatch_size if self.current_position \
                                                          + self.minibatch_size <= self.total() else self.total() - self.current_position
-        self.current_batch_indices = self.indices[self.current_position:self.current_position + self.current_batch_size]
+        self.current_batch_indices = self.sort_batch(self.indices[self.current_position:self.current_position + self.current_batch_size])
+
+    def sort_batch(self, batch_indices):
+        if self.sort_by_length:
+            # stable sort keeps the original order between videos of the same length
+            batch_indices = batch_indices[numpy.argsort(-self.lengths[batch_indices], kind='mergesort')]
+        return batch_indices
 
     def no_batch_left(self):
         if self.current_position >= self.total():
@@ -187,6 +200,7 @@ class VideoDataIterator(object):
                                         self.output_data_type)
 
         data = None
+        padded_frames = []
         for i in xrange(self.current_batch_size):
             # move to current batch/video position
             batch_ind = self.current_batch_indices[i]
@@ -219,6 +233,7 @@ class VideoDataIterator(object):
                     input_batch[:n, i*self.num_segments + j, :] = data[start:start+length:self.seq_skip, :]
                     input_batch[n:, i*self.num_segments + j, :] = numpy.tile(input_batch[n-1, i*self.num_segments + j, :],
                                                                             (self.seq_length-n,) + ((1,) * len(self.data_dims)))
+                    padded_frames.append((i*self.num_segments + j, n))
 
                 if self.is_output_multilabel:
                     output_batch[:, i*self.num_segments + j, :] = numpy.tile(label, (self.seq_length,1))
@@ -236,6 +251,9 @@ class VideoDataIterator(object):
         
         if self.use_mask:
             mask[:, :self.current_batch_size*self.num_segments] = 1.
+            if self.mask_padded_frames:
+                for row, n in padded_frames:
+                    mask[n:, row] = 0.
         input_batch = input_batch.astype(self.input_data_type)
         output_batch = output_batch.astype(self.output_data_type)
 
@@ -252,6 +270,8 @@ class VideoDataIterator(object):
         logger.info("   Input Data Type: " + str(self.input_data_type))
         logger.info("   Output Data Type: " + str(self.output_data_type))
         logger.info("   Is Output Multi Label: " + str(self.is_output_multilabel))
+        logger.info("   Sort By Length: " + str(self.sort_by_length))
+        logger.info("   Mask Padded Frames: " + str(self.mask_padded_frames))
 
 def main():
     exit()
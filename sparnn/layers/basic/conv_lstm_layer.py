@@ -38,6 +38,12 @@ class ConvLSTMLayer(Layer):
             self.n_steps = layer_param['n_steps']
         else:
             self.n_steps = layer_param.get('n_steps', self.input.shape[0])
+        self.truncate_gradient = layer_param.get('truncate_gradient', -1)
+        self.checkpoint_every = layer_param.get('checkpoint_every', None)
+        # 'active_rows' needs minibatches sorted by decreasing length, see quick_active_counts
+        self.mask_mode = layer_param.get('mask_mode', 'switch')
+        assert self.mask_mode in ('switch', 'active_rows')
+        self.state_dtype = layer_param.get('state_dtype', theano.config.floatX)
         self.kernel_size = (self.feature_out, self.feature_in,
                             self.input_receptive_field[0], self.input_receptive_field[1])
         self.transition_mat_size = (self.feature_out, self.feature_out,
@@ -108,6 +114,16 @@ class ConvLSTMLayer(Layer):
 
         return [h_t, c_t]
 
+    def step_active_fprop(self, x_t, n_t, h_tm1, c_tm1, *args):
+        # only the first n_t rows of the minibatch are computed, the others keep their states
+        n = quick_active_count(n_t)
+        h_t, c_t = self.step_fprop(x_t[:n], h_tm1[:n], c_tm1[:n], *args)
+
+        h_t = quick_active_rows(h_t, h_tm1, n_t)
+        c_t = quick_active_rows(c_t, c_tm1, n_t)
+
+        return [h_t, c_t]
+
     def step_masked_fprop(self, x_t, mask_t, h_tm1, c_tm1, *args):
         h_t, c_t = self.step_fprop(x_t, h_tm1, c_tm1, *args)
 
@@ -119,6 +135,12 @@ class ConvLSTMLayer(Layer):
     def init_states(self):
         return self.init_hidden_state, self.init_cell_state
 
+    def step_sequences(self):
+        return [self.input]
+
+    def step_states(self, step_input, prev_states):
+        return self.step_fprop(*(step_input + prev_states))
+
     def fprop(self):
 
         # The dimension of self.mask is (Timestep, Minibatch).
@@ -129,16 +151,28 @@ class ConvLSTMLayer(Layer):
         if self.mask is None:
             scan_input = [self.input]
             scan_fn = self.step_fprop
+        elif self.mask_mode == "active_rows":
+            scan_input = [self.input, quick_active_counts(self.mask)]
+            scan_fn = self.step_active_fprop
         else:
             scan_input = [self.input, TT.shape_padright(self.mask, 3)]
             scan_fn = self.step_masked_fprop
 
+        outputs_info = [self.init_hidden_state,
+                        self.init_cell_state]
+        if self.state_dtype != theano.config.floatX:
+            scan_fn = quick_storage_step(scan_fn, self.state_dtype)
+            outputs_info = [TT.cast(state, self.state_dtype) for state in outputs_info]
+
         non_seqs = self.param
         [self.output, self.cell_output], self.output_update = quick_unroll_scan(fn=scan_fn,
         #[self.output, self.cell_output], self.output_update = quick_scan(fn=scan_fn,
-                                                                          outputs_info=[self.init_hidden_state,
-                                                                                        self.init_cell_state],
+                                                                          outputs_info=outputs_info,
                                                                           sequences=scan_input,
                                                                           non_sequences=non_seqs,
-                                                                          n_steps=self.n_steps
-                                                                          )
\ No newline at end of file
+                                                                          n_steps=self.n_steps,
+                                                                          truncate_gradient=self.truncate_gradient,
+                                                                          checkpoint_every=self.checkpoint_every
+                                                                          )
+        if self.state_dtype != theano.config.floatX:
+            [self.output, self.cell_output] = [TT.cast(state, theano.config.floatX) for state in [self.output, self.cell_output]]
\ No newline at end of file
@@ -53,6 +53,8 @@ class DeepCondConvLSTMDecpLayer(Layer):
             self.n_steps = layer_param['n_steps']
         else:
             self.n_steps = layer_param.get('n_steps', self.input.shape[0])
+        self.truncate_gradient = layer_param.get('truncate_gradient', -1)
+        self.checkpoint_every = layer_param.get('checkpoint_every', None)
         self.kernel_size = (self.feature_out, self.feature_in,
                             self.input_receptive_field[0], self.input_receptive_field[1])
         self.transition_mat_size = (self.feature_out, self.feature_out,
@@ -262,7 +264,7 @@ class DeepCondConvLSTMDecpLayer(Layer):
 
         non_seqs = self.param
         #[self.output, self.cell_output, self.ctx_output, self.ctx_cell_output, self.alpha], self.output_update = quick_unroll_scan(fn=scan_fn,
-        [self.output, self.cell_output, self.ctx_output, self.ctx_cell_output, self.alpha], self.output_update = theano.scan(fn=scan_fn,
+        [self.output, self.cell_output, self.ctx_output, self.ctx_cell_output, self.alpha], self.output_update = quick_scan(fn=scan_fn,
                                                                         outputs_info=[self.init_hidden_state,
                                                                                       self.init_cell_state,
                                                                                       self.init_context_hidden_state,
@@ -270,5 +272,7 @@ class DeepCondConvLSTMDecpLayer(Layer):
                                                                                       quick_theano_zero(((self.minibatch_size,) + self.fmap_size))],
                                                                         sequences=scan_input,
                                                                         non_sequences=non_seqs,
-                                                                        n_steps=self.n_steps
+                                                                        n_steps=self.n_steps,
+                                                                        truncate_gradient=self.truncate_gradient,
+                                                                        checkpoint_every=self.checkpoint_every
                                                                         )
\ No newline at end of file
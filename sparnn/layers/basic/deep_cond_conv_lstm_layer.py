@@ -53,6 +53,12 @@ class DeepCondConvLSTMLayer(Layer):
             self.n_steps = layer_param['n_steps']
         else:
             self.n_steps = layer_param.get('n_steps', self.input.shape[0])
+        self.truncate_gradient = layer_param.get('truncate_gradient', -1)
+        self.checkpoint_every = layer_param.get('checkpoint_every', None)
+        # 'active_rows' needs minibatches sorted by decreasing length, see quick_active_counts
+        self.mask_mode = layer_param.get('mask_mode', 'switch')
+        assert self.mask_mode in ('switch', 'active_rows')
+        self.state_dtype = layer_param.get('state_dtype', theano.config.floatX)
         self.kernel_size = (self.feature_out, self.feature_in,
                             self.input_receptive_field[0], self.input_receptive_field[1])
         self.transition_mat_size = (self.feature_out, self.feature_out,
@@ -231,6 +237,20 @@ class DeepCondConvLSTMLayer(Layer):
 
         return [h_pred_t, c_pred_t, h_infer_t, c_infer_t, alpha]
 
+    def step_active_fprop(self, x_t, ctx_t, n_t, h_pred_tm1, c_pred_tm1, h_infer_tm1, c_infer_tm1, alpha_, *args):
+        # only the first n_t rows of the minibatch are computed, the others keep their states
+        n = quick_active_count(n_t)
+        h_pred_t, c_pred_t, h_infer_t, c_infer_t, alpha = self.step_fprop(x_t[:n], ctx_t[:n], \
+                                                        h_pred_tm1[:n], c_pred_tm1[:n], h_infer_tm1[:n], c_infer_tm1[:n], alpha_[:n], *args)
+
+        h_pred_t = quick_active_rows(h_pred_t, h_pred_tm1, n_t)
+        c_pred_t = quick_active_rows(c_pred_t, c_pred_tm1, n_t)
+        h_infer_t = quick_active_rows(h_infer_t, h_infer_tm1, n_t)
+        c_infer_t = quick_active_rows(c_infer_t, c_infer_tm1, n_t)
+        alpha = quick_active_rows(alpha, alpha_, n_t)
+
+        return [h_pred_t, c_pred_t, h_infer_t, c_infer_t, alpha]
+
     def step_masked_fprop(self, x_t, ctx_t, mask_t, h_pred_tm1, c_pred_tm1, h_infer_tm1, c_infer_tm1, alpha_, *args):
 
         h_pred_t, c_pred_t, h_infer_t, c_infer_t, alpha = self.step_fprop(x_t, ctx_t, \
@@ -240,12 +260,21 @@ class DeepCondConvLSTMLayer(Layer):
         c_pred_t = TT.switch(mask_t, c_pred_t, c_pred_tm1)
         h_infer_t = TT.switch(mask_t, h_infer_t, h_infer_tm1)
         c_infer_t = TT.switch(mask_t, c_infer_t, c_infer_tm1)
+        # padded rows keep the previous attention map, like the active_rows mask mode which does not compute them
+        alpha = TT.switch(mask_t[:, 0], alpha, alpha_)
 
         return [h_pred_t, c_pred_t, h_infer_t, c_infer_t, alpha]
 
     def init_states(self):
         return self.init_hidden_state, self.init_cell_state, self.init_context_hidden_state, self.init_context_cell_state
 
+    def step_sequences(self):
+        return [self.input, self.context]
+
+    def step_states(self, step_input, prev_states):
+        h_pred_t, c_pred_t, h_infer_t, c_infer_t, alpha = self.step_fprop(*(step_input + prev_states + [None]))
+        return [h_pred_t, c_pred_t, h_infer_t, c_infer_t]
+
     def fprop(self):
 
         # The dimension of self.mask is (Timestep, Minibatch).
@@ -261,19 +290,33 @@ class DeepCondConvLSTMLayer(Layer):
         if self.mask is None:
             scan_input = [self.input, self.context]
             scan_fn = self.step_fprop
+        elif self.mask_mode == "active_rows":
+            scan_input = [self.input, self.context, quick_active_counts(self.mask)]
+            scan_fn = self.step_active_fprop
         else:
             scan_input = [self.input, self.context, TT.shape_padright(self.mask, 3)]
             scan_fn = self.step_masked_fprop
 
+        outputs_info = [self.init_hidden_state,
+                        self.init_cell_state,
+                        self.init_context_hidden_state,
+                        self.init_context_cell_state,
+                        quick_theano_zero(((self.minibatch_size,) + self.fmap_size))]
+        if self.state_dtype != theano.config.floatX:
+            scan_fn = quick_storage_step(scan_fn, self.state_dtype)
+            outputs_info = [TT.cast(state, self.state_dtype) for state in outputs_info]
+
         non_seqs = self.param
         #[self.output, self.cell_output, self.ctx_output, self.ctx_cell_output, self.alpha], self.output_update = quick_unroll_scan(fn=scan_fn,
-        [self.output, self.cell_output, self.ctx_output, self.ctx_cell_output, self.alpha], self.output_update = theano.scan(fn=scan_fn,
-                                                                        outputs_info=[self.init_hidden_state,
-                                                                                      self.init_cell_state,
-                                                                                      self.init_context_hidden_state,
-                                                                                      self.init_context_cell_state,
-                                                                                      quick_theano_zero(((self.minibatch_size,) + self.fmap_size))],
+        [self.output, self.cell_output, self.ctx_output, self.ctx_cell_output, self.alpha], self.output_update = quick_scan(fn=scan_fn,
+                                                                        outputs_info=outputs_info,
                                                                         sequences=scan_input,
                                                                         non_sequences=non_seqs,
-                                                                        n_steps=self.n_steps
-                                                                        )
\ No newline at end of file
+                                                                        n_steps=self.n_steps,
+                                                                        truncate_gradient=self.truncate_gradient,
+                                                                        checkpoint_every=self.checkpoint_every
+                                                                        )
+        if self.state_dtype != theano.config.floatX:
+            [self.output, self.cell_output, self.ctx_output, self.ctx_cell_output, self.alpha] = \
+                [TT.cast(state, theano.config.floatX) for state in
+                 [self.output, self.cell_output, self.ctx_output, self.ctx_cell_output, self.alpha]]
\ No newline at end of file
@@ -41,6 +41,8 @@ class DeepCondLSTMDecpLayer(Layer):
             self.n_steps = layer_param['n_steps']
         else:
             self.n_steps = layer_param.get('n_steps', self.input.shape[0])
+        self.truncate_gradient = layer_param.get('truncate_gradient', -1)
+        self.checkpoint_every = layer_param.get('checkpoint_every', None)
         self.input_mat_size = (self.feature_in, self.feature_out)
         self.transition_mat_size = (self.feature_out, self.feature_out)
 
@@ -181,5 +183,7 @@ class DeepCondLSTMDecpLayer(Layer):
                                                                                       quick_theano_zero((self.minibatch_size, self.feature_in))],
                                                                         sequences=scan_input,
                                                                         non_sequences=non_seqs,
-                                                                        n_steps=self.n_steps
+                                                                        n_steps=self.n_steps,
+                                                                        truncate_gradient=self.truncate_gradient,
+                                                                        checkpoint_every=self.checkpoint_every
                                                                         )
\ No newline at end of file
@@ -37,7 +37,7 @@ class DenseLayer(Layer):
     def set_name(self):
         self.name = "DenseLayer-" + str(self.id)
 
-    def step_fprop(self, input):
+    def step_linear(self, input):
         if len(self.dim_in) > 1:
             # if the input has more than one dimension, flatten it into a
             # batch of feature vectors.
@@ -47,10 +47,14 @@ class DenseLayer(Layer):
         out = TT.dot(input, self.W)
 
         if self.bias:
-            output = quick_activation(out + self.b, self.activation)
-        else:
-            output = quick_activation(out, self.activation)
-        return output
+            out = out + self.b
+        return out
+
+    def step_fprop(self, input):
+        return quick_activation(self.step_linear(input), self.activation)
 
     def fprop(self):
-        self.output = self.step_fprop(self.input)
+        # linear_output is the value before the activation, e.g. the logits fed to
+        # the "SoftmaxCrossEntropy" cost while output keeps the softmax probabilities
+        self.linear_output = self.step_linear(self.input)
+        self.output = quick_activation(self.linear_output, self.activation)
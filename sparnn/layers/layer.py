@@ -17,6 +17,7 @@ class Layer(object):
         minibatch_size should be a tensor shape argument!
     """
     def __init__(self, layer_param):
+        self.layer_param = layer_param
         self.rng = layer_param['rng']
         self.theano_rng = layer_param['theano_rng']
         self.dim_in = layer_param.get('dim_in', None)
@@ -62,5 +63,21 @@ class Layer(object):
         else:
             logger.info("   No parameter")
 
+    def get_step_func(self):
+        """
+        Compile the single step function of a recurrent layer for incremental (streaming) inference.
+        The layer needs to implement step_sequences() and step_states(step_input, prev_states).
+        Inputs are one frame of each step sequence followed by the previous states,
+        outputs are the new states in the order of init_states(), the first one is the layer output.
+        """
+        assert self.is_recurrent
+        step_input = [quick_symbolic_variable(s.ndim - 1, self._s("step_input_%d" % i), s.dtype)
+                      for i, s in enumerate(self.step_sequences())]
+        prev_states = [quick_symbolic_variable(s.ndim, self._s("prev_state_%d" % i))
+                       for i, s in enumerate(self.init_states())]
+        return theano.function(inputs=step_input + prev_states,
+                               outputs=self.step_states(step_input, prev_states),
+                               on_unused_input='warn')
+
     def _s(self, s):
         return '%s.%s' % (self.name, s)
@@ -11,6 +11,7 @@ logger = logging.getLogger(__name__)
 
 class StackInterfaceLayer(object):
     def __init__(self, layer_param):
+        self.layer_param = layer_param
         self.id = layer_param['id']
         self.use_mask = layer_param.get('use_mask', False)
         input_data_type = layer_param.get('input_data_type', theano.config.floatX)
@@ -1,4 +1,4 @@
 __author__ = 'zhenyang'
 
 from model import Model
-from video_model import VideoModel
\ No newline at end of file
+from video_model import VideoModel, VideoStreamPredictor
\ No newline at end of file
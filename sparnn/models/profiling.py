@@ -0,0 +1,184 @@
+__author__ = 'zhenyang'
+
+import os
+import inspect
+import collections
+import numpy
+import theano
+
+'''
+Profiling report of the compiled functions of a VideoModel
+
+VideoModel.enable_profiling() makes the model compile its functions with a theano ProfileStats each (and
+without the function cache), write_profile_report then ranks the time spent by op type and by apply node, and
+attributes every node of the optimized graphs to the layer that created it, with the time and the memory of the
+outputs it produced. Attribution uses the creation stack trace theano keeps on the variables (tag.trace, see
+theano.config.traceback.limit): the innermost frame in the source file of one of the model's layer classes gives
+the layer, the innermost sparnn frame gives the site (e.g. the padding of conv2d_same in sparnn/utils/utils.py).
+When a model has several layers of the same class, the parameters read by the node decide between them.
+Nodes that lost their trace in an optimization, or whose class has several instances and reads no parameter,
+are reported as such. Operations inside a scan are reported as the scan node of their layer.
+
+'''
+
+
+def _source_file(obj):
+    path = inspect.getsourcefile(obj) or inspect.getfile(obj)
+    return os.path.abspath(path)
+
+
+def _stacks(variable):
+    trace = getattr(variable.tag, 'trace', None)
+    if not trace:
+        return []
+    # older theano versions keep a single stack instead of a list of stacks
+    return [trace] if isinstance(trace[0], tuple) else trace
+
+
+def _apply_node(key):
+    # ProfileStats keys apply nodes by (fgraph, node) in recent theano versions
+    return key[1] if isinstance(key, tuple) else key
+
+
+class LayerAttribution(object):
+    def __init__(self, model):
+        self.files = collections.defaultdict(list)
+        self.param_owner = {}
+        for layer in model.middle_layers + [model.cost_layer]:
+            self.files[_source_file(type(layer))].append(layer)
+            for p in layer.param:
+                self.param_owner[p.name] = layer
+        self.sparnn_root = os.path.dirname(os.path.dirname(_source_file(LayerAttribution)))
+
+    def frames(self, node):
+        for variable in node.outputs:
+            for stack in _stacks(variable):
+                for frame in reversed(stack):
+                    yield os.path.abspath(frame[0]), frame[1], frame[2]
+
+    def site(self, node):
+        for filename, lineno, func in self.frames(node):
+            if filename.startswith(self.sparnn_root):
+                return os.path.relpath(filename, os.path.dirname(self.sparnn_root)) + ":" + str(lineno) + \
+                    " (" + func + ")"
+        return None
+
+    def layer(self, node):
+        # the compiled graph holds clones of the shared variables, parameters are recognized by name
+        owners = [self.param_owner[i.name] for i in node.inputs
+                  if i.name is not None and i.name in self.param_owner]
+        for filename, lineno, func in self.frames(node):
+            candidates = self.files.get(filename[:-1] if filename.endswith('.pyc') else filename)
+            if not candidates:
+                continue
+            if len(candidates) == 1:
+                return candidates[0].name
+            for owner in owners:
+                if owner in candidates:
+                    return owner.name
+            return type(candidates[0]).__name__ + " (one of " + str(len(candidates)) + ")"
+        if len(owners) > 0:
+            return owners[0].name
+        return "<unattributed>"
+
+
+def _output_bytes(node, variable_shape):
+    ret = 0
+    for variable in node.outputs:
+        shape = variable_shape.get(variable, None)
+        if shape is None or not hasattr(variable, 'dtype') or not isinstance(shape, (tuple, list)):
+            continue
+        ret += int(numpy.prod(shape)) * numpy.dtype(variable.dtype).itemsize
+    return ret
+
+
+def profile_rows(model, profiles):
+    """
+    One row per profiled apply node: function, op, layer, site, time, calls, output bytes
+    """
+    attribution = LayerAttribution(model)
+    rows = []
+    for name, profile in profiles.items():
+        variable_shape = getattr(profile, 'variable_shape', {}) or {}
+        for key, t in profile.apply_time.items():
+            node = _apply_node(key)
+            rows.append({'function': name, 'op': type(node.op).__name__, 'node': str(node),
+                         'layer': attribution.layer(node), 'site': attribution.site(node), 'time': t,
+                         'calls': profile.apply_callcount.get(key, 0),
+                         'bytes': _output_bytes(node, variable_shape)})
+    return rows
+
+
+def _ranked(rows, key):
+    totals = collections.defaultdict(lambda: {'time': 0., 'calls': 0, 'bytes': 0, 'nodes': 0})
+    for row in rows:
+        total = totals[row[key]]
+        total['time'] += row['time']
+        total['calls'] += row['calls']
+        total['bytes'] += row['bytes']
+        total['nodes'] += 1
+    return sorted(totals.items(), key=lambda item: -item[1]['time'])
+
+
+def write_profile_report(model, profiles, path, top=30, theano_summary=True):
+    rows = profile_rows(model, profiles)
+    total_time = sum(row['time'] for row in rows) or 1.
+    f = open(path, 'w')
+    f.write("Profile of " + model.name + "\n\n")
+    f.write("Functions:\n")
+    for name, profile in profiles.items():
+        f.write("  %-40s calls %8d   time %10.3fs   time in nodes %10.3fs\n" % (
+            name, profile.fct_callcount, profile.fct_call_time, sum(profile.apply_time.values())))
+
+    f.write("\nTime and output memory by layer:\n")
+    f.write("  %7s %10s %10s %8s  %s\n" % ("<%>", "time(s)", "memory(MB)", "nodes", "layer"))
+    for layer, total in _ranked(rows, 'layer'):
+        f.write("  %6.2f%% %10.3f %10.2f %8d  %s\n" % (100. * total['time'] / total_time, total['time'],
+                                                     total['bytes'] / 1024. / 1024., total['nodes'], layer))
+
+    f.write("\nTime by op type:\n")
+    f.write("  %7s %10s %8s %8s  %s\n" % ("<%>", "time(s)", "calls", "nodes", "op"))
+    for op, total in _ranked(rows, 'op')[:top]:
+        f.write("  %6.2f%% %10.3f %8d %8d  %s\n" % (100. * total['time'] / total_time, total['time'],
+                                                  total['calls'], total['nodes'], op))
+
+    f.write("\nTop %d apply nodes:\n" % top)
+    for row in sorted(rows, key=lambda row: -row['time'])[:top]:
+        f.write("  %6.2f%% %10.3fs %10.2fMB  %s  [%s]  %s\n      %s\n" % (
+            100. * row['time'] / total_time, row['time'], row['bytes'] / 1024. / 1024., row['layer'],
+            row['function'], row['site'], row['node'][:200]))
+
+    if theano_summary:
+        for name, profile in profiles.items():
+            f.write("\n\nTheano profile of " + name + "\n")
+            f.flush()
+            _with_profile_memory(profile.summary, file=f, n_ops_to_print=top, n_apply_to_print=top)
+    f.close()
+    return rows
+
+
+def quick_profile_stats(name):
+    return theano.compile.ProfileStats(atexit_print=False, message=name)
+
+
+def _with_profile_memory(func, *args, **kwargs):
+    # theano.config.profile_memory is process wide, it is only set for the duration of the call
+    previous = theano.config.profile_memory
+    theano.config.profile_memory = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        theano.config.profile_memory = previous
+
+
+class MemoryProfiledFunction(object):
+    """
+    theano function compiled and called with memory profiling into `profile`, the functions compiled elsewhere
+    in the process do not pay for it
+    """
+    def __init__(self, profile, **kwargs):
+        self.profile = profile
+        self.function = _with_profile_memory(theano.function, profile=profile, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        return _with_profile_memory(self.function, *args, **kwargs)
@@ -1,13 +1,19 @@
 __author__ = 'zhenyang'
 
+import os
 import numpy
 import logging
 import theano
 import theano.tensor as TT
 import cPickle
+import collections
+import time
 
 from scipy import stats
 from sparnn.utils import *
+from sparnn.models.weights import model_spec, build_from_spec, model_weights, set_model_weights, \
+    read_weights, write_weights
+from sparnn.models.profiling import quick_profile_stats, write_profile_report, MemoryProfiledFunction
 import sys
 
 sys.setrecursionlimit(15000)
@@ -20,6 +26,10 @@ In VideoModel,
 middle_layers is a list
 cost_layer is a layer that stores the optimizing target
 outputs, errors are all lists, with format [{"name":string, "value":tensor}]
+function_cache_dir (optional) is a directory of compiled theano functions reused across jobs, see
+quick_cached_function; gradients are only built on their first use and the cost, output, error and evaluation
+functions are LazyFunction placeholders compiled on their first call
+inference_only (optional) models never build gradients, e.g. a job that only needs the "probability" output
 
 '''
 
@@ -34,16 +44,17 @@ class VideoModel(object):
         self.errors = model_param.get('errors', None)
         self.name = model_param["name"]
         self.problem_type = model_param["problem_type"]
+        self.function_cache_dir = model_param.get("function_cache_dir", None)
+        self.inference_only = model_param.get("inference_only", False)
         self.mode = "train"
         self.param = []
         for layer in self.middle_layers:
             self.param += layer.param
         self.param += self.cost_layer.param
         self.set_mode(self.mode)
-        self.grad = self.get_grad()
-        self.cost_func = self.get_cost_func()
-        self.output_func_dict = self.get_output_func_dict()
-        self.error_func_dict = self.get_error_func_dict()
+        self.grads = None
+        self.profiles = None
+        self.build_functions()
 
     @staticmethod
     def save(model, path):
@@ -52,28 +63,88 @@ class VideoModel(object):
         f.close()
 
     @staticmethod
-    def load(path):
+    def save_weights(model, path):
+        # parameters by name plus the architecture spec, .npz or .h5/.hdf5 (see sparnn.models.weights)
+        write_weights(path, model_weights(model), model_spec(model))
+
+    @staticmethod
+    def load_weights(path, model=None, mmap=False, **model_param):
+        # without a model, the layers are rebuilt from the architecture spec stored in the file,
+        # model_param (e.g. function_cache_dir, inference_only) overrides the stored model parameters
+        logger.info("Loading Weights From " + path)
+        arrays, spec = read_weights(path, mmap)
+        if model is None:
+            model = build_from_spec(spec, VideoModel, **model_param)
+        set_model_weights(model, arrays)
+        return model
+
+    @staticmethod
+    def load(path, function_cache_dir=None, inference_only=False):
         logger.info("Loading Model From " + path)
         f = open(path, 'rb')
         model = cPickle.load(f)
         f.close()
+        if function_cache_dir is not None:
+            model.function_cache_dir = function_cache_dir
+        model.inference_only = inference_only
         return model
 
     def __getstate__(self):
         state = dict(self.__dict__)
-        del state['grad']
-        del state['cost_func']
-        del state['output_func_dict']
-        del state['error_func_dict']
+        for name in ['grads', 'cost_func', 'output_func_dict', 'error_func_dict', 'eval_func']:
+            del state[name]
+        state['profiles'] = None
         return state
 
     def __setstate__(self, d):
+        self.function_cache_dir = None
+        self.inference_only = False
+        self.profiles = None
         self.__dict__.update(d)
-        logger.info("Rebuilding Cost Function, Output Functions and Error Functions")
-        self.grad = self.get_grad()
+        self.grads = None
+        self.build_functions()
+
+    def build_functions(self):
+        # placeholders only, every function is compiled on its first call (see LazyFunction)
         self.cost_func = self.get_cost_func()
         self.output_func_dict = self.get_output_func_dict()
         self.error_func_dict = self.get_error_func_dict()
+        self.eval_func = self.get_eval_func()
+
+    def compile_function(self, name, inputs, outputs, updates=None, givens=None):
+        # functions are reused from the function cache, or compiled with a ProfileStats when profiling
+        start = time.time()
+        if self.profiles is not None:
+            self.profiles[name] = quick_profile_stats(self.name + " " + name)
+            ret = MemoryProfiledFunction(self.profiles[name], inputs=inputs, outputs=outputs, updates=updates,
+                                         givens=givens, on_unused_input='warn')
+        else:
+            ret = quick_cached_function(inputs=inputs, outputs=outputs, updates=updates, givens=givens,
+                                        cache_dir=self.function_cache_dir, on_unused_input='warn')
+        logger.info("Built " + name + " of " + self.name + " Time Spent: " + str(time.time() - start))
+        return ret
+
+    def enable_profiling(self):
+        """
+        Functions built from now on (the lazily built ones are dropped) are profiled, see write_profile_report
+        """
+        self.profiles = collections.OrderedDict()
+        self.build_functions()
+
+    def write_profile_report(self, path, top=30):
+        write_profile_report(self, self.profiles, path, top)
+        logger.info("Profile Report of " + self.name + " Saved to " + os.path.abspath(path))
+
+    @property
+    def grad(self):
+        # the gradients are only differentiated on first access
+        if self.inference_only:
+            raise RuntimeError(self.name + " is built in inference_only mode and has no gradients")
+        if self.grads is None:
+            start = time.time()
+            self.grads = self.get_grad()
+            logger.info("Built gradients of " + self.name + " Time Spent: " + str(time.time() - start))
+        return self.grads
 
     def set_mode(self, mode):
         self.mode = mode
@@ -86,35 +157,53 @@ class VideoModel(object):
 
     # TODO Add Updates
     def get_cost_func(self):
-        return theano.function(inputs=self.interface_layer.symbols(), outputs=self.cost_layer.output,
-                               on_unused_input='warn')
+        return self.get_lazy_function('cost function', self.cost_layer.output)
 
-    def get_update_func(self, updates, other_param_list):
+    def get_inner_updates(self):
         inner_updates = []
         for layer in self.middle_layers:
             if layer.output_update is not None:
                 #print 'Layer updates not None', str(layer.output_update)
                 inner_updates += layer.output_update
-        return theano.function(inputs=self.interface_layer.symbols() + other_param_list,
-                               outputs=self.cost_layer.output, updates=updates + inner_updates,
-                               on_unused_input='warn')
+        return inner_updates
+
+    def get_update_func(self, updates, other_param_list, extra_outputs=None, givens=None):
+        # with extra_outputs (e.g. gradient norms) the function returns [cost] + extra_outputs, givens replace
+        # the parameters (e.g. by views of a flat parameter vector)
+        outputs = self.cost_layer.output if extra_outputs is None else [self.cost_layer.output] + extra_outputs
+        return self.compile_function('update function', self.interface_layer.symbols() + other_param_list,
+                                     outputs, updates + self.get_inner_updates(), givens)
 
     # TODO Add Updates and need future revision
     def get_output_func_dict(self):
         if self.outputs is None:
             return {}
         else:
-            return {output['name']: theano.function(inputs=self.interface_layer.symbols(), outputs=output["value"],
-                                                    on_unused_input='warn') for output in self.outputs}
+            return {output['name']: self.get_lazy_function('output function ' + str(output['name']),
+                                                           output["value"]) for output in self.outputs}
 
     # TODO Add Updates
     def get_error_func_dict(self):
         if self.errors is None:
             return {}
         else:
-            return {error['name']: theano.function(inputs=self.interface_layer.symbols(), outputs=error['value'],
-                                                   on_unused_input='warn')
-                    for error in self.errors}
+            return {error['name']: self.get_lazy_function('error function ' + str(error['name']),
+                                                          error['value']) for error in self.errors}
+
+    def eval_outputs(self):
+        # the "probability" output (when there is one) is aggregated into accuracy statistics by evaluate
+        ret = [self.cost_layer.output]
+        if self.errors is not None:
+            ret += [error['value'] for error in self.errors]
+        if self.outputs is not None:
+            ret += [output['value'] for output in self.outputs if output['name'] == 'probability']
+        return ret
+
+    def get_eval_func(self):
+        return self.get_lazy_function('evaluation function', self.eval_outputs())
+
+    def get_lazy_function(self, name, value):
+        return LazyFunction(lambda: self.compile_function(name, self.interface_layer.symbols(), value))
 
     def get_cost(self, data_iterator):
         ret = 0
@@ -131,20 +220,7 @@ class VideoModel(object):
 
     def get_error_dict(self, data_iterator):
         if len(self.error_func_dict) > 0:
-            l = {}
-            for key in self.error_func_dict:
-                ret = 0
-                old_mode = self.mode
-                self.set_mode('predict')
-                data_iterator.begin(do_shuffle=False)
-                while True:
-                    ret += self.error_func_dict[key](*(data_iterator.get_batch()))
-                    data_iterator.next()
-                    if data_iterator.no_batch_left():
-                        break
-                self.set_mode(old_mode)
-                l['key'] = ret / (data_iterator.total()*data_iterator.num_segments)
-            return l
+            return self.evaluate(data_iterator)['errors']
         #else: # disable, since only for binary predictions
             #error = 0
             #old_mode = self.mode
@@ -218,35 +294,65 @@ class VideoModel(object):
     #    return (truth==pred).mean()
 
     def get_acc(self, data_iterator):
-        probs = numpy.zeros((data_iterator.total()*data_iterator.num_segments,)+tuple(data_iterator.label_dims)).astype(theano.config.floatX)
+        return self.get_acc_stats(data_iterator)['top1']
+
+    def get_acc_stats(self, data_iterator, top_k=5):
+        """
+        Video level top-1 and top-k accuracy and confusion matrix (truth x prediction) in one pass,
+        the probabilities of the segments of each video are averaged as the batches arrive.
+        """
+        avg_probs = numpy.zeros((data_iterator.total(),)+tuple(data_iterator.label_dims)).astype(theano.config.floatX)
         old_mode = self.mode
         self.set_mode('predict')
         data_iterator.begin(do_shuffle=False)
-        start_idx = 0
         while True:
             output = self.output_func_dict['probability'](*(data_iterator.get_batch()))
-            prob = numpy.sum(output[-self.last_n:, :, :], axis=0) # (TS,BS,#actions) -> (BS,#actions)
-            num_examples = data_iterator.current_batch_size*data_iterator.num_segments
-            probs[start_idx:start_idx+num_examples,:] = prob[:num_examples,:]
+            self.accumulate_video_probs(avg_probs, output, data_iterator)
             data_iterator.next()
-            start_idx += num_examples
             if data_iterator.no_batch_left():
                 break
         self.set_mode(old_mode)
+        return quick_classification_stats(avg_probs, numpy.asarray(data_iterator.labels), top_k)
 
-        avg_probs = numpy.zeros((data_iterator.total(),)+tuple(data_iterator.label_dims)).astype(theano.config.floatX)
-        for i in xrange(data_iterator.total()):
-            avg_probs[i, :] = numpy.mean(probs[i*data_iterator.num_segments:(i+1)*data_iterator.num_segments, :], axis=0)
-        pred = numpy.argmax(avg_probs, axis=1) # (#videos,#actions) -> (#videos,)
+    def accumulate_video_probs(self, avg_probs, output, data_iterator):
+        prob = numpy.sum(output[-self.last_n:, :, :], axis=0) # (TS,BS,#actions) -> (BS,#actions)
+        num_examples = data_iterator.current_batch_size*data_iterator.num_segments
+        # rows of a video are contiguous, (BS*#segments,#actions) -> (BS,#segments,#actions) -> (BS,#actions)
+        avg_probs[data_iterator.current_batch_indices] = prob[:num_examples].reshape(
+            (data_iterator.current_batch_size, data_iterator.num_segments, -1)).mean(axis=1)
 
-        f = open(data_iterator.labels_file,'r')
-        lines = f.readlines()
-        f.close()
-        truth = numpy.zeros(len(lines)).astype('int64')
-        for i in xrange(len(lines)):
-            s=lines[i][0:-1]
-            truth[i] = int(s)
-        return (truth==pred).mean()
+    def evaluate(self, data_iterator, top_k=5):
+        """
+        Cost, every error function and (with a "probability" output) the get_acc_stats statistics,
+        computed by one compiled function in a single pass over the iterator.
+        Returns {'cost': float, 'errors': {name: float}, 'top1': ..., 'top5': ..., 'confusion': ...}
+        """
+        error_names = [error['name'] for error in self.errors] if self.errors is not None else []
+        has_probability = len(self.eval_outputs()) > 1 + len(error_names)
+        if has_probability:
+            avg_probs = numpy.zeros((data_iterator.total(),)+tuple(data_iterator.label_dims)).astype(
+                theano.config.floatX)
+        sums = numpy.zeros((1 + len(error_names),))
+        old_mode = self.mode
+        self.set_mode('predict')
+        data_iterator.begin(do_shuffle=False)
+        while True:
+            results = self.eval_func(*(data_iterator.get_batch()))
+            sums += [numpy.sum(r) for r in results[:1 + len(error_names)]]
+            if has_probability:
+                self.accumulate_video_probs(avg_probs, results[-1], data_iterator)
+            data_iterator.next()
+            if data_iterator.no_batch_left():
+                break
+        self.set_mode(old_mode)
+        sums /= (data_iterator.total()*data_iterator.num_segments)
+        ret = {'cost': sums[0], 'errors': dict(zip(error_names, sums[1:]))}
+        if has_probability:
+            ret.update(quick_classification_stats(avg_probs, numpy.asarray(data_iterator.labels), top_k))
+        return ret
+
+    def get_stream_predictor(self, output_name='probability'):
+        return VideoStreamPredictor(self, output_name)
 
     def get_mAP(self, data_iterator):
         ret = 0
@@ -266,6 +372,8 @@ class VideoModel(object):
             layer.print_stat()
         self.cost_layer.print_stat()
         logger.info("The Total Model Param is " + str(self.total_param_num()))
+        logger.info("Function Cache Directory: " + str(self.function_cache_dir))
+        logger.info("Inference Only: " + str(self.inference_only))
         if self.outputs is not None:
             logger.info("Output List:")
             for output in self.outputs:
@@ -274,3 +382,77 @@ class VideoModel(object):
             logger.info("Error List:")
             for error in self.errors:
                 logger.info("   name: " + error['name'] + ", value: " + str(error['value']))
+
+
+class VideoStreamPredictor(object):
+    """
+        Incremental inference of a VideoModel, one frame at a time.
+        The recurrent layer is advanced with its single step function, so the work per new frame is constant
+        instead of re-running the whole n_steps graph over a sliding window.
+        Like VideoModel.get_acc, the returned score is the sum of the outputs over the last `last_n` frames.
+        Only models with a single recurrent layer fed directly by the interface layer are supported.
+        Initial states computed from the whole clip (e.g. the x.mean(0) initialization of the UCF101 models)
+        need that clip: reset(*clip) computes them exactly as the batch model does, so that pushing the frames
+        of the clip reproduces its batch outputs. Without a clip they are computed from the first pushed frame
+        alone, an approximation of the batch predictions.
+    """
+    def __init__(self, model, output_name='probability'):
+        self.model = model
+        self.output_name = output_name
+        self.last_n = model.last_n
+        recurrent_layers = [layer for layer in model.middle_layers if layer.is_recurrent]
+        assert 1 == len(recurrent_layers), "streaming needs exactly one recurrent layer"
+        self.layer = recurrent_layers[0]
+        sequences = self.layer.step_sequences()
+        interface_inputs = model.interface_layer.input_symbols()
+        if hasattr(model.interface_layer, 'context_symbols'):
+            interface_inputs += model.interface_layer.context_symbols()
+        assert all(any(seq is sym for sym in interface_inputs) for seq in sequences), \
+            "the recurrent layer must read the interface layer inputs directly"
+        output = [o['value'] for o in model.outputs if o['name'] == output_name]
+        assert 1 == len(output), "unknown output " + str(output_name)
+
+        step_input = [quick_symbolic_variable(seq.ndim - 1, self.layer._s("stream_input_%d" % i), seq.dtype)
+                      for i, seq in enumerate(sequences)]
+        prev_states = [quick_symbolic_variable(s.ndim, self.layer._s("stream_state_%d" % i))
+                       for i, s in enumerate(self.layer.init_states())]
+        new_states = self.layer.step_states(step_input, prev_states)
+        # the layers above the recurrent one work step-wise, so feed them a sequence of length one
+        step_output = theano.clone(output[0], replace={self.layer.output: TT.shape_padleft(new_states[0])})[0]
+        init_states = theano.clone(list(self.layer.init_states()),
+                                   replace=dict(zip(sequences, [TT.shape_padleft(x) for x in step_input])))
+        givens = [(layer.is_train, TT.constant(numpy_floatX(0.))) for layer in model.middle_layers]
+        logger.info("Building Stream Functions For " + self.layer.name)
+        self.init_func = theano.function(inputs=step_input, outputs=init_states, givens=givens,
+                                         on_unused_input='ignore')
+        self.clip_init_func = theano.function(inputs=sequences, outputs=list(self.layer.init_states()),
+                                              givens=givens, on_unused_input='ignore')
+        self.step_func = theano.function(inputs=step_input + prev_states, outputs=[step_output] + new_states,
+                                         givens=givens, on_unused_input='ignore')
+        self.reset()
+
+    def reset(self, *clip):
+        """
+        clip (optional): the warm-up clip of the input (and of the context for stacked models), shape
+        (Timestep, Minibatch) + FeatureDim, the initial states are computed from it
+        """
+        self.states = self.clip_init_func(*[numpy.asarray(c) for c in clip]) if len(clip) > 0 else None
+        self.history = collections.deque()
+        self.score = None
+
+    def push(self, *frames):
+        """
+        frames: one frame of the input (and of the context for stacked models), shape (Minibatch,) + FeatureDim
+        Returns the summed output over the last `last_n` frames, shape (Minibatch, #outputs)
+        """
+        frames = [numpy.asarray(frame) for frame in frames]
+        if self.states is None:
+            # no warm-up clip, the initial states only see the first frame
+            self.states = self.init_func(*frames)
+        ret = self.step_func(*(frames + list(self.states)))
+        output, self.states = ret[0], ret[1:]
+        self.history.append(output)
+        self.score = output.copy() if self.score is None else self.score + output
+        if len(self.history) > self.last_n:
+            self.score -= self.history.popleft()
+        return self.score
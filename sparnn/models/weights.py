@@ -0,0 +1,310 @@
+__author__ = 'zhenyang'
+
+import os
+import re
+import json
+import base64
+import struct
+import cPickle
+import zipfile
+import logging
+import tempfile
+import numpy
+import h5py
+import theano
+from theano.sandbox.rng_mrg import MRG_RandomStreams as RandomStreams
+
+import sparnn.layers
+from sparnn.utils import *
+
+logger = logging.getLogger(__name__)
+
+'''
+Weights-only model format
+
+A checkpoint is a single .npz (or .h5/.hdf5) file holding every parameter of the model by its (unique) name,
+plus a small json architecture spec (key "__spec__" in npz, attribute "spec" in HDF5), instead of the pickled
+symbolic graph.
+
+The spec lists the class and the layer_param of the interface layer, every middle layer and the cost layer.
+Symbolic values in layer_param are stored by reference when they are an attribute of the interface layer or
+of an earlier layer (e.g. "layer:0.output"), otherwise the small expression in between (e.g. x.shape[1] or
+x.mean(0)) is pickled with the references cut out. Random generators are recreated, the weights are loaded
+afterwards anyway.
+
+The format is therefore only portable for models whose layer_param are plain data and references: a spec
+holding "__expr__" entries (every UCF101 model, through x.shape[1] and x.mean(0)) still needs cPickle and a
+Theano version that can unpickle those expressions. The weight arrays themselves never do; with a differing
+Theano, rebuild the model from its script and pass it to VideoModel.load_weights(path, model).
+
+Files are written to a temporary file in the target directory and renamed, so a crash during an autosave
+never leaves a truncated checkpoint. With mmap=True the weight arrays are copy-on-write memory maps of the
+file (the npz is stored uncompressed) instead of being read up front.
+
+'''
+
+SPEC_VERSION = 1
+
+
+def _is_hdf5(path):
+    return os.path.splitext(path)[1].lower() in ('.h5', '.hdf5')
+
+
+def _layer_refs(prefix, layer):
+    return [(prefix + "." + attr, value) for attr, value in sorted(vars(layer).items())
+            if isinstance(value, theano.Variable)]
+
+
+def _encode(value, refs, layers):
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+    if isinstance(value, (numpy.integer, numpy.floating)):
+        return value.item()
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v, refs, layers) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v, refs, layers) for v in value]
+    if isinstance(value, dict):
+        return {"__dict__": dict((k, _encode(v, refs, layers)) for k, v in value.items())}
+    if isinstance(value, numpy.random.RandomState):
+        return {"__npy_rng__": None}
+    if isinstance(value, RandomStreams):
+        return {"__theano_rng__": None}
+    if isinstance(value, numpy.ndarray):
+        return {"__array__": value.tolist(), "dtype": str(value.dtype)}
+    for i, layer in enumerate(layers):
+        if value is layer:
+            return {"__layer__": i}
+    if isinstance(value, theano.Variable):
+        keys = dict((id(var), key) for key, var in refs)
+        if id(value) in keys:
+            return {"__ref__": keys[id(value)]}
+        blockers = [var for key, var in refs]
+        used = [var for var in theano.gof.graph.ancestors([value], blockers=blockers) if id(var) in keys]
+        placeholders = [var.type() for var in used]
+        expr = theano.clone(value, replace=dict(zip(used, placeholders)))
+        return {"__expr__": base64.b64encode(cPickle.dumps((expr, placeholders), cPickle.HIGHEST_PROTOCOL)),
+                "refs": [keys[id(var)] for var in used]}
+    raise ValueError("Cannot describe layer parameter of type " + str(type(value)))
+
+
+def _decode(value, refs, layers, rng, theano_rng):
+    if isinstance(value, unicode):
+        return str(value)
+    if isinstance(value, list):
+        return [_decode(v, refs, layers, rng, theano_rng) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "__tuple__" in value:
+        return tuple(_decode(v, refs, layers, rng, theano_rng) for v in value["__tuple__"])
+    if "__dict__" in value:
+        return dict((str(k), _decode(v, refs, layers, rng, theano_rng)) for k, v in value["__dict__"].items())
+    if "__npy_rng__" in value:
+        return rng
+    if "__theano_rng__" in value:
+        return theano_rng
+    if "__array__" in value:
+        return numpy.asarray(value["__array__"], dtype=value["dtype"])
+    if "__layer__" in value:
+        return layers[value["__layer__"]]
+    if "__ref__" in value:
+        return refs[value["__ref__"]]
+    if "__expr__" in value:
+        expr, placeholders = cPickle.loads(base64.b64decode(value["__expr__"]))
+        return theano.clone(expr, replace=dict(zip(placeholders, [refs[key] for key in value["refs"]])))
+    raise ValueError("Unknown layer parameter description " + str(value))
+
+
+def model_spec(model):
+    """
+    Architecture spec of a VideoModel, the layers need to keep their layer_param
+    """
+    interface_layer = model.interface_layer
+    refs = _layer_refs("interface", interface_layer)
+    spec = {"version": SPEC_VERSION,
+            "interface_layer": {"class": interface_layer.__class__.__name__,
+                                "param": _encode(interface_layer.layer_param, [], [])},
+            "middle_layers": []}
+    for i, layer in enumerate(model.middle_layers):
+        spec["middle_layers"].append({"class": layer.__class__.__name__,
+                                      "param": _encode(layer.layer_param, refs, model.middle_layers[:i])})
+        refs += _layer_refs("layer:%d" % i, layer)
+    spec["cost_layer"] = {"class": model.cost_layer.__class__.__name__,
+                          "param": _encode(model.cost_layer.layer_param, refs, model.middle_layers)}
+    refs += _layer_refs("cost", model.cost_layer)
+    spec["model"] = {"name": model.name, "last_n": model.last_n, "problem_type": model.problem_type,
+                     "outputs": _encode(model.outputs, refs, model.middle_layers),
+                     "errors": _encode(model.errors, refs, model.middle_layers)}
+    return spec
+
+
+def build_from_spec(spec, model_class, seed=1000, **model_param):
+    """
+    Rebuild the layers and the model described by model_spec, the parameters keep their random initialization
+    """
+    assert spec["version"] == SPEC_VERSION
+    rng = quick_npy_rng(seed)
+    theano_rng = quick_theano_rng(rng)
+    interface_param = _decode(spec["interface_layer"]["param"], {}, [], rng, theano_rng)
+    interface_layer = getattr(sparnn.layers, spec["interface_layer"]["class"])(interface_param)
+    refs = dict(_layer_refs("interface", interface_layer))
+    middle_layers = []
+    for i, layer_spec in enumerate(spec["middle_layers"]):
+        layer_param = _decode(layer_spec["param"], refs, middle_layers, rng, theano_rng)
+        middle_layers.append(getattr(sparnn.layers, layer_spec["class"])(layer_param))
+        refs.update(_layer_refs("layer:%d" % i, middle_layers[-1]))
+    cost_param = _decode(spec["cost_layer"]["param"], refs, middle_layers, rng, theano_rng)
+    cost_layer = getattr(sparnn.layers, spec["cost_layer"]["class"])(cost_param)
+    refs.update(_layer_refs("cost", cost_layer))
+    param = dict((str(key), _decode(value, refs, middle_layers, rng, theano_rng))
+                 for key, value in spec["model"].items())
+    param.update({'interface_layer': interface_layer, 'middle_layers': middle_layers, 'cost_layer': cost_layer})
+    param.update(model_param)
+    return model_class(param)
+
+
+def _atomic_write(path, write_func):
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    os.close(fd)
+    try:
+        write_func(tmp_path)
+        os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_weights(path, arrays, spec):
+    if _is_hdf5(path):
+        def write_func(tmp_path):
+            f = h5py.File(tmp_path, 'w')
+            for name, value in arrays.items():
+                f.create_dataset(name, data=value)
+            f.attrs['spec'] = json.dumps(spec)
+            f.close()
+    else:
+        def write_func(tmp_path):
+            f = open(tmp_path, 'wb')
+            numpy.savez(f, __spec__=numpy.array(json.dumps(spec)), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+    _atomic_write(path, write_func)
+
+
+def _npz_memmap(path):
+    # members of an uncompressed npz are plain .npy files, map their data in place
+    ret = {}
+    zf = zipfile.ZipFile(path)
+    f = open(path, 'rb')
+    for info in zf.infolist():
+        name = info.filename[:-len(".npy")]
+        if name == "__spec__":
+            continue
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = numpy.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+        if info.compress_type != zipfile.ZIP_STORED or dtype.hasobject or len(shape) == 0:
+            ret[name] = numpy.load(zf.open(info))
+        else:
+            ret[name] = numpy.memmap(path, dtype=dtype, mode='c', offset=f.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    f.close()
+    zf.close()
+    return ret
+
+
+def read_weights(path, mmap=False):
+    """
+    Returns (arrays, spec)
+    """
+    if _is_hdf5(path):
+        arrays = {}
+        f = h5py.File(path, 'r')
+        spec = json.loads(f.attrs['spec'])
+        for name, dataset in f.items():
+            offset = dataset.id.get_offset()
+            if mmap and offset is not None and dataset.chunks is None and dataset.compression is None:
+                arrays[name] = numpy.memmap(path, dtype=dataset.dtype, mode='c', offset=offset, shape=dataset.shape)
+            else:
+                arrays[name] = dataset[...]
+        f.close()
+    else:
+        npz = numpy.load(path)
+        spec = json.loads(str(npz["__spec__"]))
+        if mmap:
+            arrays = _npz_memmap(path)
+        else:
+            arrays = dict((name, npz[name]) for name in npz.files if name != "__spec__")
+        npz.close()
+    return arrays, spec
+
+
+def model_weights(model):
+    arrays = {}
+    for p in model.param:
+        assert p.name not in arrays, "Parameter names must be unique to be saved by name: " + str(p.name)
+        arrays[p.name] = p.get_value(borrow=True)
+    return arrays
+
+
+def set_model_weights(model, arrays):
+    for p in model.param:
+        if p.name not in arrays:
+            raise KeyError("Parameter " + str(p.name) + " of " + model.name + " not found in checkpoint")
+        value = numpy.asarray(arrays[p.name], dtype=p.dtype)
+        if value.shape != p.get_value(borrow=True).shape:
+            raise ValueError("Parameter " + p.name + " has shape " + str(value.shape) + " in checkpoint, expected "
+                             + str(p.get_value(borrow=True).shape))
+        p.set_value(value, borrow=True)
+
+
+def transplant_weights(dst_arrays, src_arrays, rules):
+    r"""
+    Copy parameters of src_arrays into dst_arrays (both {name: array}) by name.
+    rules is a list of (pattern, replacement) regular expressions applied to the source names with re.sub, e.g.
+    (r"^ConvLSTMLayer-0\.(W|b)_(\w+)$", r"DeepCondConvLSTMLayer-4.\1_infer_\2") maps W_xi to W_infer_xi.
+    Every rule has to match at least one source parameter, shapes are checked. Returns [(src_name, dst_name)].
+    """
+    copied = []
+    for pattern, replacement in rules:
+        matched = False
+        for src_name in sorted(src_arrays):
+            if re.match(pattern, src_name) is None:
+                continue
+            matched = True
+            dst_name = re.sub(pattern, replacement, src_name)
+            if dst_name not in dst_arrays:
+                raise KeyError("Parameter " + dst_name + " (from " + src_name + ") not found in destination")
+            if src_arrays[src_name].shape != dst_arrays[dst_name].shape:
+                raise ValueError("Cannot copy " + src_name + " " + str(src_arrays[src_name].shape) + " to " +
+                                 dst_name + " " + str(dst_arrays[dst_name].shape))
+            dst_arrays[dst_name] = src_arrays[src_name]
+            copied.append((src_name, dst_name))
+            logger.info("   " + src_name + " -> " + dst_name + " " + str(src_arrays[src_name].shape))
+        if not matched:
+            raise KeyError("Transplant rule " + pattern + " matches no source parameter")
+    return copied
+
+
+def transplant_checkpoints(dst_path, sources, save_path):
+    """
+    Assemble a weights-only checkpoint without building any layer or theano function:
+    the parameters of dst_path are overwritten following each (src_path, rules) of sources (see transplant_weights)
+    and the result, with the architecture spec of dst_path, is written to save_path.
+    """
+    dst_arrays, spec = read_weights(dst_path, mmap=True)
+    for src_path, rules in sources:
+        logger.info("Transplanting From " + src_path)
+        src_arrays, src_spec = read_weights(src_path, mmap=True)
+        transplant_weights(dst_arrays, src_arrays, rules)
+    write_weights(save_path, dst_arrays, spec)
+    logger.info("Assembled Checkpoint Saved to " + os.path.abspath(save_path))
@@ -2,6 +2,7 @@ __author__ = 'zhenyang'
 from optimizer import Optimizer
 from sgd import SGD
 from adadelta import AdaDelta
+from adagrad import AdaGrad
 from rmsprop import RMSProp
 from adam import Adam
 from adamopt import AdamOpt
@@ -30,7 +30,7 @@ class Adam(Optimizer):
     def set_name(self):
         self.name = "Adam-" + self.id
 
-    def get_update_func(self):
+    def get_updates(self):
         updates = []
         lr = TT.scalar(self._s("learning_rate"), dtype=theano.config.floatX)
         b1 = TT.scalar(self._s("beta1"), dtype=theano.config.floatX)
@@ -40,11 +40,11 @@ class Adam(Optimizer):
         t = self.time + 1.
         lr_t = lr * TT.sqrt(1. - b2**t) / (1. - b1**t)
 
-        self.m_list = [theano.shared(p.get_value() * numpy_floatX(0.), name="%s.m" % p.name) for p in self.model.param]
-        self.v_list = [theano.shared(p.get_value() * numpy_floatX(0.), name="%s.v" % p.name) for p in self.model.param]
+        self.m_list = [theano.shared(p.get_value() * numpy_floatX(0.), name="%s.m" % p.name) for p in self.param]
+        self.v_list = [theano.shared(p.get_value() * numpy_floatX(0.), name="%s.v" % p.name) for p in self.param]
         m_t_list = [(b1 * m) + (1. - b1) * g for g, m in zip(self.grad, self.m_list)]
         v_t_list = [(b2 * v) + (1. - b2) * TT.sqr(g) for g, v in zip(self.grad, self.v_list)]
-        updates += [(p, p - lr_t * m_t / (TT.sqrt(v_t) + eps)) for p, m_t, v_t in zip(self.model.param, m_t_list, v_t_list)]
+        updates += [(p, p - lr_t * m_t / (TT.sqrt(v_t) + eps)) for p, m_t, v_t in zip(self.param, m_t_list, v_t_list)]
         updates += [(m, m_t) for m, m_t in zip(self.m_list, m_t_list)]
         updates += [(v, v_t) for v, v_t in zip(self.v_list, v_t_list)]
         updates += [(self.time, t)]
@@ -60,10 +60,10 @@ class Adam(Optimizer):
         #    updates.append((p, p_t))
         #updates.append((self.time, self.time+1.))
 
-        return self.model.get_update_func(updates, [lr, b1, b2])
+        return updates, [lr, b1, b2]
 
     def learning_param(self):
-        return [self.learning_rate, self.beta1, self.beta2]
+        return [self.scheduled(self.learning_rate), self.beta1, self.beta2]
 
     def print_stat(self):
         super(Adam, self).print_stat()
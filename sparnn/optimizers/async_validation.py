@@ -0,0 +1,87 @@
+__author__ = 'zhenyang'
+
+import time
+import Queue
+import logging
+import traceback
+import collections
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+'''
+Asynchronous validation
+
+The worker is forked from the training process, so it owns a copy of the model and of the validation
+iterator. It compiles the evaluation function once, then evaluates every parameter snapshot it receives
+while the training process goes on. The training process keeps each snapshot until its result arrives,
+so that the "best" checkpoint is the validated parameters and not the current ones.
+
+Note that a forked worker cannot share a GPU context with its parent, use it with the CPU backend
+(or a device set for the worker before theano is imported).
+
+'''
+
+
+class AsyncValidator(object):
+    def __init__(self, model, data_iterator):
+        self.model = model
+        self.data_iterator = data_iterator
+        self.requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.snapshots = collections.OrderedDict()
+        self.process = multiprocessing.Process(target=self.run_worker, name="validation-worker")
+        self.process.daemon = True
+        self.process.start()
+        logger.info("Started Validation Worker, pid " + str(self.process.pid))
+
+    def run_worker(self):
+        start = time.time()
+        self.model.eval_func.compiled()
+        logger.info("Validation Worker Ready, Time Spent: " + str(time.time() - start))
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            key, values = request
+            try:
+                for p, value in zip(self.model.param, values):
+                    p.set_value(value, borrow=True)
+                start = time.time()
+                stats = self.model.evaluate(self.data_iterator)
+                stats['time'] = time.time() - start
+            except Exception:
+                stats = {'exception': traceback.format_exc()}
+            self.results.put((key, stats))
+
+    def submit(self, key):
+        values = [p.get_value() for p in self.model.param]
+        self.snapshots[key] = values
+        self.requests.put((key, values))
+
+    def pending(self):
+        return len(self.snapshots)
+
+    def poll(self, block=False):
+        """
+        Returns the [(key, snapshot, stats)] that arrived, with block=True waits for every pending snapshot
+        """
+        ret = []
+        while len(self.snapshots) > 0:
+            try:
+                key, stats = self.results.get(timeout=1.0) if block else self.results.get_nowait()
+            except Queue.Empty:
+                if block and self.process.is_alive():
+                    continue
+                if block:
+                    raise RuntimeError("Validation worker exited with " + str(len(self.snapshots)) +
+                                       " pending snapshots")
+                break
+            if 'exception' in stats:
+                raise RuntimeError("Validation worker failed:\n" + stats['exception'])
+            ret.append((key, self.snapshots.pop(key), stats))
+        return ret
+
+    def close(self):
+        self.requests.put(None)
+        self.process.join()
@@ -0,0 +1,91 @@
+__author__ = 'zhenyang'
+
+import os
+import glob
+import Queue
+import cPickle
+import logging
+import threading
+import traceback
+
+from sparnn.models.weights import _atomic_write
+
+logger = logging.getLogger(__name__)
+
+'''
+Training state checkpoints
+
+A training checkpoint holds everything Optimizer.train needs to continue bit-exactly from the next minibatch:
+the parameters, the other shared variables updated by the training function (optimizer slots such as the
+RMSProp mean squares or the Adam moments, layer states and the random streams of dropout), the counters and
+early stopping state of the optimizer, its mutable learning parameters and the position and random generator
+states of the training iterator.
+
+The state is copied on the training thread, then pickled and written (atomically) by a background thread so
+that training does not wait for the disk. Only the `keep` most recent checkpoints are kept.
+
+'''
+
+
+def checkpoint_path(prefix, uidx):
+    return "%s-checkpoint-%09d.ckpt" % (prefix, uidx)
+
+
+def latest_checkpoint(prefix):
+    paths = sorted(glob.glob(prefix + "-checkpoint-*.ckpt"))
+    return paths[-1] if len(paths) > 0 else None
+
+
+def read_checkpoint(path):
+    f = open(path, 'rb')
+    state = cPickle.load(f)
+    f.close()
+    return state
+
+
+def write_checkpoint(path, state):
+    def write_func(tmp_path):
+        f = open(tmp_path, 'wb')
+        cPickle.dump(state, f, protocol=cPickle.HIGHEST_PROTOCOL)
+        f.close()
+    _atomic_write(path, write_func)
+
+
+class CheckpointWriter(object):
+    def __init__(self, prefix, keep=2):
+        self.prefix = prefix
+        self.keep = keep
+        self.error = None
+        # at most one checkpoint waits for the disk, training blocks rather than piling up copies of the state
+        self.requests = Queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self.run, name="checkpoint-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            path, state = request
+            try:
+                write_checkpoint(path, state)
+                logger.info("....Saved Training Checkpoint to " + os.path.abspath(path))
+                if self.keep is not None:
+                    for old_path in sorted(glob.glob(self.prefix + "-checkpoint-*.ckpt"))[:-self.keep]:
+                        os.remove(old_path)
+            except Exception:
+                self.error = traceback.format_exc()
+
+    def check(self):
+        if self.error is not None:
+            raise RuntimeError("Checkpoint writer failed:\n" + self.error)
+
+    def write(self, uidx, state):
+        self.check()
+        self.requests.put((checkpoint_path(self.prefix, uidx), state))
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+        self.check()
@@ -0,0 +1,244 @@
+__author__ = 'zhenyang'
+
+import numpy
+import atexit
+import select
+import logging
+import traceback
+import multiprocessing
+import theano
+
+from sparnn.utils import *
+
+logger = logging.getLogger(__name__)
+
+'''
+Synchronous data parallel training on local worker processes
+
+DataParallelUpdate replaces the compiled update function of an Optimizer (hyper parameter "num_workers").
+Each call splits the minibatch along the batch axis (axis 1 of every interface symbol) into one shard per
+worker. The workers compute the gradients of the summed cost on their shard with a compiled gradient function,
+the gradients are summed (all-reduce through shared memory) and the optimizer's own update rule (get_updates)
+is applied once on the summed gradients, so for deterministic graphs the result matches the single process update
+up to float rounding. Every worker reseeds the random streams of its copy of the model (dropout), so the shards
+draw independent masks and stochastic graphs only match the single process update in distribution.
+
+Memory layout: the parameters live in one flat shared memory buffer that the workers' shared variables borrow,
+and every worker writes its gradients into its own row of a (num_workers, #params) shared buffer.
+The workers are forked after the gradient function is compiled, so it is compiled once; use the CPU backend
+and preferably OMP_NUM_THREADS=1 so that the workers do not compete for cores. They are started by start()
+(Optimizer.train, or the first call) and stopped by close(), which train() calls even when training fails;
+an optimizer that is never trained forks no worker, and close() also runs at interpreter exit as a backstop.
+
+AsyncParameterServer (hyper parameter "parallel_mode": "async") is the asynchronous variant: the training process
+is the parameter server, every call hands the whole minibatch to an idle worker and the gradients are applied one
+by one as they arrive. A worker pulls (copies) the parameters from the shared buffer when it starts a minibatch, so
+its gradient is `staleness` updates old when it is applied; gradients older than "max_staleness" updates are
+dropped. The pull is not locked against the server writing the buffer (Hogwild style).
+
+'''
+
+
+class DataParallelUpdate(object):
+    def __init__(self, optimizer, num_workers):
+        model = optimizer.model
+        self.params = model.param
+        self.num_workers = num_workers
+        self.num_symbols = len(model.interface_layer.symbols())
+        self.layers = model.middle_layers + [model.cost_layer]
+        self.worker_seeds = quick_npy_rng().randint(1, 2147462579, size=num_workers)
+        self.shapes = [p.get_value(borrow=True).shape for p in self.params]
+        self.offsets = numpy.cumsum([0] + [int(numpy.prod(shape)) for shape in self.shapes])
+        self.last_grad_norm = None
+
+        self.apply_func = optimizer.get_apply_func()
+        self.grad_func = quick_cached_function(inputs=model.interface_layer.symbols(),
+                                               outputs=[model.cost_layer.output] + optimizer.get_model_grad(),
+                                               updates=model.get_inner_updates(),
+                                               cache_dir=model.function_cache_dir,
+                                               on_unused_input='warn')
+
+        dtype = numpy.dtype(theano.config.floatX)
+        ctype = 'f' if dtype == numpy.float32 else 'd'
+        self.param_buffer = numpy.frombuffer(multiprocessing.RawArray(ctype, int(self.offsets[-1])), dtype=dtype)
+        self.grad_buffers = numpy.frombuffer(multiprocessing.RawArray(ctype, int(self.offsets[-1]) * num_workers),
+                                             dtype=dtype).reshape((num_workers, int(self.offsets[-1])))
+        self.flatten([p.get_value(borrow=True) for p in self.params], self.param_buffer)
+
+        self.pipes = []
+        self.processes = []
+        self.exit_handler_registered = False
+
+    def start(self):
+        if len(self.processes) > 0:
+            return
+        for i in xrange(self.num_workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=self.run_worker, args=(i, child_conn),
+                                              name="data-parallel-worker-%d" % i)
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            self.pipes.append(parent_conn)
+            self.processes.append(process)
+        if not self.exit_handler_registered:
+            atexit.register(self.close)
+            self.exit_handler_registered = True
+        logger.info("Started " + str(self.num_workers) + " Data Parallel Workers")
+
+    def sync_params(self, version):
+        """
+        Copies the parameters into the shared buffer after they were set outside the update (e.g. restored from a
+        checkpoint), version is the number of updates they have had
+        """
+        self.flatten([p.get_value(borrow=True) for p in self.params], self.param_buffer)
+
+    def flatten(self, values, buf):
+        for value, begin, end in zip(values, self.offsets[:-1], self.offsets[1:]):
+            buf[begin:end] = value.ravel()
+
+    def unflatten(self, buf):
+        return [buf[begin:end].reshape(shape) for shape, begin, end in zip(self.shapes, self.offsets[:-1],
+                                                                           self.offsets[1:])]
+
+    def bind_worker_params(self):
+        # the worker reads the parameters in place, they are only written by the coordinator between two calls
+        for p, value in zip(self.params, self.unflatten(self.param_buffer)):
+            p.set_value(value, borrow=True)
+
+    def compute_shard(self, index, shard):
+        results = self.grad_func(*shard)
+        self.flatten(results[1:], self.grad_buffers[index])
+        return float(results[0])
+
+    def seed_worker_rngs(self, seed):
+        # the forked workers inherit the same random stream states, they would draw the same dropout masks
+        theano_rngs = []
+        for layer in self.layers:
+            if isinstance(layer.theano_rng, RandomStreams) and layer.theano_rng not in theano_rngs:
+                theano_rngs.append(layer.theano_rng)
+        for i, theano_rng in enumerate(theano_rngs):
+            theano_rng.seed(int(seed) + i)
+
+    def run_worker(self, index, conn):
+        self.seed_worker_rngs(self.worker_seeds[index])
+        self.bind_worker_params()
+        while True:
+            shard = conn.recv()
+            if shard is None:
+                break
+            try:
+                conn.send(self.compute_shard(index, shard))
+            except Exception:
+                conn.send(traceback.format_exc())
+        conn.close()
+
+    def receive(self, index):
+        result = self.pipes[index].recv()
+        if isinstance(result, basestring):
+            raise RuntimeError("Data parallel worker " + str(index) + " failed:\n" + result)
+        return result
+
+    def __call__(self, *args):
+        # same signature as the single process update function: interface symbols, then learning_param()
+        self.start()
+        batch, learning_param = args[:self.num_symbols], list(args[self.num_symbols:])
+        batch_size = batch[0].shape[1]
+        bounds = numpy.linspace(0, batch_size, self.num_workers + 1).astype('int64')
+        active = [i for i in xrange(self.num_workers) if bounds[i + 1] > bounds[i]]
+        for i in active:
+            self.pipes[i].send([b[:, bounds[i]:bounds[i + 1]] for b in batch])
+        cost = 0.
+        for i in active:
+            cost += self.receive(i)
+        grad = self.grad_buffers[active].sum(axis=0)
+        self.last_grad_norm = self.apply_func(*(self.unflatten(grad) + [numpy_floatX(batch_size)] + learning_param))
+        self.flatten([p.get_value(borrow=True) for p in self.params], self.param_buffer)
+        return cost
+
+    def close(self):
+        for conn in self.pipes:
+            conn.send(None)
+            conn.close()
+        for process in self.processes:
+            process.join()
+        self.pipes = []
+        self.processes = []
+
+
+class AsyncParameterServer(DataParallelUpdate):
+    def __init__(self, optimizer, num_workers, max_staleness=None):
+        self.max_staleness = max_staleness
+        self.version = multiprocessing.RawValue('l', 0)
+        self.idle = range(num_workers)
+        self.busy = {}
+        self.last_cost = numpy.nan
+        self.last_learning_param = None
+        self.num_applied = 0
+        self.num_dropped = 0
+        self.total_staleness = 0
+        super(AsyncParameterServer, self).__init__(optimizer, num_workers)
+
+    def bind_worker_params(self):
+        pass
+
+    def sync_params(self, version):
+        super(AsyncParameterServer, self).sync_params(version)
+        self.version.value = version
+
+    def compute_shard(self, index, shard):
+        # pull: a private copy of the current parameters, and their version
+        version = self.version.value
+        for p, value in zip(self.params, self.unflatten(self.param_buffer)):
+            p.set_value(value)
+        return super(AsyncParameterServer, self).compute_shard(index, shard), version
+
+    def apply(self, index):
+        cost, version = self.receive(index)
+        batch_size = self.busy.pop(index)
+        self.idle.append(index)
+        staleness = self.version.value - version
+        if self.max_staleness is not None and staleness > self.max_staleness:
+            self.num_dropped += 1
+            return
+        self.last_grad_norm = self.apply_func(*(self.unflatten(self.grad_buffers[index]) +
+                                                [numpy_floatX(batch_size)] + self.last_learning_param))
+        self.flatten([p.get_value(borrow=True) for p in self.params], self.param_buffer)
+        self.version.value += 1
+        self.num_applied += 1
+        self.total_staleness += staleness
+        self.last_cost = cost
+
+    def wait(self, block=True):
+        ready, _, _ = select.select([self.pipes[i] for i in self.busy], [], [], None if block else 0)
+        for conn in ready:
+            self.apply(self.pipes.index(conn))
+
+    def __call__(self, *args):
+        """
+        Hands the minibatch to an idle worker (waiting for one when all of them are busy) and applies the
+        gradients that arrived. Returns the cost of the last applied minibatch, which is an earlier one.
+        """
+        self.start()
+        batch, self.last_learning_param = args[:self.num_symbols], list(args[self.num_symbols:])
+        if len(self.busy) > 0:
+            self.wait(block=len(self.idle) == 0)
+        index = self.idle.pop(0)
+        self.busy[index] = batch[0].shape[1]
+        self.pipes[index].send(list(batch))
+        return self.last_cost
+
+    def drain(self):
+        while len(self.busy) > 0:
+            self.wait()
+
+    def mean_staleness(self):
+        return self.total_staleness / float(max(self.num_applied, 1))
+
+    def close(self):
+        if len(self.processes) == 0:
+            return
+        self.drain()
+        logger.info("Parameter Server Applied " + str(self.num_applied) + " Updates, Dropped " +
+                    str(self.num_dropped) + ", Mean Staleness " + str(self.mean_staleness()))
+        super(AsyncParameterServer, self).close()
@@ -0,0 +1,59 @@
+__author__ = 'zhenyang'
+
+import numpy
+import logging
+import theano
+import theano.tensor as TT
+
+logger = logging.getLogger(__name__)
+
+'''
+Flat parameter buffer
+
+With the "flat_params" hyper parameter the parameters of the model are packed into one contiguous shared vector.
+The update function reads every parameter as a reshaped slice of it (givens) and the optimizer's update rule
+(get_updates) sees a single parameter, the flat vector, and a single gradient, the concatenation of the flattened
+gradients. The optimizer slots created by the rule (RMSProp mean squares, Adam moments, ...) are flat vectors as
+well, so a step runs a few large elementwise ops instead of a few per parameter tensor (33 tensors for one
+DeepCondConvLSTMLayer).
+
+The shared variables of the layers keep existing for the other functions (evaluation, prediction, saving): after
+every update bind() points their storage to views of the flat vector (borrowed, no copy while theano updates the
+vector in place). Parameters set directly afterwards (e.g. loading weights into the model once the optimizer is
+built) must be packed again with gather().
+
+'''
+
+
+class FlatParameters(object):
+    def __init__(self, params, name):
+        self.params = params
+        self.shapes = [p.get_value(borrow=True).shape for p in params]
+        self.offsets = numpy.cumsum([0] + [int(numpy.prod(shape)) for shape in self.shapes])
+        dtypes = set(p.dtype for p in params)
+        assert len(dtypes) == 1, "A flat parameter buffer needs parameters of a single dtype, got " + str(dtypes)
+        self.flat = theano.shared(numpy.zeros(int(self.offsets[-1]), dtype=dtypes.pop()), name=name + ".flat_param")
+        self.views = [self.flat[begin:end].reshape(shape) for shape, begin, end in
+                      zip(self.shapes, self.offsets[:-1], self.offsets[1:])]
+        self.bound = None
+        self.gather()
+        logger.info("Packed " + str(len(params)) + " Parameters (" + str(self.offsets[-1]) +
+                    " Values) Into " + self.flat.name)
+
+    def givens(self):
+        return zip(self.params, self.views)
+
+    def flatten(self, values):
+        return TT.concatenate([v.flatten() for v in values])
+
+    def gather(self):
+        self.flat.set_value(numpy.concatenate([p.get_value().ravel() for p in self.params]), borrow=True)
+        self.bind()
+
+    def bind(self):
+        value = self.flat.get_value(borrow=True, return_internal_type=True)
+        if value is self.bound:
+            return
+        for p, shape, begin, end in zip(self.params, self.shapes, self.offsets[:-1], self.offsets[1:]):
+            p.set_value(value[begin:end].reshape(shape), borrow=True)
+        self.bound = value
@@ -0,0 +1,59 @@
+__author__ = 'zhenyang'
+
+import numpy
+import logging
+import theano
+import theano.tensor as TT
+
+from sparnn.utils import *
+
+logger = logging.getLogger(__name__)
+
+'''
+Gradient accumulation over micro-batches
+
+GradientAccumulationUpdate replaces the compiled update function of an Optimizer (hyper parameter
+"accumulation_steps"). Each call splits the minibatch along the batch axis into `accumulation_steps` micro-batches,
+the accumulate function adds the gradients of the summed cost of every micro-batch into shared accumulators
+without touching the parameters, then the apply function runs the optimizer's update rule (get_updates) once on
+the accumulated gradients divided by the number of examples of the whole minibatch.
+
+The update is the one of the whole minibatch (up to float rounding, and except for layers whose output depends
+on the other examples of the batch), while the intermediate results of the forward and backward passes, which
+dominate the memory of the unrolled recurrent layers, only scale with the micro-batch.
+
+'''
+
+
+class GradientAccumulationUpdate(object):
+    def __init__(self, optimizer, accumulation_steps):
+        model = optimizer.model
+        self.accumulation_steps = accumulation_steps
+        self.num_symbols = len(model.interface_layer.symbols())
+        self.last_grad_norm = None
+
+        self.accumulators = [theano.shared(p.get_value() * numpy_floatX(0.), name="%s.grad_acc" % p.name)
+                             for p in model.param]
+        # keep is 0 for the first micro-batch of a minibatch, which overwrites the previous accumulated values
+        self.keep = TT.scalar(optimizer._s("keep_accumulated"), dtype=theano.config.floatX)
+        updates = [(acc, self.keep * acc + g) for acc, g in zip(self.accumulators, optimizer.get_model_grad())]
+        self.accumulate_func = quick_cached_function(inputs=model.interface_layer.symbols() + [self.keep],
+                                                     outputs=model.cost_layer.output,
+                                                     updates=updates + model.get_inner_updates(),
+                                                     cache_dir=model.function_cache_dir,
+                                                     on_unused_input='warn')
+        self.apply_func = optimizer.get_apply_func(self.accumulators)
+
+    def __call__(self, *args):
+        # same signature as the single process update function: interface symbols, then learning_param()
+        batch, learning_param = args[:self.num_symbols], list(args[self.num_symbols:])
+        batch_size = batch[0].shape[1]
+        bounds = numpy.linspace(0, batch_size, self.accumulation_steps + 1).astype('int64')
+        cost = 0.
+        keep = numpy_floatX(0.)
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            if end > begin:
+                cost += self.accumulate_func(*([b[:, begin:end] for b in batch] + [keep]))
+                keep = numpy_floatX(1.)
+        self.last_grad_norm = self.apply_func(*([numpy_floatX(batch_size)] + learning_param))
+        return cost
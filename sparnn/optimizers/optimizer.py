@@ -10,6 +10,13 @@ import theano.tensor as TT
 logger = logging.getLogger(__name__)
 from sparnn.models import VideoModel
 from sparnn.utils import *
+from sparnn.optimizers.async_validation import AsyncValidator
+from sparnn.optimizers.data_parallel import DataParallelUpdate, AsyncParameterServer
+from sparnn.optimizers.gradient_accumulation import GradientAccumulationUpdate
+from sparnn.optimizers.flat_params import FlatParameters
+from sparnn.optimizers.checkpoint import CheckpointWriter, read_checkpoint, latest_checkpoint
+from sparnn.optimizers.telemetry import quick_telemetry_sink
+from sparnn.optimizers.schedules import quick_lr_schedule
 
 
 '''
@@ -25,6 +32,7 @@ class Optimizer(object):
                  valid_data_iterator,
                  test_data_iterator,
                  hyper_param):
+        assert not getattr(model, 'inference_only', False), "Cannot train a model built in inference_only mode"
         self.model = model
         self.train_data_iterator = train_data_iterator
         self.valid_data_iterator = valid_data_iterator
@@ -37,132 +45,473 @@ class Optimizer(object):
         self.autosave_mode = hyper_param.get("autosave_mode", None)
         self.do_shuffle = hyper_param.get("do_shuffle", None)
         self.save_path = hyper_param.get("save_path", "./")
+        self.save_format = hyper_param.get("save_format", "pickle")
+        assert self.save_format in ("pickle", "npz", "hdf5")
         self.save_interval = hyper_param.get("save_interval", None)
         self.max_epochs_no_best = hyper_param.get("max_epochs_no_best", None)
         self.display_freq = hyper_param.get("display_freq", None)
         self.valid_freq = hyper_param.get("valid_freq", None)
         self.save_freq = hyper_param.get("save_freq", None)
         self.clip_threshold = numpy_floatX(hyper_param['clip_threshold']) if 'clip_threshold' in hyper_param else None
+        self.loss_scale = numpy_floatX(hyper_param['loss_scale']) if 'loss_scale' in hyper_param else None
         self.verbose = hyper_param.get("verbose", None)
+        self.log_param_grad_norms = hyper_param.get("log_param_grad_norms", False)
+        self.async_validation = hyper_param.get("async_validation", False)
+        self.num_workers = hyper_param.get("num_workers", 1)
+        self.parallel_mode = hyper_param.get("parallel_mode", "sync")
+        assert self.parallel_mode in ("sync", "async")
+        self.max_staleness = hyper_param.get("max_staleness", None)
+        self.accumulation_steps = hyper_param.get("accumulation_steps", 1)
+        assert self.num_workers == 1 or self.accumulation_steps == 1, "Use either num_workers or accumulation_steps"
+        self.flat_params = hyper_param.get("flat_params", False)
+        assert not self.flat_params or (self.num_workers == 1 and self.accumulation_steps == 1), \
+            "flat_params is only supported by the single process update function"
+        self.checkpoint_freq = hyper_param.get("checkpoint_freq", None)
+        self.checkpoint_keep = hyper_param.get("checkpoint_keep", 2)
+        self.resume_from = hyper_param.get("resume_from", None)
+        self.profile_steps = hyper_param.get("profile_steps", None)
+        self.lr_schedule = quick_lr_schedule(hyper_param.get("lr_schedule", None))
+        self.current_learning_rate = None
+        self.telemetry = quick_telemetry_sink(hyper_param.get("telemetry", None), hyper_param.get("telemetry_window", 50))
         self.best_validation_error = numpy.inf
         self.current_validation_error = numpy.inf
         self.current_epoch = self.start_epoch
         self.current_uidx = self.start_uidx
+        self.first_epoch = self.start_epoch
+        self.no_better_validation_step = 0
+        self.resume_iterator_state = None
+        self.last_grad_norm = None
+        self.last_layer_grad_norms = None
+        self.last_param_grad_norms = None
 
-        self.get_grad_param()
-        if self.verbose:
-            self.grad_norm_func = theano.function(self.model.interface_layer.symbols(), self.grad_norm)
         self.set_name()
+        # the parameters the update rule is applied to: the model parameters, or the flat vector holding them
+        self.param = self.model.param
+        self.flat_buffer = None
+        if self.flat_params:
+            self.flat_buffer = FlatParameters(self.model.param, self.name)
+            self.param = [self.flat_buffer.flat]
+        # layers with parameters, the per layer gradient norms follow their order (the order of model.param)
+        self.grad_layers = [layer for layer in self.model.middle_layers + [self.model.cost_layer]
+                            if len(layer.param) > 0]
+        self.clipped_steps = theano.shared(numpy_floatX(0.), name=self._s("clipped_steps"))
+        if self.profile_steps is not None:
+            assert self.num_workers == 1, "Profiling runs in a single process"
+            self.model.enable_profiling()
         logger.info("...Begin Building " + self.name + " Updating Function...")
-        self.update_func = self.get_update_func()
+        if self.num_workers > 1 and self.parallel_mode == "async":
+            self.update_func = AsyncParameterServer(self, self.num_workers, self.max_staleness)
+        elif self.num_workers > 1:
+            self.update_func = DataParallelUpdate(self, self.num_workers)
+        elif self.accumulation_steps > 1:
+            self.update_func = GradientAccumulationUpdate(self, self.accumulation_steps)
+        else:
+            self.get_grad_param()
+            self.update_func = self.get_update_func()
         logger.info("...Finished, Update Function Saved to " + os.path.abspath(self.save_path))
+        if self.resume_from is not None:
+            self.load_checkpoint(self.resume_from)
 
     def set_name(self):
         self.name = "Optimizer-" + self.id
 
-    def get_grad_param(self):
-        self.grad_norm = TT.sqrt(sum(TT.sqr(g).sum() for g in self.model.grad)) / TT.cast(
-            self.model.interface_layer.input.shape[1], 'float32')
+    def get_model_grad(self):
+        # With a static loss scale (useful when recurrent states are stored in float16, see "state_dtype"),
+        # the cost is multiplied before differentiation so that small gradients survive the low precision
+        # intermediates, and the gradients are divided back before norm computation, clipping and updating.
+        if self.loss_scale is not None:
+            return [g / self.loss_scale for g in
+                    TT.grad(self.model.cost_layer.output * self.loss_scale, self.model.param)]
+        return self.model.grad
+
+    def get_grad_param(self, model_grad=None, batch_size=None):
+        # model_grad are the gradients of the summed cost, batch_size the number of examples they are summed over
+        if model_grad is None:
+            model_grad = self.get_model_grad()
+        if batch_size is None:
+            batch_size = TT.cast(self.model.interface_layer.input.shape[1], 'float32')
+        # the squared sums are computed once and shared by the global, per layer and per parameter norms
+        sqr_sums = [TT.sqr(g).sum() for g in model_grad]
+        self.grad_norm = TT.sqrt(sum(sqr_sums)) / batch_size
+        self.param_grad_norms = [TT.sqrt(s) / batch_size for s in sqr_sums]
+        bounds = numpy.cumsum([0] + [len(layer.param) for layer in self.grad_layers])
+        self.layer_grad_norms = [TT.sqrt(sum(sqr_sums[begin:end])) / batch_size
+                                 for begin, end in zip(bounds[:-1], bounds[1:])]
         # self.has_numeric_error = TT.or_(TT.isnan(self.grad_norm), TT.isinf(self.grad_norm))
         # self.grad = [TT.switch(self.has_numeric_error, numpy_floatX(0.1) * p, g)
         # for g, p in zip(self.model.grad, self.model.param)]
-        self.grad =[g / TT.cast(
-            self.model.interface_layer.input.shape[1], 'float32') for g in self.model.grad]
+        # averaging and global norm clipping are a single rescale by a scalar computed once
+        scale = numpy_floatX(1.) / batch_size
         if self.clip_threshold is not None:
-            self.grad = [TT.switch(TT.ge(self.grad_norm, self.clip_threshold),
-                                   g * self.clip_threshold / self.grad_norm, g) for g in self.grad]
+            self.grad_clipped = TT.ge(self.grad_norm, self.clip_threshold)
+            scale = TT.switch(self.grad_clipped, self.clip_threshold / self.grad_norm, numpy_floatX(1.)) / batch_size
+        if self.flat_buffer is not None:
+            self.grad = [self.flat_buffer.flatten(model_grad) * scale]
+        else:
+            self.grad = [g * scale for g in model_grad]
+
+    def get_updates(self):
+        # (updates, other_param_list) of the update rule applied to self.grad for self.param, implemented by each
+        # optimizer
+        return [], []
+
+    def build_updates(self):
+        # the update rule, and the count of clipped steps
+        updates, other_param_list = self.get_updates()
+        if self.clip_threshold is not None:
+            updates = updates + [(self.clipped_steps,
+                                  self.clipped_steps + TT.cast(self.grad_clipped, theano.config.floatX))]
+        self.updates = updates
+        return updates, other_param_list
 
     def get_update_func(self):
-        return lambda x: x
+        updates, other_param_list = self.build_updates()
+        givens = self.flat_buffer.givens() if self.flat_buffer is not None else None
+        return self.model.get_update_func(updates, other_param_list, self.monitor_outputs(), givens)
+
+    def monitor_outputs(self):
+        # extra outputs of the single process update function: the norms are computed in the same pass as the update
+        if not self.verbose:
+            return None
+        return [self.grad_norm] + self.layer_grad_norms + (self.param_grad_norms if self.log_param_grad_norms else [])
+
+    def update(self, batch):
+        """
+        One training step on the batch, returns the minibatch cost and keeps the gradient norm in last_grad_norm
+        (and in verbose mode the per layer norms in last_layer_grad_norms)
+        """
+        results = self.update_func(*(batch + self.learning_param()))
+        if self.flat_buffer is not None:
+            self.flat_buffer.bind()
+        if isinstance(results, list):
+            num_layers = len(self.layer_grad_norms)
+            self.last_grad_norm = results[1]
+            self.last_layer_grad_norms = results[2:2 + num_layers]
+            self.last_param_grad_norms = results[2 + num_layers:] if self.log_param_grad_norms else None
+            return results[0]
+        self.last_grad_norm = getattr(self.update_func, 'last_grad_norm', None)
+        return results
+
+    def convert_batch(self, batch):
+        return [numpy.asarray(b, dtype=symbol.dtype) for b, symbol in
+                zip(batch, self.model.interface_layer.symbols())]
+
+    def count_frames(self, batch):
+        # the unmasked frames of the batch, the mask is not the second symbol of every interface layer
+        interface_layer = self.model.interface_layer
+        if interface_layer.use_mask:
+            return batch[interface_layer.symbols().index(interface_layer.mask)].sum()
+        return batch[0].shape[0] * batch[0].shape[1]
+
+    def timed_update(self):
+        """
+        update() on the next batch, timing the data, conversion and update stages into self.step_record
+        """
+        start = time.time()
+        batch = self.train_data_iterator.get_batch()
+        fetched = time.time()
+        batch = self.convert_batch(batch)
+        converted = time.time()
+        cost = self.update(batch)
+        self.step_updated = time.time()
+        self.step_record = {'kind': 'step', 'epoch': self.current_epoch, 'uidx': self.current_uidx,
+                            'cost': float(cost), 'clips': int(batch[0].shape[1]), 'frames': float(self.count_frames(batch)),
+                            'data_time': fetched - start, 'transfer_time': converted - fetched,
+                            'update_time': self.step_updated - converted, 'step_start': start,
+                            'grad_norm': None if self.last_grad_norm is None else float(self.last_grad_norm),
+                            'clipped_steps': int(self.clipped_steps.get_value()),
+                            'learning_rate': None if self.current_learning_rate is None
+                            else float(self.current_learning_rate)}
+        return cost
+
+    def record_step(self):
+        record = self.step_record
+        now = time.time()
+        record['validation_time'] = now - self.step_updated
+        record['step_time'] = now - record.pop('step_start')
+        record['clips_per_sec'] = record['clips'] / record['step_time']
+        record['frames_per_sec'] = record['frames'] / record['step_time']
+        self.telemetry.record(record)
+
+    def get_apply_func(self, grad_sum=None):
+        """
+        The update rule applied to gradients computed elsewhere (e.g. by data parallel workers). Inputs are the
+        gradient of the summed cost for every parameter (unless given as grad_sum, e.g. shared accumulators),
+        the number of examples, then learning_param(). Returns the gradient norm.
+        """
+        grad_input = []
+        if grad_sum is None:
+            grad_sum = grad_input = [p.type(name=p.name + ".grad") for p in self.model.param]
+        self.batch_size_input = TT.scalar(self._s("batch_size"), dtype=theano.config.floatX)
+        self.get_grad_param(grad_sum, self.batch_size_input)
+        updates, other_param_list = self.build_updates()
+        return theano.function(inputs=grad_input + [self.batch_size_input] + other_param_list,
+                               outputs=self.grad_norm, updates=updates, on_unused_input='warn')
 
     def learning_param(self):
         return None
 
+    def scheduled(self, learning_rate):
+        # the learning rate of the current step: the base learning rate times the factor of the schedule
+        if self.lr_schedule is not None:
+            learning_rate = numpy_floatX(learning_rate * self.lr_schedule(self))
+        self.current_learning_rate = learning_rate
+        return learning_rate
+
+    def learning_state(self):
+        # learning parameters changed during training (e.g. the state of the schedule), restored on resume
+        if self.lr_schedule is None:
+            return {}
+        return {'lr_schedule': self.lr_schedule.state()}
+
+    def set_learning_state(self, state):
+        for name, value in state.items():
+            if name != 'lr_schedule':
+                setattr(self, name, value)
+            elif self.lr_schedule is not None:
+                # default schedules built by a subclass after resuming (SGD's step schedule) have no state
+                self.lr_schedule.set_state(value)
+
+    def state_variables(self):
+        """
+        Shared variables other than the parameters that training changes: optimizer slots, layer states
+        and random streams, in a deterministic order
+        """
+        ret = []
+        variables = [var for var, _ in self.updates + self.model.get_inner_updates()]
+        for var in variables + quick_graph_shared_variables([self.model.cost_layer.output]):
+            if var not in self.model.param and var not in self.param and var not in ret:
+                ret.append(var)
+        return ret
+
+    def checkpoint_prefix(self):
+        return self.save_path + "/" + self.model.name
+
+    def training_state(self, epoch_done):
+        return {'model_name': self.model.name,
+                'params': [(p.name, p.get_value()) for p in self.model.param],
+                'state_variables': [(var.name, var.get_value()) for var in self.state_variables()],
+                'current_epoch': self.current_epoch,
+                'current_uidx': self.current_uidx,
+                'epoch_done': epoch_done,
+                'best_validation_error': self.best_validation_error,
+                'current_validation_error': self.current_validation_error,
+                'no_better_validation_step': self.no_better_validation_step,
+                'learning_state': self.learning_state(),
+                'iterator': quick_iterator_state(self.train_data_iterator, position=not epoch_done)}
+
+    def save_checkpoint(self, epoch_done):
+        self.checkpoint_writer.write(self.current_uidx, self.training_state(epoch_done))
+
+    def load_checkpoint(self, path):
+        """
+        Restores a training checkpoint, "latest" resumes from the most recent one in save_path
+        """
+        if path == "latest":
+            path = latest_checkpoint(self.checkpoint_prefix())
+            if path is None:
+                logger.info("No Training Checkpoint Found, Starting From Scratch")
+                return
+        state = read_checkpoint(path)
+        for (name, value), var in zip(state['params'], self.model.param) + \
+                zip(state['state_variables'], self.state_variables()):
+            if name != var.name or numpy.shape(value) != numpy.shape(var.get_value(borrow=True)):
+                raise ValueError("Checkpoint " + path + " does not match the training graph at " + str(var.name))
+            var.set_value(value, borrow=True)
+        if self.flat_buffer is not None:
+            self.flat_buffer.gather()
+        self.set_learning_state(state['learning_state'])
+        self.current_epoch = state['current_epoch']
+        self.current_uidx = state['current_uidx']
+        if isinstance(self.update_func, DataParallelUpdate):
+            # the workers read the parameters from the shared buffer, not from the shared variables
+            self.update_func.sync_params(self.current_uidx)
+        self.best_validation_error = state['best_validation_error']
+        self.current_validation_error = state['current_validation_error']
+        self.no_better_validation_step = state['no_better_validation_step']
+        # an unfinished epoch goes on from the saved iterator position instead of being reshuffled
+        self.first_epoch = self.current_epoch if state['epoch_done'] else self.current_epoch - 1
+        self.resume_iterator_state = state['iterator']
+        logger.info("Resumed From Training Checkpoint " + os.path.abspath(path) + ", Epoch: " +
+                    str(self.current_epoch) + " Update: " + str(self.current_uidx))
+
+    def profile(self):
+        """
+        Ends a profiling run: the evaluation function is run once on the current batch so that it is part of the
+        report, then the report is written to save_path
+        """
+        self.model.set_mode("predict")
+        self.model.eval_func(*self.train_data_iterator.get_batch())
+        self.model.set_mode("train")
+        self.model.write_profile_report(self.save_path + "/" + self.model.name + "-profile.txt")
+
     def autosave(self, mode):
         if "interval" in mode:
             #if 0 == (self.current_epoch + 1) % self.save_interval:
             if 0 == self.current_epoch % self.save_interval:
-                save_path = self.save_path + "/" + self.model.name + "-epoch-" + str(self.current_epoch) + ".pkl"
-                VideoModel.save(self.model, save_path)
-                logger.info("....Saving to " + os.path.abspath(save_path))
+                self.save_model(self.save_path + "/" + self.model.name + "-epoch-" + str(self.current_epoch))
         if "best" in mode:
             if self.current_validation_error < self.best_validation_error:
-                save_path = self.save_path + "/" + self.model.name + "-validation-best.pkl"
-                VideoModel.save(self.model, save_path)
-                logger.info("....Saving to " + os.path.abspath(save_path))
+                self.save_model(self.save_path + "/" + self.model.name + "-validation-best")
         if "final" in mode:
             if self.current_epoch == self.max_epoch:
-                save_path = self.save_path + "/" + self.model.name + "-epoch-" + str(self.current_epoch) + ".pkl"
-                VideoModel.save(self.model, save_path)
-                logger.info("....Saving to " + os.path.abspath(save_path))
+                self.save_model(self.save_path + "/" + self.model.name + "-epoch-" + str(self.current_epoch))
+
+    def save_model(self, prefix):
+        if self.save_format == "pickle":
+            save_path = prefix + ".pkl"
+            VideoModel.save(self.model, save_path)
+        else:
+            save_path = prefix + (".npz" if self.save_format == "npz" else ".h5")
+            VideoModel.save_weights(self.model, save_path)
+        logger.info("....Saving to " + os.path.abspath(save_path))
+
+    def validate(self, epoch_end):
+        if self.async_validation:
+            self.validator.submit((self.current_epoch, self.current_uidx, epoch_end))
+            logger.info("Epoch: " + str(self.current_epoch) + "\tUpdate: " + str(self.current_uidx) +
+                        "\tSubmitted Validation, " + str(self.validator.pending()) + " Pending")
+        else:
+            start = time.time()
+            valid_stats = self.model.evaluate(self.valid_data_iterator)
+            valid_stats['time'] = time.time() - start
+            self.on_validation(valid_stats, epoch_end)
+
+    def collect_validation(self, block=False):
+        # results of snapshots validated by the worker, the snapshot and its epoch are restored while saving
+        for (epoch, uidx, epoch_end), snapshot, valid_stats in self.validator.poll(block):
+            current = [p.get_value(borrow=True) for p in self.model.param]
+            current_epoch, current_uidx = self.current_epoch, self.current_uidx
+            for p, value in zip(self.model.param, snapshot):
+                p.set_value(value, borrow=True)
+            self.current_epoch, self.current_uidx = epoch, uidx
+            self.on_validation(valid_stats, epoch_end)
+            for p, value in zip(self.model.param, current):
+                p.set_value(value, borrow=True)
+            self.current_epoch, self.current_uidx = current_epoch, current_uidx
+
+    def on_validation(self, valid_stats, epoch_end):
+        accuracy = valid_stats['top1']
+        logger.info("Epoch: " + str(self.current_epoch) + "\tUpdate: " + str(self.current_uidx) +
+                    "\tValidation Cost: " + str(valid_stats['cost']) + " Accuracy: " + str(accuracy) +
+                    " Top-5 Accuracy: " + str(valid_stats['top5']) + " Errors: " + str(valid_stats['errors']) +
+                    " Time Spent: " + str(valid_stats['time']))
+        self.current_validation_error = 1. - accuracy
+        if self.lr_schedule is not None:
+            self.lr_schedule.on_validation(self)
+        print "Epoch: ", str(self.current_epoch), \
+              "Update: ", str(self.current_uidx), \
+              "Validation Accuracy: ", str(accuracy)
+        self.autosave(self.autosave_mode)
+        if epoch_end:
+            self.no_better_validation_step += self.valid_epoch
+        if self.current_validation_error < self.best_validation_error:
+            self.best_validation_error = self.current_validation_error
+            if epoch_end:
+                self.no_better_validation_step = 0
+        if epoch_end and self.no_better_validation_step >= self.max_epochs_no_best:
+            self.stop_training = True
 
     def train(self):
+        if self.num_workers > 1:
+            # the worker processes only live during training, they are stopped even when it fails
+            self.update_func.start()
+        try:
+            self.run_epochs()
+        finally:
+            if self.num_workers > 1:
+                self.update_func.close()
+
+    def run_epochs(self):
         self.model.set_mode("train")
-        no_better_validation_step = 0
-        for i in range(self.start_epoch, self.start_epoch + self.max_epoch):
+        self.stop_training = False
+        train_start_uidx = self.current_uidx
+        if self.checkpoint_freq is not None:
+            self.checkpoint_writer = CheckpointWriter(self.checkpoint_prefix(), self.checkpoint_keep)
+        if self.async_validation:
+            # with asynchronous validation, early stopping takes effect at the end of the epoch the result arrives in
+            self.validator = AsyncValidator(self.model, self.valid_data_iterator)
+        for i in range(self.first_epoch, self.start_epoch + self.max_epoch):
             start = time.time()
             self.current_epoch = i + 1
-            self.train_data_iterator.begin(do_shuffle=True)
+            # after a resume the random generators are restored, and the position within an unfinished epoch
+            if self.resume_iterator_state is None or \
+                    not quick_set_iterator_state(self.train_data_iterator, self.resume_iterator_state):
+                self.train_data_iterator.begin(do_shuffle=True)
+            self.resume_iterator_state = None
             logger.info("Epoch: " + str(self.current_epoch) + "/" + str(self.max_epoch))
             while True:
                 self.current_uidx += 1
+                if self.telemetry is None:
+                    minibatch_cost = quick_timed_log_eval(logger.debug, "Minibatch Cost:", self.update,
+                                                          self.train_data_iterator.get_batch())
+                else:
+                    minibatch_cost = quick_timed_log_eval(logger.debug, "Minibatch Cost:", self.timed_update)
                 if self.verbose:
-                    quick_timed_log_eval(logger.debug, "    Gradient Norm:", self.grad_norm_func,
-                                         *(self.train_data_iterator.get_batch()))
-                minibatch_cost = quick_timed_log_eval(logger.debug, "Minibatch Cost:", self.update_func,
-                                       *(self.train_data_iterator.get_batch() +
-                                       self.learning_param()))
+                    logger.debug("    Gradient Norm: " + str(self.last_grad_norm) +
+                                 " Clipped Steps: " + str(int(self.clipped_steps.get_value())))
+                    if self.last_layer_grad_norms is not None:
+                        logger.debug("    Layer Gradient Norms: " + ", ".join(
+                            layer.name + ": " + str(n) for layer, n in zip(self.grad_layers,
+                                                                           self.last_layer_grad_norms)))
+                    if self.last_param_grad_norms is not None:
+                        logger.debug("    Gradient Norms: " + ", ".join(
+                            p.name + ": " + str(n) for p, n in zip(self.model.param, self.last_param_grad_norms)))
 
                 if self.display_freq is not None and numpy.mod(self.current_uidx, self.display_freq) == 0:
                     logger.info("Epoch: " + str(self.current_epoch) + \
                                 "\tUpdate: " + str(self.current_uidx) + \
-                                "\tCost: " + str(minibatch_cost))
+                                "\tCost: " + str(minibatch_cost) + \
+                                "\tLearning Rate: " + str(self.current_learning_rate))
                     print "Epoch: ", str(self.current_epoch), \
                           "Update: ", str(self.current_uidx), \
                           "Cost: ", str(minibatch_cost)
 
                 if self.valid_freq is not None and numpy.mod(self.current_uidx, self.valid_freq) == 0:
-                    accuracy = quick_timed_log_eval(logger.info, "Validation Accuracy", self.model.get_acc,
-                                                    self.valid_data_iterator)
-                    self.current_validation_error = 1. - accuracy
-                    print "Epoch: ", str(self.current_epoch), \
-                          "Update: ", str(self.current_uidx), \
-                          "Validation Accuracy: ", str(accuracy)
-                    self.autosave(self.autosave_mode)
-                    if self.current_validation_error < self.best_validation_error:
-                        self.best_validation_error = self.current_validation_error
+                    self.validate(epoch_end=False)
+                if self.async_validation:
+                    self.collect_validation()
+                if self.telemetry is not None:
+                    self.record_step()
+                if self.profile_steps is not None and self.current_uidx - train_start_uidx >= self.profile_steps:
+                    self.profile()
+                    self.stop_training = True
+                    break
 
                 self.train_data_iterator.next()
                 if self.train_data_iterator.no_batch_left():
                     break
+                if self.checkpoint_freq is not None and numpy.mod(self.current_uidx, self.checkpoint_freq) == 0:
+                    self.save_checkpoint(epoch_done=False)
 
+            if self.stop_training and self.profile_steps is not None:
+                break
+            validation_start = time.time()
             if numpy.mod(self.current_epoch, self.valid_epoch) == 0:
                 # quick_timed_log_eval(logger.info, "Training Cost", self.model.get_cost, self.train_data_iterator)
-                # self.current_validation_error = quick_timed_log_eval(logger.info, "Validation Cost", self.model.get_cost,
-                #                                                     self.valid_data_iterator)
-                # print "Epoch: ", str(self.current_epoch), "Validation Cost: ", str(self.current_validation_error)
-
-                accuracy = quick_timed_log_eval(logger.info, "Validation Accuracy", self.model.get_acc,
-                                                self.valid_data_iterator)
-                self.current_validation_error = 1. - accuracy
-                print "Epoch: ", str(self.current_epoch), "Validation Accuracy: ", str(accuracy)
-
                 # if len(self.model.error_func_dict) > 0:
                 #     quick_timed_log_eval(logger.info, "Training Error List", self.model.get_error_dict,
                 #                          self.train_data_iterator)
-                #     quick_timed_log_eval(logger.info, "Validation Error List", self.model.get_error_dict,
-                #                          self.valid_data_iterator)
-
-                self.autosave(self.autosave_mode)
-                no_better_validation_step += self.valid_epoch
-                if self.current_validation_error < self.best_validation_error:
-                    self.best_validation_error = self.current_validation_error
-                    no_better_validation_step = 0
-                if no_better_validation_step >= self.max_epochs_no_best:
-                    break
+                self.validate(epoch_end=True)
+
+            if self.checkpoint_freq is not None:
+                self.save_checkpoint(epoch_done=True)
 
             end = time.time()
             logger.info("Total Duration For Epoch " + str(self.current_epoch) + ":" + str(end - start))
+            if self.telemetry is not None:
+                self.telemetry.record({'kind': 'epoch', 'epoch': self.current_epoch, 'uidx': self.current_uidx,
+                                       'validation_time': end - validation_start, 'epoch_time': end - start})
+            if self.stop_training:
+                break
+
+        if self.async_validation:
+            self.collect_validation(block=True)
+            self.validator.close()
+        if self.checkpoint_freq is not None:
+            self.checkpoint_writer.close()
+        if self.telemetry is not None:
+            self.telemetry.close()
 
     def _s(self, s):
         return '%s.%s' % (self.name, s)
@@ -173,5 +522,19 @@ class Optimizer(object):
         logger.info("      Max Epoch: " + str(self.max_epoch))
         logger.info("      Start Epoch: " + str(self.start_epoch))
         logger.info("      Autosave Mode: " + str(self.autosave_mode))
+        logger.info("      Save Format: " + str(self.save_format))
         logger.info("      Save Interval: " + str(self.save_interval))
         logger.info("      Max Epochs No Best: " + str(self.max_epochs_no_best))
+        logger.info("      Loss Scale: " + str(self.loss_scale))
+        logger.info("      Asynchronous Validation: " + str(self.async_validation))
+        logger.info("      Data Parallel Workers: " + str(self.num_workers))
+        logger.info("      Parallel Mode: " + str(self.parallel_mode))
+        logger.info("      Max Staleness: " + str(self.max_staleness))
+        logger.info("      Gradient Accumulation Steps: " + str(self.accumulation_steps))
+        logger.info("      Flat Parameters: " + str(self.flat_params))
+        logger.info("      Log Parameter Gradient Norms: " + str(self.log_param_grad_norms))
+        logger.info("      Checkpoint Frequency: " + str(self.checkpoint_freq))
+        logger.info("      Telemetry: " + str(self.telemetry))
+        logger.info("      Profile Steps: " + str(self.profile_steps))
+        logger.info("      Learning Rate Schedule: " + str(self.lr_schedule))
+        logger.info("      Resume From: " + str(self.resume_from))
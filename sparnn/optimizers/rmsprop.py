@@ -29,19 +29,19 @@ class RMSProp(Optimizer):
     def set_name(self):
         self.name = "RMSProp-" + self.id
 
-    def get_update_func(self):
+    def get_updates(self):
         updates = []
         lr = TT.scalar(self._s("learning_rate"), dtype=theano.config.floatX)
         rho = TT.scalar(self._s("decay_rate"), dtype=theano.config.floatX)
         eps = numpy_floatX(1E-6)
-        self.meansquare = [theano.shared(p.get_value() * numpy_floatX(0.), name="%s.meansquare" % p.name) for p in self.model.param]
+        self.meansquare = [theano.shared(p.get_value() * numpy_floatX(0.), name="%s.meansquare" % p.name) for p in self.param]
         g_msnew_list = [rho * g_ms + (1 - rho) * (TT.square(g)) for g, g_ms in zip(self.grad, self.meansquare)]
         updates += [(g_ms, g_msnew) for g_ms, g_msnew in zip(self.meansquare, g_msnew_list)]
-        updates += [(p, p - lr*g/TT.sqrt(g_msnew + eps)) for p, g, g_msnew in zip(self.model.param, self.grad, g_msnew_list)]
-        return self.model.get_update_func(updates, [lr, rho])
+        updates += [(p, p - lr*g/TT.sqrt(g_msnew + eps)) for p, g, g_msnew in zip(self.param, self.grad, g_msnew_list)]
+        return updates, [lr, rho]
 
     def learning_param(self):
-        return [self.learning_rate, self.decay_rate]
+        return [self.scheduled(self.learning_rate), self.decay_rate]
 
     def print_stat(self):
         super(RMSProp, self).print_stat()
@@ -0,0 +1,149 @@
+__author__ = 'zhenyang'
+
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+'''
+Learning rate schedules
+
+A schedule gives the factor the base learning rate of an optimizer is multiplied with at the current step. It is
+evaluated on the host before every update from the counters of the optimizer (current_uidx, current_epoch) and
+the result is passed to the update function as its learning rate input, so changing the learning rate never
+recompiles anything. Optimizer "lr_schedule" hyper parameter, a schedule or a dict with its "type":
+
+    {"type": "constant"}
+    {"type": "step", "decay_rate": 0.1, "decay_step": 10, "decay_begin": 0}
+        multiplied by decay_rate every decay_step epochs (counted from start_epoch) once decay_begin are done
+    {"type": "cosine", "total_steps": None, "min_factor": 0.}
+        cosine annealing from 1 to min_factor over total_steps updates (by default max_epoch epochs of the
+        training iterator)
+    {"type": "plateau", "factor": 0.1, "patience": 2, "threshold": 1e-4, "cooldown": 0, "min_factor": 0.}
+        multiplied by factor when current_validation_error did not improve by threshold for more than
+        patience validations, then left unchanged for cooldown validations
+
+Every schedule takes "warmup_steps": the factor then grows linearly from 1 / warmup_steps to its value over the
+first warmup_steps updates. Warmup and decay count the updates from the same origin, start_uidx (the counters of
+a resumed optimizer go on from its checkpoint). The state of a schedule (e.g. the plateau statistics) is part of the training
+checkpoints (Optimizer.learning_state).
+
+'''
+
+
+class LearningRateSchedule(object):
+    """
+    Constant learning rate, with the linear warmup common to all schedules
+    """
+    def __init__(self, warmup_steps=0):
+        self.warmup_steps = warmup_steps
+
+    def steps(self, optimizer):
+        # updates done since start_uidx, the origin of both the warmup and the decay
+        return optimizer.current_uidx - optimizer.start_uidx
+
+    def factor(self, optimizer):
+        return 1.
+
+    def __call__(self, optimizer):
+        ret = self.factor(optimizer)
+        steps = self.steps(optimizer)
+        if steps < self.warmup_steps:
+            ret *= max(steps, 1) / float(self.warmup_steps)
+        return ret
+
+    def on_validation(self, optimizer):
+        pass
+
+    def state(self):
+        return {}
+
+    def set_state(self, state):
+        self.__dict__.update(state)
+
+    def __str__(self):
+        return type(self).__name__ + str(dict((k, v) for k, v in self.__dict__.items() if not k.startswith('_')))
+
+
+class StepSchedule(LearningRateSchedule):
+    def __init__(self, decay_rate=0.1, decay_step=10, decay_begin=0, warmup_steps=0):
+        super(StepSchedule, self).__init__(warmup_steps)
+        self.decay_rate = decay_rate
+        self.decay_step = decay_step
+        self.decay_begin = decay_begin
+
+    def factor(self, optimizer):
+        # number of epochs k in 1..epochs with k % decay_step == 0 and k >= decay_begin
+        epochs = optimizer.current_epoch - optimizer.start_epoch
+        decays = max(0, epochs // self.decay_step - (max(self.decay_begin, 1) - 1) // self.decay_step)
+        return self.decay_rate ** decays
+
+
+class CosineSchedule(LearningRateSchedule):
+    def __init__(self, total_steps=None, min_factor=0., warmup_steps=0):
+        super(CosineSchedule, self).__init__(warmup_steps)
+        self.total_steps = total_steps
+        self.min_factor = min_factor
+
+    def default_total_steps(self, optimizer):
+        iterator = optimizer.train_data_iterator
+        batches = int(math.ceil(iterator.total() / float(iterator.minibatch_size)))
+        return optimizer.max_epoch * batches
+
+    def factor(self, optimizer):
+        if self.total_steps is None:
+            self.total_steps = self.default_total_steps(optimizer)
+        annealed = max(self.total_steps - self.warmup_steps, 1)
+        progress = min(max(self.steps(optimizer) - self.warmup_steps, 0), annealed)
+        return self.min_factor + (1. - self.min_factor) * 0.5 * (1. + math.cos(math.pi * progress / annealed))
+
+
+class PlateauSchedule(LearningRateSchedule):
+    def __init__(self, factor=0.1, patience=2, threshold=1e-4, cooldown=0, min_factor=0., warmup_steps=0):
+        super(PlateauSchedule, self).__init__(warmup_steps)
+        self.decay = factor
+        self.patience = patience
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.min_factor = min_factor
+        self.scale = 1.
+        self.best = float('inf')
+        self.num_bad = 0
+        self.cooldown_left = 0
+
+    def factor(self, optimizer):
+        return self.scale
+
+    def on_validation(self, optimizer):
+        error = optimizer.current_validation_error
+        if error < self.best - self.threshold:
+            self.best = error
+            self.num_bad = 0
+        else:
+            self.num_bad += 1
+        if self.cooldown_left > 0:
+            self.cooldown_left -= 1
+            self.num_bad = 0
+        elif self.num_bad > self.patience and self.scale > self.min_factor:
+            self.scale = max(self.scale * self.decay, self.min_factor)
+            self.num_bad = 0
+            self.cooldown_left = self.cooldown
+            logger.info("Validation Error Plateau, Learning Rate Factor Reduced To " + str(self.scale))
+
+    def state(self):
+        return {'scale': self.scale, 'best': self.best, 'num_bad': self.num_bad,
+                'cooldown_left': self.cooldown_left}
+
+
+SCHEDULES = {'constant': LearningRateSchedule, 'step': StepSchedule, 'cosine': CosineSchedule,
+             'plateau': PlateauSchedule}
+
+
+def quick_lr_schedule(schedule):
+    """
+    A schedule from its dict description (see above), schedules and None are returned as they are
+    """
+    if schedule is None or isinstance(schedule, LearningRateSchedule):
+        return schedule
+    param = dict(schedule)
+    return SCHEDULES[param.pop('type')](**param)
@@ -7,6 +7,7 @@ import theano.tensor as TT
 import cPickle
 from sparnn.utils import *
 from sparnn.optimizers import Optimizer
+from sparnn.optimizers.schedules import StepSchedule
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +16,7 @@ class SGD(Optimizer):
     """
         First Order Stochastic Gradient Descent With Momentum
         The clipping strategy is the same as the ICML 2013 paper:On the difficulty of training recurrent neural networks
+        Without an lr_schedule the learning rate follows the step schedule of decay_rate, decay_step and decay_begin
     """
 
     def __init__(self,
@@ -30,29 +32,26 @@ class SGD(Optimizer):
         self.decay_rate = hyper_param.get("decay_rate", numpy_floatX(0.1))
         self.decay_step = hyper_param.get("decay_step", (self.max_epoch - self.start_epoch) / 3 + 1)
         self.decay_begin = hyper_param.get("decay_begin", 0)
+        if self.lr_schedule is None:
+            self.lr_schedule = StepSchedule(self.decay_rate, self.decay_step, self.decay_begin)
 
     def set_name(self):
         self.name = "SGD-" + self.id
 
-    def get_update_func(self):
+    def get_updates(self):
         updates = []
         lr = TT.scalar(self._s("learning_rate"), dtype=theano.config.floatX)
         momentum = TT.scalar(self._s("SGD.momentum"), dtype=theano.config.floatX)
         self.grad_last_update = [theano.shared(p.get_value() * numpy_floatX(0.), name="%s.grad_last_update" % p.name)
-                                 for p in self.model.param]
+                                 for p in self.param]
         updates += [(p, p + momentum * p_last_update - lr * p_grad)
-                    for p, p_grad, p_last_update in zip(self.model.param, self.grad, self.grad_last_update)]
+                    for p, p_grad, p_last_update in zip(self.param, self.grad, self.grad_last_update)]
         updates += [(p_last_update, momentum * p_last_update - lr * p_grad)
                     for p_grad, p_last_update in zip(self.grad, self.grad_last_update)]
-        return self.model.get_update_func(updates, [lr, momentum])
+        return updates, [lr, momentum]
 
     def learning_param(self):
-        #if (0 == (self.current_epoch - self.start_epoch + 1) % self.decay_step) and (
-        #            self.current_epoch - self.start_epoch) > self.decay_begin:
-        if (0 == (self.current_epoch - self.start_epoch) % self.decay_step) and (
-                    self.current_epoch - self.start_epoch) >= self.decay_begin:
-            self.learning_rate *= self.decay_rate
-        return [self.learning_rate, self.momentum]
+        return [self.scheduled(self.learning_rate), self.momentum]
 
     def print_stat(self):
         super(SGD, self).print_stat()
@@ -0,0 +1,112 @@
+__author__ = 'zhenyang'
+
+import os
+import csv
+import json
+import logging
+import collections
+
+logger = logging.getLogger(__name__)
+
+'''
+Training telemetry
+
+Optimizer.train times every step when the "telemetry" hyper parameter is set (a sink, or a .csv / .jsonl path):
+
+    data_time        get_batch(), reading and assembling the minibatch
+    transfer_time    converting the minibatch to the dtypes of the interface symbols (host to device)
+    update_time      the compiled update function
+    validation_time  validation run during the step (0 when none)
+    step_time        the whole step, clips_per_sec and frames_per_sec derive from it
+    grad_norm        the global gradient norm (empty unless known, e.g. verbose or data parallel update functions)
+    clipped_steps    the number of steps whose gradient was clipped so far (with a clip_threshold)
+    learning_rate    the learning rate of the step, after the lr_schedule
+
+The sink adds rolling averages over the last `window` steps (avg_* columns) so that a run can be seen to be
+I/O bound (data_time dominating) or compute bound (update_time dominating). At the end of each epoch a record
+of kind "epoch" holds the epoch duration and the epoch end validation time. Without telemetry (or with the no-op
+TelemetrySink) train() calls update() directly and no timing is done at all.
+
+'''
+
+STEP_FIELDS = ['kind', 'epoch', 'uidx', 'cost', 'clips', 'frames', 'data_time', 'transfer_time', 'update_time',
+               'validation_time', 'step_time', 'clips_per_sec', 'frames_per_sec', 'grad_norm', 'clipped_steps',
+               'learning_rate', 'epoch_time']
+AVERAGED_FIELDS = ['data_time', 'transfer_time', 'update_time', 'validation_time', 'step_time', 'clips_per_sec',
+                   'frames_per_sec']
+
+
+class TelemetrySink(object):
+    """
+    No-op sink, subclasses write the records
+    """
+    def record(self, record):
+        pass
+
+    def close(self):
+        pass
+
+
+class RollingTelemetrySink(TelemetrySink):
+    """
+    Keeps the last record with its rolling averages in last_record, subclasses also write the records out
+    """
+    def __init__(self, window=50):
+        self.window = window
+        self.last_record = None
+        self.history = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+
+    def record(self, record):
+        if record['kind'] == 'step':
+            for key in AVERAGED_FIELDS:
+                self.history[key].append(record[key])
+                record['avg_' + key] = sum(self.history[key]) / float(len(self.history[key]))
+        self.write(record)
+
+    def write(self, record):
+        self.last_record = record
+
+
+class CSVTelemetrySink(RollingTelemetrySink):
+    def __init__(self, path, window=50):
+        super(CSVTelemetrySink, self).__init__(window)
+        self.file = open(path, 'wb')
+        self.writer = csv.DictWriter(self.file, STEP_FIELDS + ['avg_' + key for key in AVERAGED_FIELDS],
+                                     restval='', extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, record):
+        super(CSVTelemetrySink, self).write(record)
+        self.writer.writerow(record)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JSONLTelemetrySink(RollingTelemetrySink):
+    def __init__(self, path, window=50):
+        super(JSONLTelemetrySink, self).__init__(window)
+        self.file = open(path, 'w')
+
+    def write(self, record):
+        super(JSONLTelemetrySink, self).write(record)
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def quick_telemetry_sink(sink, window=50):
+    """
+    A sink from a path, by extension (.csv or .jsonl), sinks are returned as they are. None (telemetry disabled)
+    for no sink or the no-op TelemetrySink, so that the optimizer skips the per step timing
+    """
+    if sink is None or type(sink) is TelemetrySink:
+        return None
+    if not isinstance(sink, basestring):
+        return sink
+    if os.path.splitext(sink)[1] == ".csv":
+        return CSVTelemetrySink(sink, window)
+    return JSONLTelemetrySink(sink, window)
@@ -1 +1,2 @@
 from utils import *
+from function_cache import *
@@ -0,0 +1,144 @@
+__author__ = 'zhenyang'
+
+import os
+import time
+import cPickle
+import hashlib
+import logging
+import tempfile
+import numpy
+import theano
+import theano.tensor as TT
+from theano.compile import SharedVariable
+
+logger = logging.getLogger(__name__)
+
+'''
+Compiled function cache
+
+Compiling the unrolled recurrent graphs (quick_unroll_scan over 30 steps) dominates the start up time of a job,
+and it used to be repeated every time a pickled model is loaded. quick_cached_function keeps the compiled
+(optimized) theano functions in a directory, keyed by a hash of the symbolic graph, the compile arguments and the
+theano config, so that a later job building the same graph only unpickles and relinks the function.
+
+A pickled theano function carries its own copies of the shared variables it reads, so the cache also stores
+the position of every shared input in the graph, and the loaded function is rebound to the shared variables
+of the current graph with Function.copy(swap=...). The cached function is swapped to empty placeholders of the
+shared variables before it is pickled, so cache files hold no snapshot of the parameters. The printed graph
+abbreviates large constants, their full data is hashed separately.
+
+'''
+
+
+class LazyFunction(object):
+    """
+    Placeholder for a theano function that is only built by `builder` on the first call.
+    """
+    def __init__(self, builder):
+        self.builder = builder
+        self.function = None
+
+    def is_compiled(self):
+        return self.function is not None
+
+    def compiled(self):
+        if self.function is None:
+            self.function = self.builder()
+        return self.function
+
+    def __call__(self, *args, **kwargs):
+        return self.compiled()(*args, **kwargs)
+
+
+def _as_pairs(pairs):
+    if pairs is None:
+        return []
+    if isinstance(pairs, dict):
+        return list(pairs.items())
+    return list(pairs)
+
+
+def _graph_variables(outputs, updates, givens):
+    variables = list(outputs) if isinstance(outputs, (list, tuple)) else [outputs]
+    for key, value in _as_pairs(updates) + _as_pairs(givens):
+        variables += [key, value]
+    return variables
+
+
+def quick_graph_shared_variables(variables):
+    """
+    Shared variables of the graph in a deterministic (traversal) order
+    """
+    ret = []
+    for variable in theano.gof.graph.inputs(variables):
+        if isinstance(variable, SharedVariable) and variable not in ret:
+            ret.append(variable)
+    return ret
+
+
+def quick_graph_hash(inputs, outputs, updates=None, givens=None, **kwargs):
+    """
+    Hash identifying a theano function: the printed graph (with types), the input signature,
+    the compile arguments, the theano version and the theano config.
+    """
+    h = hashlib.sha1()
+    variables = _graph_variables(outputs, updates, givens)
+    h.update(theano.printing.debugprint(variables, file='str', print_type=True))
+    for variable in theano.gof.graph.inputs(variables):
+        if isinstance(variable, theano.Constant):
+            data = numpy.asarray(variable.data)
+            h.update(str(data.dtype) + str(data.shape))
+            h.update(data.tostring() if data.dtype != object else repr(data.tolist()))
+    h.update(repr([(str(variable.type), variable.name) for variable in inputs]))
+    h.update(repr(sorted((key, repr(value)) for key, value in kwargs.items())))
+    h.update(theano.__version__)
+    h.update(str(theano.config))
+    return h.hexdigest()
+
+
+def _shared_placeholder(variable):
+    # an empty stand in of a shared tensor (broadcastable dimensions keep size 1), other types are kept
+    if not isinstance(variable.type, TT.TensorType):
+        return variable
+    shape = tuple(1 if b else 0 for b in variable.broadcastable)
+    return theano.shared(numpy.zeros(shape, dtype=variable.dtype), name=variable.name,
+                         broadcastable=variable.broadcastable)
+
+
+def quick_cached_function(inputs, outputs, cache_dir=None, updates=None, givens=None, **kwargs):
+    """
+    Drop-in replacement of theano.function that reuses a compiled function from `cache_dir`.
+    Without a cache_dir this is a plain theano.function call.
+    """
+    if cache_dir is None:
+        return theano.function(inputs=inputs, outputs=outputs, updates=updates, givens=givens, **kwargs)
+    key = quick_graph_hash(inputs, outputs, updates, givens, **kwargs)
+    path = os.path.join(cache_dir, key + ".pkl")
+    shared = quick_graph_shared_variables(_graph_variables(outputs, updates, givens))
+    if os.path.exists(path):
+        try:
+            start = time.time()
+            f = open(path, 'rb')
+            order, func = cPickle.load(f)
+            f.close()
+            cached_shared = [i.variable for i in func.maker.inputs if i.shared]
+            func = func.copy(swap=dict((v, shared[k]) for v, k in zip(cached_shared, order)))
+            logger.debug("Loaded Cached Function " + path + " Time Spent: " + str(time.time() - start))
+            return func
+        except Exception as e:
+            logger.warning("Ignoring Unusable Cached Function " + path + ": " + str(e))
+    func = theano.function(inputs=inputs, outputs=outputs, updates=updates, givens=givens, **kwargs)
+    cached_shared = [i.variable for i in func.maker.inputs if i.shared]
+    if all(v in shared for v in cached_shared):
+        order = [shared.index(v) for v in cached_shared]
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        placeholders = dict((v, _shared_placeholder(v)) for v in cached_shared)
+        payload = func.copy(swap=dict((v, p) for v, p in placeholders.items() if p is not v))
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        f = os.fdopen(fd, 'wb')
+        cPickle.dump((order, payload), f, protocol=cPickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmp_path, path)
+        logger.debug("Saved Compiled Function To " + path)
+    return func
@@ -7,6 +7,7 @@ import theano
 import theano.tensor as TT
 import logging
 from theano.sandbox.rng_mrg import MRG_RandomStreams as RandomStreams
+from theano.tensor.opt import Assert
 
 logger = logging.getLogger(__name__)
 
@@ -172,14 +173,30 @@ TODO!! Need further revision
 #        return theano.scan(fn=fn, sequences=sequences, outputs_info=outputs_info, n_steps=n_steps, name=name)
 
 
+def quick_scan(fn, sequences=None, outputs_info=None, non_sequences=None, n_steps=None, name=None,
+               truncate_gradient=-1, checkpoint_every=None):
+    """
+    theano.scan with the recurrent memory options of quick_unroll_scan. When
+    `checkpoint_every` is set the loop is unrolled (n_steps must then be an int),
+    since theano.scan keeps every intermediate activation for the backward pass.
+    """
+    if non_sequences is None:
+        non_sequences = []
+    if checkpoint_every is not None:
+        assert isinstance(n_steps, (int, long)), "checkpoint_every needs a constant n_steps"
+        return quick_unroll_scan(fn=fn, sequences=sequences, outputs_info=outputs_info,
+                                 non_sequences=non_sequences, n_steps=n_steps,
+                                 truncate_gradient=truncate_gradient, checkpoint_every=checkpoint_every)
+    return theano.scan(fn=fn, sequences=sequences, outputs_info=outputs_info, non_sequences=non_sequences,
+                       n_steps=n_steps, name=name, truncate_gradient=truncate_gradient)
+
+
 def quick_unroll_scan(fn, sequences, outputs_info, non_sequences, n_steps,
-                go_backwards=False):
+                go_backwards=False, truncate_gradient=-1, checkpoint_every=None):
         """
         Helper function to unroll for loops. Can be used to unroll theano.scan.
         The parameter names are identical to theano.scan, please refer to here
         for more information.
-        Note that this function does not support the truncate_gradient
-        setting from theano.scan.
         Parameters
         ----------
         fn : function
@@ -197,6 +214,16 @@ def quick_unroll_scan(fn, sequences, outputs_info, non_sequences, n_steps,
         go_backwards: bool
             If true the recursion starts at sequences[-1] and iterates
             backwards.
+        truncate_gradient: int
+            Same meaning as in theano.scan, gradients only flow back through the
+            last `truncate_gradient` steps of the recursion, -1 means full BPTT.
+            The earlier steps are still computed in the forward pass but their
+            activations are not kept for the backward pass.
+        checkpoint_every: int or None
+            If set, every `checkpoint_every` steps are wrapped into one
+            OpFromGraph block. Only the block outputs (the recurrent values) are
+            stored, the gate activations inside a block are recomputed during
+            the backward pass, which bounds the memory for long sequences.
         Returns
         -------
         List of TensorVariables. Each element in the list gives the recurrent
@@ -204,38 +231,123 @@ def quick_unroll_scan(fn, sequences, outputs_info, non_sequences, n_steps,
         """
         if not isinstance(sequences, (list, tuple)):
             sequences = [sequences]
+        assert checkpoint_every is None or checkpoint_every > 0
 
         # When backwards reverse the recursion direction
         counter = range(n_steps)
         if go_backwards:
             counter = counter[::-1]
 
+        # position in `counter` from which the gradient is allowed to flow
+        if 0 < truncate_gradient < n_steps:
+            truncate_at = n_steps - truncate_gradient
+        else:
+            truncate_at = 0
+
+        # split the recursion into blocks, a block never crosses the truncation point
+        block_size = 1 if checkpoint_every is None else checkpoint_every
+        blocks = [(b, min(b + block_size, truncate_at)) for b in range(0, truncate_at, block_size)]
+        blocks += [(b, min(b + block_size, n_steps)) for b in range(truncate_at, n_steps, block_size)]
+
         output = []
         prev_vals = outputs_info
-        for i in counter:
-            step_input = [s[i] for s in sequences] + prev_vals + non_sequences
-            out_ = fn(*step_input)
-            # The returned values from step can be either a TensorVariable,
-            # a list, or a tuple.  Below, we force it to always be a list.
-            if isinstance(out_, TT.TensorVariable):
-                out_ = [out_]
-            if isinstance(out_, tuple):
-                out_ = list(out_)
+        for begin, end in blocks:
+            if begin == truncate_at and truncate_at > 0:
+                prev_vals = [theano.gradient.zero_grad(v) for v in prev_vals]
+            if checkpoint_every is None:
+                step_input = [s[counter[begin]] for s in sequences] + prev_vals + non_sequences
+                out_ = fn(*step_input)
+                # The returned values from step can be either a TensorVariable,
+                # a list, or a tuple.  Below, we force it to always be a list.
+                if isinstance(out_, TT.TensorVariable):
+                    out_ = [out_]
+                if isinstance(out_, tuple):
+                    out_ = list(out_)
+                prev_vals = out_
+                out_ = [TT.shape_padleft(o) for o in out_]
+            else:
+                out_ = _checkpointed_unroll_block(fn, sequences, counter[begin:end], prev_vals, non_sequences)
+                prev_vals = [o[-1] for o in out_]
+            if end <= truncate_at:
+                out_ = [theano.gradient.zero_grad(o) for o in out_]
             output.append(out_)
 
-            prev_vals = output[-1]
-
         # iterate over each scan output and convert it to same format as scan:
         # [[output11, output12,...output1n],
         # [output21, output22,...output2n],...]
         output_scan = []
         for i in range(len(output[0])):
             l = map(lambda x: x[i], output)
-            output_scan.append(TT.stack(*l))
+            output_scan.append(TT.concatenate(l, axis=0))
 
         return output_scan, None
 
 
+def _checkpointed_unroll_block(fn, sequences, steps, prev_vals, non_sequences):
+    """
+    Unroll `fn` over the contiguous `steps` inside one OpFromGraph, so that the
+    gradient of the block is computed by re-running the block from its inputs.
+    Returns the recurrent values of the block stacked along the first axis.
+    """
+    begin = min(steps)
+    end = max(steps) + 1
+    inner_sequences = [s.type() for s in sequences]
+    inner_states = [v.type() for v in prev_vals]
+    inner_output, _ = quick_unroll_scan(fn, inner_sequences, inner_states, non_sequences, end - begin,
+                                        go_backwards=(steps[0] > steps[-1]))
+    block = theano.OpFromGraph(inner_sequences + inner_states, inner_output, inline=False)
+    ret = block(*([s[begin:end] for s in sequences] + list(prev_vals)))
+    if not isinstance(ret, (list, tuple)):
+        ret = [ret]
+    return list(ret)
+
+
+def quick_active_rows(new_value, old_value, n_active):
+    """
+    Merge the value of a step computed only on the first `n_active` rows of the minibatch
+    back into the full minibatch, the remaining rows keep `old_value`. This gives the same result
+    as TT.switch(mask_t, new, old) when the mask of the step is a prefix of ones (batch sorted by length).
+    The step is always run on at least one row, see quick_active_count.
+    """
+    n = quick_active_count(n_active)
+    return TT.concatenate([TT.switch(TT.gt(n_active, 0), new_value, old_value[:n]), old_value[n:]], axis=0)
+
+
+def quick_active_counts(mask):
+    """
+    Number of active rows of every step of a (Timestep, Minibatch) mask, the sequences of the `active_rows`
+    mask mode. The rows of every step must be sorted by activity (the iterators' sort_by_length with
+    mask_padded_frames), an unsorted mask fails at run time instead of silently giving wrong states.
+    """
+    sorted_rows = TT.all(TT.ge(mask[:, :-1], mask[:, 1:]))
+    counts = Assert("active_rows mask mode needs the minibatch sorted by decreasing length")(mask.sum(axis=1),
+                                                                                             sorted_rows)
+    return TT.cast(counts, 'int64')
+
+
+def quick_active_count(n_active):
+    return TT.maximum(n_active, 1)
+
+
+def quick_storage_step(fn, storage_dtype):
+    """
+    Wrap a scan step function so that the recurrent values are stored in `storage_dtype` (e.g. 'float16')
+    between steps while the step itself computes in floatX. Every argument already in `storage_dtype` is
+    upcast on entry and every returned state is downcast on exit. Scan only keeps its outputs for the
+    backward pass (the gate activations of a step are recomputed from them by the gradient scan), so the
+    stored per-step tensors are the states (and e.g. the attention maps of the conditional layers), which
+    all shrink. Parameters, masks and the layer input sequences stay in floatX.
+    """
+    def step(*args):
+        args = [TT.cast(arg, theano.config.floatX) if getattr(arg, 'dtype', None) == storage_dtype else arg
+                for arg in args]
+        outputs = fn(*args)
+        if not isinstance(outputs, (list, tuple)):
+            outputs = [outputs]
+        return [TT.cast(output, storage_dtype) for output in outputs]
+    return step
+
+
 '''
     Quick_zero, dim_vec must be a tuple!
 '''
@@ -461,6 +573,35 @@ def quick_cost(prediction, target, cost_func, mask=None, epsilon=10E-8):
                 assert False
             return ret
 
+    elif "SoftmaxCrossEntropy" == cost_func:
+        # Fused log-softmax + negative log-likelihood, `prediction` holds the pre-softmax logits (e.g.
+        # DenseLayer.linear_output) with the class axis of CategoricalCrossEntropy: the last one for 2D/3D,
+        # axis 1 for 4D (Minibatch, Class, Row, Col) and axis 2 for 5D (Timestep, Minibatch, Class, Row, Col).
+        # Only the log-sum-exp and the logit of the target class are computed, the probability
+        # tensor is never built, which is also numerically stable without any clipping.
+        target64 = TT.cast(target, "int64")
+        if 5 == prediction.ndim:
+            logits = prediction.dimshuffle(0, 1, 3, 4, 2)
+            target64 = target64.dimshuffle(0, 1, 3, 4, 2)
+        elif 4 == prediction.ndim:
+            logits = prediction.dimshuffle(0, 2, 3, 1)
+            target64 = target64.dimshuffle(0, 2, 3, 1)
+        else:
+            assert 2 == prediction.ndim or 3 == prediction.ndim
+            logits = prediction
+        flat_logits = logits.reshape((-1, logits.shape[-1]))
+        logits_max = flat_logits.max(axis=1, keepdims=True)
+        log_sum_exp = TT.log(TT.exp(flat_logits - logits_max).sum(axis=1)) + logits_max.flatten(1)
+        ret = log_sum_exp - flat_logits[TT.arange(flat_logits.shape[0]), target64.flatten(1)]
+        if mask is not None:
+            ret = ret.reshape(logits.shape[:-1], ndim=logits.ndim - 1)
+            if 5 == prediction.ndim:
+                ret = ret * TT.shape_padright(mask, 2)
+            else:
+                assert 3 == prediction.ndim
+                ret = ret * mask
+        return ret.sum()
+
     elif "NegativeLogCosine" == cost_func:
         assert 5 == prediction.ndim
         if mask is None:
@@ -541,6 +682,43 @@ def quick_theano_rng(npy_rng):
     return RandomStreams(npy_rng.randint(1, 2147462579))
 
 
+ITERATOR_STATE_ATTRS = ['indices', 'current_position', 'current_batch_size', 'current_batch_indices',
+                        'current_input_length', 'current_output_length']
+ITERATOR_RNG_ATTRS = ['rng', 'frame_rng']
+
+
+def quick_iterator_state(iterator, position=True):
+    """
+    Position of an iterator in its epoch (shuffled order, current batch) and the state of its random generators,
+    enough to produce the same minibatches again with quick_set_iterator_state. At the end of an epoch
+    (position=False) only the random generators are kept, the next epoch shuffles and samples frames from them
+    """
+    state = {}
+    for name in ITERATOR_STATE_ATTRS:
+        if position and hasattr(iterator, name):
+            state[name] = numpy.array(getattr(iterator, name), copy=True) if name.endswith('indices') \
+                else getattr(iterator, name)
+    for name in ITERATOR_RNG_ATTRS:
+        if getattr(iterator, name, None) is not None:
+            state[name] = getattr(iterator, name).get_state()
+    return state
+
+
+def quick_set_iterator_state(iterator, state):
+    """
+    Returns whether a position was restored, if not the iterator still has to begin() its epoch
+    """
+    for name in ITERATOR_RNG_ATTRS:
+        if name in state:
+            getattr(iterator, name).set_state(state[name])
+    restored_position = False
+    for name in ITERATOR_STATE_ATTRS:
+        if name in state:
+            setattr(iterator, name, state[name])
+            restored_position = True
+    return restored_position
+
+
 def quick_timed_log_eval(logger_func, s, func, *args):
     start = time.time()
     result = func(*args)
@@ -574,6 +752,20 @@ def quick_reshape_patch_back(patch_tensor, patch_size):
     return ret
 
 
+def quick_classification_stats(probs, truth, top_k=5):
+    """
+    probs: (#examples, #classes) scores, truth: (#examples,) int labels
+    """
+    num_classes = probs.shape[1]
+    pred = numpy.argmax(probs, axis=1)
+    top_k_pred = numpy.argsort(-probs, axis=1)[:, :top_k]
+    confusion = numpy.bincount(truth * num_classes + pred, minlength=num_classes * num_classes).reshape(
+        (num_classes, num_classes))
+    return {'top1': (truth == pred).mean(),
+            'top%d' % top_k: (top_k_pred == truth[:, None]).any(axis=1).mean(),
+            'confusion': confusion}
+
+
 def numpy_floatX(input):
     if theano.config.floatX == 'float32':
         return numpy.float32(input)
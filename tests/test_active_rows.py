@@ -0,0 +1,100 @@
+__author__ = 'zhenyang'
+
+'''
+The `active_rows` mask mode of LSTMLayer against the default `switch` mode, on a minibatch sorted by decreasing
+length and on an unsorted one (which has to be rejected), and of DeepCondConvLSTMLayer including its attention
+maps (padded rows keep the previous one in both modes)
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+import theano
+import theano.tensor as TT
+
+import sparnn.utils
+from sparnn.layers import LSTMLayer
+from sparnn.layers import DeepCondConvLSTMLayer
+
+FEATURE_DIM = 5
+HIDDEN = 4
+STEPS = 6
+CHANNELS = 3
+MAP_SIZE = 4
+
+
+def lstm_output_function(mask_mode):
+    rng = sparnn.utils.quick_npy_rng(1337)
+    x = TT.tensor3('x')
+    mask = TT.matrix('mask')
+    layer = LSTMLayer({"id": mask_mode, "rng": rng, "theano_rng": sparnn.utils.quick_theano_rng(rng),
+                       "dim_in": (FEATURE_DIM,), "dim_out": (HIDDEN,), "minibatch_size": x.shape[1],
+                       "input": x, "mask": mask, "n_steps": STEPS, "mask_mode": mask_mode})
+    return theano.function([x, mask], layer.output)
+
+
+def deep_cond_output_function(mask_mode):
+    rng = sparnn.utils.quick_npy_rng(1337)
+    x = TT.TensorType(theano.config.floatX, (False,) * 5)('x')
+    ctx = TT.TensorType(theano.config.floatX, (False,) * 5)('ctx')
+    mask = TT.matrix('mask')
+    state_shape = (x.shape[1], HIDDEN, MAP_SIZE, MAP_SIZE)
+    layer = DeepCondConvLSTMLayer({"id": mask_mode, "rng": rng, "theano_rng": sparnn.utils.quick_theano_rng(rng),
+                                   "dim_in": (CHANNELS, MAP_SIZE, MAP_SIZE), "dim_out": (HIDDEN, MAP_SIZE, MAP_SIZE),
+                                   "ctx_dim_in": (CHANNELS, MAP_SIZE, MAP_SIZE),
+                                   "ctx_dim_out": (HIDDEN, MAP_SIZE, MAP_SIZE),
+                                   "input_receptive_field": (3, 3), "transition_receptive_field": (3, 3),
+                                   "context_input_receptive_field": (1, 1),
+                                   "context_transition_receptive_field": (1, 1),
+                                   "minibatch_size": x.shape[1], "input": x, "context": ctx, "mask": mask,
+                                   "init_hidden_state": sparnn.utils.quick_theano_zero(state_shape),
+                                   "init_cell_state": sparnn.utils.quick_theano_zero(state_shape),
+                                   "init_context_hidden_state": sparnn.utils.quick_theano_zero(state_shape),
+                                   "init_context_cell_state": sparnn.utils.quick_theano_zero(state_shape),
+                                   "n_steps": STEPS, "mask_mode": mask_mode})
+    return theano.function([x, ctx, mask], [layer.output, layer.ctx_output, layer.alpha])
+
+
+def length_mask(lengths):
+    return (numpy.arange(STEPS)[:, None] < numpy.asarray(lengths)[None, :]).astype(theano.config.floatX)
+
+
+class ActiveRowsTest(unittest.TestCase):
+    def setUp(self):
+        self.x = numpy.random.RandomState(1000).normal(size=(STEPS, 4, FEATURE_DIM)).astype(theano.config.floatX)
+        self.switch = lstm_output_function('switch')
+        self.active_rows = lstm_output_function('active_rows')
+
+    def test_sorted_batch_matches_switch(self):
+        mask = length_mask([6, 4, 4, 1])
+        numpy.testing.assert_allclose(self.active_rows(self.x, mask), self.switch(self.x, mask),
+                                      rtol=1e-5, atol=1e-6)
+
+    def test_unsorted_batch_is_rejected(self):
+        mask = length_mask([4, 6, 1, 4])
+        self.assertRaises(AssertionError, self.active_rows, self.x, mask)
+
+
+class DeepCondActiveRowsTest(unittest.TestCase):
+    def test_sorted_batch_matches_switch_including_attention(self):
+        rng = numpy.random.RandomState(1000)
+        shape = (STEPS, 4, CHANNELS, MAP_SIZE, MAP_SIZE)
+        x = rng.normal(size=shape).astype(theano.config.floatX)
+        ctx = rng.normal(size=shape).astype(theano.config.floatX)
+        mask = length_mask([6, 4, 4, 1])
+        switch = deep_cond_output_function('switch')(x, ctx, mask)
+        active_rows = deep_cond_output_function('active_rows')(x, ctx, mask)
+        for value, expected in zip(active_rows, switch):
+            numpy.testing.assert_allclose(value, expected, rtol=1e-5, atol=1e-6)
+        # the attention map of a padded step is the one of the last valid step
+        alpha = switch[2]
+        numpy.testing.assert_allclose(alpha[5, 1], alpha[3, 1])
+        numpy.testing.assert_allclose(alpha[5, 3], alpha[0, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+__author__ = 'zhenyang'
+
+'''
+Resuming a training checkpoint with data parallel workers ("num_workers"): the first step after the resume has
+to see the restored parameters, its cost is compared with the one of a single process resume
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import numpy
+
+from sparnn.optimizers import RMSProp
+from sparnn.optimizers.checkpoint import write_checkpoint
+from synthetic import synthetic_splits, build_lstm_model
+
+FEATURE_DIM = 8
+HIDDEN = 6
+CLASSES = 4
+STEPS = 5
+MINIBATCH_SIZE = 8
+
+
+class DataParallelResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.save_path = tempfile.mkdtemp(prefix="data-parallel-resume-")
+        self.train, _ = synthetic_splits(FEATURE_DIM, CLASSES, STEPS, MINIBATCH_SIZE * 4, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.save_path)
+
+    def batch(self, index):
+        begin = index * MINIBATCH_SIZE
+        return [d[:, begin:begin + MINIBATCH_SIZE] for d in self.train[:3]]
+
+    def optimizer(self, num_workers, resume_from=None):
+        model = build_lstm_model(FEATURE_DIM, HIDDEN, CLASSES, STEPS, "Resume-Test-LSTM")
+        param = {'id': 'resume', 'learning_rate': 0.01, 'decay_rate': 0.9, 'clip_threshold': None,
+                 'verbose': False, 'max_epoch': 1, 'save_path': self.save_path, 'num_workers': num_workers}
+        if resume_from is not None:
+            param['resume_from'] = resume_from
+        return RMSProp(model, None, None, None, param)
+
+    def test_first_step_after_resume_matches_single_process(self):
+        trained = self.optimizer(1)
+        for i in xrange(3):
+            trained.current_uidx += 1
+            trained.update(self.batch(i))
+        path = os.path.join(self.save_path, "resume.ckpt")
+        write_checkpoint(path, trained.training_state(epoch_done=True))
+
+        single = self.optimizer(1, path)
+        parallel = self.optimizer(2, path)
+        try:
+            expected = single.update(self.batch(3))
+            cost = parallel.update(self.batch(3))
+        finally:
+            parallel.update_func.close()
+        self.assertAlmostEqual(cost / expected, 1., places=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
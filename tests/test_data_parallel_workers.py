@@ -0,0 +1,86 @@
+__author__ = 'zhenyang'
+
+'''
+Life time of the data parallel worker processes: none is forked by an optimizer that is not trained, and they are
+stopped when train() fails, for the synchronous and the asynchronous ("parallel_mode": "async") update functions
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from sparnn.optimizers import RMSProp
+from synthetic import synthetic_splits, build_lstm_model
+
+FEATURE_DIM = 8
+HIDDEN = 6
+CLASSES = 4
+STEPS = 5
+MINIBATCH_SIZE = 8
+
+
+class FailingIterator(object):
+    """
+    Hands out one batch, then fails like a broken data source
+    """
+    def __init__(self, batch):
+        self.batch = batch
+        self.remaining = 1
+
+    def begin(self, do_shuffle=True):
+        pass
+
+    def get_batch(self):
+        if self.remaining == 0:
+            raise IOError("data source failed")
+        self.remaining -= 1
+        return self.batch
+
+    def next(self):
+        pass
+
+    def no_batch_left(self):
+        return False
+
+
+class DataParallelWorkersTest(unittest.TestCase):
+    def setUp(self):
+        train, _ = synthetic_splits(FEATURE_DIM, CLASSES, STEPS, MINIBATCH_SIZE, 1)
+        self.batch = list(train[:3])
+
+    def optimizer(self, parallel_mode):
+        model = build_lstm_model(FEATURE_DIM, HIDDEN, CLASSES, STEPS, "Workers-Test-LSTM")
+        param = {'id': parallel_mode, 'learning_rate': 0.01, 'decay_rate': 0.9, 'clip_threshold': None,
+                 'verbose': False, 'max_epoch': 1, 'save_path': '/tmp', 'num_workers': 2,
+                 'parallel_mode': parallel_mode}
+        return RMSProp(model, FailingIterator(self.batch), None, None, param)
+
+    def check(self, parallel_mode):
+        optimizer = self.optimizer(parallel_mode)
+        self.assertEqual(optimizer.update_func.processes, [])
+        processes = []
+        start = optimizer.update_func.start
+
+        def recording_start():
+            start()
+            processes.extend(optimizer.update_func.processes)
+        optimizer.update_func.start = recording_start
+
+        self.assertRaises(IOError, optimizer.train)
+        self.assertEqual(len(processes), 2)
+        self.assertEqual(optimizer.update_func.processes, [])
+        for process in processes:
+            self.assertFalse(process.is_alive())
+
+    def test_sync_workers_stop_when_training_fails(self):
+        self.check('sync')
+
+    def test_async_workers_stop_when_training_fails(self):
+        self.check('async')
+
+
+if __name__ == '__main__':
+    unittest.main()
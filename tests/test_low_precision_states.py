@@ -0,0 +1,59 @@
+__author__ = 'zhenyang'
+
+'''
+Recurrent states stored in float16 ("state_dtype") together with the static loss scaling of the optimizers
+("loss_scale"): the parameter gradients have to stay within tolerance of the float32 ones
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import numpy
+import theano
+
+from sparnn.optimizers import RMSProp
+from synthetic import synthetic_splits, build_lstm_model
+
+FEATURE_DIM = 8
+HIDDEN = 6
+CLASSES = 4
+STEPS = 6
+MINIBATCH_SIZE = 8
+
+
+def grad_function(state_dtype, loss_scale=None):
+    model = build_lstm_model(FEATURE_DIM, HIDDEN, CLASSES, STEPS, "Low-Precision-Test-LSTM", state_dtype=state_dtype)
+    param = {'id': state_dtype, 'learning_rate': 0.01, 'decay_rate': 0.9, 'clip_threshold': None,
+             'verbose': False, 'max_epoch': 1}
+    if loss_scale is not None:
+        param['loss_scale'] = loss_scale
+    optimizer = RMSProp(model, None, None, None, param)
+    return model, theano.function(model.interface_layer.symbols(), optimizer.get_model_grad())
+
+
+class LowPrecisionStatesTest(unittest.TestCase):
+    def setUp(self):
+        train, _ = synthetic_splits(FEATURE_DIM, CLASSES, STEPS, MINIBATCH_SIZE, 1)
+        self.batch = list(train[:3])
+
+    def test_states_are_stored_in_float16(self):
+        model, _ = grad_function('float16', 128.)
+        lstm = model.middle_layers[0]
+        # the scan outputs kept for the backward pass, before the cast back to floatX
+        self.assertEqual(lstm.output.owner.inputs[0].dtype, 'float16')
+        self.assertEqual(lstm.cell_output.owner.inputs[0].dtype, 'float16')
+
+    def test_scaled_float16_gradients_match_float32(self):
+        _, reference_grad = grad_function('float32')
+        _, low_precision_grad = grad_function('float16', 128.)
+        for expected, grad in zip(reference_grad(*self.batch), low_precision_grad(*self.batch)):
+            self.assertTrue(numpy.all(numpy.isfinite(grad)))
+            numpy.testing.assert_allclose(grad, expected, rtol=5e-2, atol=5e-3 * numpy.abs(expected).max())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+__author__ = 'zhenyang'
+
+'''
+Learning rate schedules with an optimizer that does not start at update 0 (start_uidx > 0)
+'''
+
+import os
+import sys
+import math
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sparnn.optimizers.schedules import LearningRateSchedule, CosineSchedule
+
+
+class Counters(object):
+    # the counters of an Optimizer the schedules read
+    def __init__(self, start_uidx, start_epoch=0):
+        self.start_uidx = start_uidx
+        self.current_uidx = start_uidx
+        self.start_epoch = start_epoch
+        self.current_epoch = start_epoch
+        self.max_epoch = 1
+
+
+class ScheduleOriginTest(unittest.TestCase):
+    def test_warmup_starts_at_start_uidx(self):
+        schedule = LearningRateSchedule(warmup_steps=10)
+        optimizer = Counters(start_uidx=1000)
+        optimizer.current_uidx += 1
+        self.assertAlmostEqual(schedule(optimizer), 0.1)
+        optimizer.current_uidx += 4
+        self.assertAlmostEqual(schedule(optimizer), 0.5)
+        optimizer.current_uidx += 5
+        self.assertAlmostEqual(schedule(optimizer), 1.)
+
+    def test_cosine_decay_follows_warmup(self):
+        schedule = CosineSchedule(total_steps=110, warmup_steps=10)
+        optimizer = Counters(start_uidx=500)
+        optimizer.current_uidx = 505
+        self.assertAlmostEqual(schedule(optimizer), 0.5)
+        optimizer.current_uidx = 510
+        self.assertAlmostEqual(schedule(optimizer), 1.)
+        optimizer.current_uidx = 560
+        self.assertAlmostEqual(schedule(optimizer), 0.5 * (1. + math.cos(math.pi * 0.5)))
+        optimizer.current_uidx = 610
+        self.assertAlmostEqual(schedule(optimizer), 0.)
+
+
+if __name__ == '__main__':
+    unittest.main()
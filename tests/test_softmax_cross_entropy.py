@@ -0,0 +1,97 @@
+__author__ = 'zhenyang'
+
+'''
+The fused "SoftmaxCrossEntropy" cost on logits against the softmax activation followed by "CategoricalCrossEntropy",
+in value and in gradient w.r.t. the logits, for every input rank the categorical cost accepts, with and without mask
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+import theano
+import theano.tensor as TT
+
+import sparnn.utils
+
+CLASSES = 6
+STEPS = 4
+MINIBATCH = 3
+ROWS = 2
+COLS = 2
+
+
+def cost_and_grad_function(ndim, masked):
+    logits = TT.TensorType(theano.config.floatX, (False,) * ndim)('logits')
+    target = TT.TensorType(theano.config.floatX, (False,) * (ndim - 1 if ndim < 4 else ndim))('target')
+    inputs = [logits, target]
+    mask = None
+    if masked:
+        mask = TT.matrix('mask')
+        inputs.append(mask)
+    fused = sparnn.utils.quick_cost(logits, target, "SoftmaxCrossEntropy", mask)
+    reference = sparnn.utils.quick_cost(sparnn.utils.quick_activation(logits, "softmax"), target,
+                                        "CategoricalCrossEntropy", mask)
+    return theano.function(inputs, [fused, reference, TT.grad(fused, logits), TT.grad(reference, logits)])
+
+
+class SoftmaxCrossEntropyTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = numpy.random.RandomState(1337)
+
+    def data(self, ndim):
+        shapes = {2: ((MINIBATCH, CLASSES), (MINIBATCH,)),
+                  3: ((STEPS, MINIBATCH, CLASSES), (STEPS, MINIBATCH)),
+                  4: ((MINIBATCH, CLASSES, ROWS, COLS), (MINIBATCH, 1, ROWS, COLS)),
+                  5: ((STEPS, MINIBATCH, CLASSES, ROWS, COLS), (STEPS, MINIBATCH, 1, ROWS, COLS))}
+        logits_shape, target_shape = shapes[ndim]
+        logits = self.rng.normal(scale=2.0, size=logits_shape).astype(theano.config.floatX)
+        target = self.rng.randint(CLASSES, size=target_shape).astype(theano.config.floatX)
+        return [logits, target]
+
+    def mask(self):
+        mask = numpy.ones((STEPS, MINIBATCH), dtype=theano.config.floatX)
+        mask[STEPS - 1:, 0] = 0
+        mask[STEPS - 2:, 2] = 0
+        return mask
+
+    def check(self, ndim, masked):
+        inputs = self.data(ndim)
+        if masked:
+            inputs.append(self.mask())
+        fused, reference, fused_grad, reference_grad = cost_and_grad_function(ndim, masked)(*inputs)
+        numpy.testing.assert_allclose(fused, reference, rtol=1e-4)
+        numpy.testing.assert_allclose(fused_grad, reference_grad, rtol=1e-3, atol=1e-5)
+
+    def test_matrix(self):
+        self.check(2, False)
+
+    def test_sequence(self):
+        self.check(3, False)
+
+    def test_masked_sequence(self):
+        self.check(3, True)
+
+    def test_feature_maps(self):
+        self.check(4, False)
+
+    def test_feature_map_sequence(self):
+        self.check(5, False)
+
+    def test_masked_feature_map_sequence(self):
+        self.check(5, True)
+
+    def test_large_logits_stay_finite(self):
+        logits, target = self.data(3)
+        logits[0, 0, :] = [1000.0, -1000.0, 0.0, 500.0, -500.0, 10.0]
+        target[0, 0] = 1
+        fused, _, fused_grad, _ = cost_and_grad_function(3, False)(logits, target)
+        self.assertTrue(numpy.isfinite(fused))
+        self.assertTrue(numpy.all(numpy.isfinite(fused_grad)))
+
+
+if __name__ == '__main__':
+    unittest.main()
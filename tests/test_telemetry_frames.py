@@ -0,0 +1,102 @@
+__author__ = 'zhenyang'
+
+'''
+Frame count of the step telemetry (Optimizer.timed_update) on a StackInterfaceLayer model, whose interface symbols
+are input + context + mask + output, and the disabled telemetry (no sink or the no-op sink) which skips the timing
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+import theano
+
+import sparnn.utils
+from sparnn.layers import StackInterfaceLayer
+from sparnn.layers import LSTMLayer
+from sparnn.layers import FeedForwardLayer
+from sparnn.layers import ElementwiseCostLayer
+from sparnn.models import VideoModel
+from sparnn.optimizers import RMSProp
+from sparnn.optimizers.telemetry import TelemetrySink, RollingTelemetrySink, quick_telemetry_sink
+
+FEATURE_DIM = 5
+HIDDEN = 4
+CLASSES = 3
+STEPS = 6
+
+
+class FixedBatchIterator(object):
+    def __init__(self, batch):
+        self.batch = batch
+
+    def get_batch(self):
+        return self.batch
+
+
+def build_stack_model():
+    rng = sparnn.utils.quick_npy_rng(1337)
+    theano_rng = sparnn.utils.quick_theano_rng(rng)
+    interface_layer = StackInterfaceLayer({"id": "frames", "use_mask": True, "input_ndim": 3, "context_ndim": 3,
+                                           "output_ndim": 2, "output_data_type": "int64"})
+    x = interface_layer.input
+    mask = interface_layer.mask
+    minibatch_size = x.shape[1]
+    middle_layers = [LSTMLayer({"id": 0, "rng": rng, "theano_rng": theano_rng,
+                                "dim_in": (FEATURE_DIM,), "dim_out": (HIDDEN,), "minibatch_size": minibatch_size,
+                                "input": x + interface_layer.context, "mask": mask, "n_steps": STEPS})]
+    middle_layers.append(FeedForwardLayer({"id": 1, "rng": rng, "theano_rng": theano_rng,
+                                           "dim_in": (HIDDEN,), "dim_out": (CLASSES,),
+                                           "minibatch_size": minibatch_size, "activation": "softmax",
+                                           "input": middle_layers[0].output}))
+    cost_layer = ElementwiseCostLayer({"id": "cost", "rng": rng, "theano_rng": theano_rng,
+                                       "dim_in": (CLASSES,), "dim_out": (1,), "minibatch_size": minibatch_size,
+                                       "cost_func": "CategoricalCrossEntropy", "param_layers": middle_layers,
+                                       "input": middle_layers[1].output, "mask": mask,
+                                       "target": interface_layer.output})
+    return VideoModel({'interface_layer': interface_layer, 'middle_layers': middle_layers,
+                       'cost_layer': cost_layer, 'last_n': STEPS, 'name': "Frames-Test-LSTM",
+                       'outputs': None, 'errors': None, 'problem_type': "classification"})
+
+
+class TelemetryFramesTest(unittest.TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(1000)
+        self.lengths = numpy.array([6, 3, 2, 5])
+        x = rng.normal(size=(STEPS, 4, FEATURE_DIM)).astype(theano.config.floatX)
+        context = numpy.ones((STEPS, 4, FEATURE_DIM), dtype=theano.config.floatX)
+        mask = (numpy.arange(STEPS)[:, None] < self.lengths[None, :]).astype(theano.config.floatX)
+        y = rng.randint(CLASSES, size=(STEPS, 4)).astype('int64')
+        self.batch = [x, context, mask, y]
+
+    def optimizer(self, telemetry=None):
+        param = {'id': 'frames', 'learning_rate': 0.001, 'decay_rate': 0.9, 'clip_threshold': None,
+                 'verbose': False, 'max_epoch': 1, 'save_path': '/tmp', 'telemetry': telemetry}
+        return RMSProp(build_stack_model(), FixedBatchIterator(self.batch), None, None, param)
+
+    def test_frames_of_stack_interface_model(self):
+        lengths = self.lengths
+        optimizer = self.optimizer()
+        optimizer.timed_update()
+        self.assertEqual(optimizer.step_record['frames'], float(lengths.sum()))
+        self.assertEqual(optimizer.step_record['clips'], 4)
+
+    def test_rolling_sink_keeps_the_averaged_record(self):
+        sink = RollingTelemetrySink(window=2)
+        optimizer = self.optimizer(sink)
+        optimizer.timed_update()
+        optimizer.record_step()
+        self.assertEqual(sink.last_record['frames'], float(self.lengths.sum()))
+        self.assertEqual(sink.last_record['avg_step_time'], sink.last_record['step_time'])
+
+    def test_disabled_telemetry(self):
+        self.assertIsNone(quick_telemetry_sink(None))
+        self.assertIsNone(quick_telemetry_sink(TelemetrySink()))
+        self.assertIsNone(self.optimizer(TelemetrySink()).telemetry)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+__author__ = 'zhenyang'
+
+'''
+Resuming training from the checkpoint saved at the end of an epoch: the next epoch has to be shuffled by the
+restored random generator of the training iterator, so that the parameters end up identical to the ones of a run
+trained straight through
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import numpy
+
+from sparnn.optimizers import RMSProp
+from synthetic import synthetic_splits, build_lstm_model
+
+FEATURE_DIM = 8
+HIDDEN = 6
+CLASSES = 4
+STEPS = 5
+MINIBATCH_SIZE = 4
+NUM_TRAIN = MINIBATCH_SIZE * 3
+
+
+class ShuffledIterator(object):
+    """
+    Minibatches of in-memory sequences, shuffled at every epoch by its own random generator like the video iterators
+    """
+    def __init__(self, data, seed=1234):
+        self.data = data
+        self.rng = numpy.random.RandomState(seed)
+
+    def total(self):
+        return self.data[0].shape[1]
+
+    def begin(self, do_shuffle=True):
+        self.indices = numpy.arange(self.total(), dtype="int32")
+        if do_shuffle:
+            self.rng.shuffle(self.indices)
+        self.current_position = 0
+        self.current_batch_size = MINIBATCH_SIZE
+        self.current_batch_indices = self.indices[:MINIBATCH_SIZE]
+
+    def next(self):
+        self.current_position += self.current_batch_size
+        self.current_batch_indices = self.indices[self.current_position:self.current_position + MINIBATCH_SIZE]
+
+    def no_batch_left(self):
+        return self.current_position >= self.total()
+
+    def get_batch(self):
+        return [d[:, self.current_batch_indices] for d in self.data]
+
+
+class TrainingResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.save_path = tempfile.mkdtemp(prefix="training-resume-")
+        train, _ = synthetic_splits(FEATURE_DIM, CLASSES, STEPS, NUM_TRAIN, 1)
+        self.train = list(train[:3])
+
+    def tearDown(self):
+        shutil.rmtree(self.save_path)
+
+    def optimizer(self, name, max_epoch, **extra):
+        model = build_lstm_model(FEATURE_DIM, HIDDEN, CLASSES, STEPS, name)
+        param = {'id': 'resume', 'learning_rate': 0.01, 'decay_rate': 0.9, 'clip_threshold': None,
+                 'verbose': False, 'max_epoch': max_epoch, 'valid_epoch': 100, 'save_path': self.save_path}
+        param.update(extra)
+        return RMSProp(model, ShuffledIterator(self.train), None, None, param)
+
+    def test_resume_from_epoch_boundary_matches_straight_training(self):
+        straight = self.optimizer("Straight-LSTM", 2)
+        straight.train()
+
+        first = self.optimizer("Resumed-LSTM", 1, checkpoint_freq=1000)
+        first.train()
+        resumed = self.optimizer("Resumed-LSTM", 2, resume_from="latest")
+        self.assertEqual(resumed.current_uidx, first.current_uidx)
+        resumed.train()
+
+        self.assertEqual(resumed.current_uidx, straight.current_uidx)
+        for expected, param in zip(straight.model.param, resumed.model.param):
+            numpy.testing.assert_array_equal(param.get_value(), expected.get_value())
+
+
+if __name__ == '__main__':
+    unittest.main()
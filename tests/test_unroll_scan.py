@@ -0,0 +1,63 @@
+__author__ = 'zhenyang'
+
+'''
+Gradients of the unrolled recursion (quick_unroll_scan) of LSTMLayer: block checkpointing ("checkpoint_every") has
+to give the plain BPTT gradients, truncation ("truncate_gradient") has to cut the gradient of the steps older
+than the last `truncate_gradient` ones
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+import theano
+import theano.tensor as TT
+
+import sparnn.utils
+from sparnn.layers import LSTMLayer
+
+FEATURE_DIM = 5
+HIDDEN = 4
+STEPS = 7
+
+
+def lstm_layer(x, **layer_param):
+    rng = sparnn.utils.quick_npy_rng(1337)
+    param = {"id": "unroll", "rng": rng, "theano_rng": sparnn.utils.quick_theano_rng(rng),
+             "dim_in": (FEATURE_DIM,), "dim_out": (HIDDEN,), "minibatch_size": x.shape[1],
+             "input": x, "n_steps": STEPS}
+    param.update(layer_param)
+    return LSTMLayer(param)
+
+
+class UnrollScanGradientTest(unittest.TestCase):
+    def setUp(self):
+        self.x = numpy.random.RandomState(1000).normal(size=(STEPS, 3, FEATURE_DIM)).astype(theano.config.floatX)
+
+    def param_grads(self, **layer_param):
+        x = TT.tensor3('x')
+        layer = lstm_layer(x, **layer_param)
+        cost = TT.sqr(layer.output).sum()
+        return theano.function([x], TT.grad(cost, layer.param))(self.x)
+
+    def test_checkpointed_gradients_match_bptt(self):
+        expected = self.param_grads()
+        for checkpoint_every in [1, 2, 3]:
+            for g, e in zip(self.param_grads(checkpoint_every=checkpoint_every), expected):
+                numpy.testing.assert_allclose(g, e, rtol=1e-4, atol=1e-6)
+
+    def test_truncated_gradient_zeroes_older_steps(self):
+        truncate = 3
+        for checkpoint_every in [None, 2]:
+            x = TT.tensor3('x')
+            layer = lstm_layer(x, truncate_gradient=truncate, checkpoint_every=checkpoint_every)
+            grad = theano.function([x], TT.grad(layer.output[-1].sum(), x))(self.x)
+            self.assertTrue(numpy.all(grad[:STEPS - truncate] == 0.))
+            self.assertTrue(numpy.all(numpy.abs(grad[STEPS - truncate:]).sum(axis=(1, 2)) > 0.))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+__author__ = 'zhenyang'
+
+'''
+VideoStreamPredictor against the batch outputs of VideoModel on a model whose initial states are computed from
+the mean of the clip (the initialization of the UCF101 models)
+'''
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy
+import theano
+import theano.tensor as TT
+
+import sparnn.utils
+from sparnn.layers import InterfaceLayer
+from sparnn.layers import FeedForwardLayer
+from sparnn.layers import LSTMLayer
+from sparnn.layers import ElementwiseCostLayer
+from sparnn.models import VideoModel
+
+FEATURE_DIM = 8
+HIDDEN = 6
+CLASSES = 4
+STEPS = 5
+
+
+def build_mean_init_model():
+    rng = sparnn.utils.quick_npy_rng(1337)
+    theano_rng = sparnn.utils.quick_theano_rng(rng)
+
+    interface_layer = InterfaceLayer({"id": "stream", "use_mask": True, "input_ndim": 3, "output_ndim": 2,
+                                      "output_data_type": "int64"})
+    x = interface_layer.input
+    mask = interface_layer.mask
+    minibatch_size = x.shape[1]
+
+    middle_layers = []
+    for i in xrange(2):
+        middle_layers.append(FeedForwardLayer({"id": i, "rng": rng, "theano_rng": theano_rng,
+                                               "dim_in": (FEATURE_DIM,), "dim_out": (HIDDEN,),
+                                               "minibatch_size": minibatch_size, "activation": "tanh",
+                                               "input": x.mean(0)}))
+    middle_layers.append(LSTMLayer({"id": 2, "rng": rng, "theano_rng": theano_rng,
+                                    "dim_in": (FEATURE_DIM,), "dim_out": (HIDDEN,),
+                                    "minibatch_size": minibatch_size, "input": x, "mask": mask,
+                                    "init_hidden_state": middle_layers[0].output,
+                                    "init_cell_state": middle_layers[1].output,
+                                    "n_steps": STEPS}))
+    middle_layers.append(FeedForwardLayer({"id": 3, "rng": rng, "theano_rng": theano_rng,
+                                           "dim_in": (HIDDEN,), "dim_out": (CLASSES,),
+                                           "minibatch_size": minibatch_size, "activation": "softmax",
+                                           "input": middle_layers[2].output}))
+    cost_layer = ElementwiseCostLayer({"id": "cost", "rng": rng, "theano_rng": theano_rng,
+                                       "dim_in": (CLASSES,), "dim_out": (1,), "minibatch_size": minibatch_size,
+                                       "cost_func": "CategoricalCrossEntropy", "param_layers": middle_layers,
+                                       "input": middle_layers[3].output, "mask": mask,
+                                       "target": interface_layer.output})
+    return VideoModel({'interface_layer': interface_layer, 'middle_layers': middle_layers,
+                       'cost_layer': cost_layer, 'last_n': STEPS, 'name': "Stream-Test-LSTM",
+                       'outputs': [{"name": "probability", "value": middle_layers[3].output}],
+                       'errors': None, 'problem_type': "classification"})
+
+
+class VideoStreamPredictorTest(unittest.TestCase):
+    def setUp(self):
+        self.model = build_mean_init_model()
+        self.model.set_mode("predict")
+        self.clip = numpy.random.RandomState(1000).normal(size=(STEPS, 3, FEATURE_DIM)).astype('float32')
+        x, mask = self.model.interface_layer.input, self.model.interface_layer.mask
+        probability = theano.function([x, mask], self.model.outputs[0]['value'], on_unused_input='ignore')
+        self.batch = probability(self.clip, numpy.ones(self.clip.shape[:2], dtype=theano.config.floatX))
+
+    def test_warm_up_clip_matches_batch_outputs(self):
+        predictor = self.model.get_stream_predictor()
+        predictor.reset(self.clip)
+        for t in xrange(STEPS):
+            score = predictor.push(self.clip[t])
+            numpy.testing.assert_allclose(score, self.batch[:t + 1].sum(axis=0), rtol=1e-4, atol=1e-5)
+
+    def test_first_frame_initialization_differs(self):
+        predictor = self.model.get_stream_predictor()
+        predictor.reset()
+        for t in xrange(STEPS):
+            score = predictor.push(self.clip[t])
+        self.assertFalse(numpy.allclose(score, self.batch.sum(axis=0), rtol=1e-4, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -188,11 +188,11 @@ middle_layers.append(DenseLayer(param))
 param = {"id": "cost", "rng": rng, "theano_rng": theano_rng,
          "dim_in": (actions,), "dim_out": (1,),
          "minibatch_size": minibatch_size,
-         "cost_func": "CategoricalCrossEntropy",
+         "cost_func": "SoftmaxCrossEntropy",
          #"regularization": "l2",
          "param_layers": middle_layers,
          #"penalty_rate": 0.00001,
-         "input": middle_layers[5].output,
+         "input": middle_layers[5].linear_output,
          "mask": mask,
          "target": y}
 cost_layer = ElementwiseCostLayer(param)
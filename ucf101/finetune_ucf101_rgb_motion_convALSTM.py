@@ -87,8 +87,9 @@ rng = sparnn.utils.quick_npy_rng()
 theano_rng = sparnn.utils.quick_theano_rng(rng)
 
 ############################# load model
-model_file = load_path + "UCF101-VideoModel-RGB-Motion-convALSTM-RMS-initialization.pkl"
-model = VideoModel.load(model_file)
+# weights-only checkpoint written by model_assemble.py, the layers are rebuilt from its architecture spec
+model_file = load_path + "UCF101-VideoModel-RGB-Motion-convALSTM-RMS-initialization.npz"
+model = VideoModel.load_weights(model_file)
 model.print_stat()
 
 ############################# optimizer